@@ -0,0 +1,162 @@
+from typing import Dict, Any, List, Iterable
+from collections import deque
+import time
+from api.utils.logger import logger
+from ..utils.config import (
+    CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS, CIRCUIT_FAILURE_RATE,
+    CIRCUIT_SLOW_CALL_SECONDS, CIRCUIT_SLOW_CALL_RATE, CIRCUIT_OPEN_SECONDS
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Levantada quando o circuito do modelo está aberto"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um modelo, baseado na taxa de erro e de chamadas lentas
+    de uma janela com as últimas chamadas.
+
+    closed -> open quando a taxa de erro (ou de lentidão) passa do limite;
+    open -> half_open após CIRCUIT_OPEN_SECONDS, liberando uma chamada de teste;
+    half_open -> closed se o teste passar, ou de volta a open se falhar.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = CIRCUIT_WINDOW,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS,
+        slow_call_rate: float = CIRCUIT_SLOW_CALL_RATE,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        # Cada item é (sucesso, lenta)
+        self._outcomes: deque = deque(maxlen=window)
+
+    @property
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+
+    @property
+    def slow_call_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, slow in self._outcomes if slow) / len(self._outcomes)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == CLOSED:
+            self._outcomes.clear()
+
+    def allow_request(self) -> bool:
+        """Indica se uma chamada pode ser feita agora (reserva o teste em half_open)"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def is_available(self) -> bool:
+        """Como allow_request, mas sem reservar a chamada de teste"""
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        if self.state == HALF_OPEN:
+            return not self._probe_in_flight
+        return True
+
+    def record_success(self, latency: float) -> None:
+        self._outcomes.append((True, latency >= self.slow_call_seconds))
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            self._transition(CLOSED)
+            return
+        self._evaluate()
+
+    def record_failure(self) -> None:
+        self._outcomes.append((False, False))
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            self._transition(OPEN)
+            return
+        self._evaluate()
+
+    def release(self) -> None:
+        """Libera a chamada de teste sem resultado (ex.: chamada cancelada)"""
+        self._probe_in_flight = False
+
+    def _evaluate(self) -> None:
+        if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        if (self.failure_rate >= self.failure_rate_threshold
+                or self.slow_call_rate >= self.slow_call_rate_threshold):
+            self._transition(OPEN)
+
+    def health_score(self) -> float:
+        """Score entre 0 e 1 usado para ordenar os fallbacks"""
+        if not self.is_available():
+            return 0.0
+        score = 1.0 - self.failure_rate - 0.5 * self.slow_call_rate
+        if self.state == HALF_OPEN:
+            score *= 0.5
+        return max(score, 0.01)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate, 3),
+            "slow_call_rate": round(self.slow_call_rate, 3),
+            "calls_in_window": len(self._outcomes),
+            "health_score": round(self.health_score(), 3)
+        }
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers por modelo, compartilhados por todas as instâncias do router"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = CircuitBreaker(model)
+        return breaker
+
+    def order_by_health(self, models: Iterable[str]) -> List[str]:
+        """Ordena os modelos pela saúde atual, mantendo a ordem original nos empates"""
+        models = list(models)
+        return sorted(models, key=lambda m: -self.get(m).health_score())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
+
+
+# Instância global do registro de circuit breakers
+circuit_breakers = CircuitBreakerRegistry()
@@ -1,7 +1,8 @@
 import google.generativeai as genai
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Set
 from api.utils.logger import logger
+from .keyword_matcher import KeywordMatcher
 import re
 import logging
 import json
@@ -171,6 +172,26 @@ TASK_KEYWORDS = {
     ]
 }
 
+# Indicadores de alta complexidade
+HIGH_COMPLEXITY_INDICATORS = [
+    "analise", "implicações", "impacto",
+    "discuta", "considere", "avalie",
+    "próximos anos", "futuro", "longo prazo",
+    "aspectos técnicos", "aspectos práticos"
+]
+
+# Todas as listas de palavras-chave compiladas em um único matcher
+_KEYWORD_MATCHER = KeywordMatcher({
+    **{f"complexity:{level}": keywords for level, keywords in COMPLEXITY_KEYWORDS.items()},
+    **{f"task:{task_type}": keywords for task_type, keywords in TASK_KEYWORDS.items()},
+    "high_complexity": HIGH_COMPLEXITY_INDICATORS
+})
+
+# Padrões de perguntas simples
+SIMPLE_QUESTION_PATTERN = re.compile(
+    r"^(?:qual|onde|quem|quando|como|o que|por que)[^?]*\?"
+)
+
 # Configurações dos modelos
 MODEL_CAPABILITIES_CONFIG = {
     "deepseek": {
@@ -219,20 +240,13 @@ MODEL_CAPABILITIES_CONFIG = {
     }
 }
 
-def analyze_complexity(text: str) -> str:
+def analyze_complexity(text: str, matches: Dict[str, Set[str]] = None) -> str:
     """Analisa a complexidade do texto baseado em palavras-chave e padrões"""
+    matches = matches or _KEYWORD_MATCHER.scan(text)
     text = text.lower()
     
-    # Indicadores de alta complexidade
-    high_complexity_indicators = [
-        "analise", "implicações", "impacto",
-        "discuta", "considere", "avalie",
-        "próximos anos", "futuro", "longo prazo",
-        "aspectos técnicos", "aspectos práticos"
-    ]
-    
     # Conta indicadores de alta complexidade
-    high_complexity_count = sum(1 for indicator in high_complexity_indicators if indicator in text)
+    high_complexity_count = len(matches["high_complexity"])
     
     # Analisa comprimento e estrutura da pergunta
     words = text.split()
@@ -245,13 +259,13 @@ def analyze_complexity(text: str) -> str:
     else:
         return "low"
 
-def identify_task_type(text: str) -> List[str]:
+def identify_task_type(text: str, matches: Dict[str, Set[str]] = None) -> List[str]:
     """Identifica os tipos de tarefa no texto com pesos"""
-    text = text.lower()
+    matches = matches or _KEYWORD_MATCHER.scan(text)
     task_scores = {}
     
-    for task_type, keywords in TASK_KEYWORDS.items():
-        score = sum(3 if keyword in text else 0 for keyword in keywords)
+    for task_type in TASK_KEYWORDS:
+        score = 3 * len(matches[f"task:{task_type}"])
         # Bonus para palavras-chave complexas
         if task_type in ["complex", "analysis"]:
             score *= 1.5
@@ -260,10 +274,11 @@ def identify_task_type(text: str) -> List[str]:
     # Retorna os tipos de tarefa com scores não-zero, ordenados por score
     return [task for task, score in sorted(task_scores.items(), key=lambda x: x[1], reverse=True) if score > 0]
 
-def calculate_indicator_weights(text: str, indicators: Dict[str, bool]) -> Dict[str, float]:
+def calculate_indicator_weights(text: str, indicators: Dict[str, bool], matches: Dict[str, Set[str]] = None) -> Dict[str, float]:
     """
     Calcula pesos específicos para cada indicador baseado no texto e contexto
     """
+    matches = matches or _KEYWORD_MATCHER.scan(text)
     weights = {
         "technical": 0.0,
         "complex": 0.0,
@@ -272,20 +287,16 @@ def calculate_indicator_weights(text: str, indicators: Dict[str, bool]) -> Dict[
     }
     
     # Análise de palavras técnicas
-    technical_count = sum(1 for keyword in TASK_KEYWORDS["technical"] if keyword.lower() in text.lower())
-    weights["technical"] = min(technical_count * 0.2, 1.0)
+    weights["technical"] = min(len(matches["task:technical"]) * 0.2, 1.0)
     
     # Análise de complexidade e filosofia
-    complex_count = sum(1 for keyword in TASK_KEYWORDS["complex"] if keyword.lower() in text.lower())
-    weights["complex"] = min(complex_count * 0.25, 1.0)  # Aumentado peso para complexidade
+    weights["complex"] = min(len(matches["task:complex"]) * 0.25, 1.0)  # Aumentado peso para complexidade
     
     # Análise de criatividade
-    creative_count = sum(1 for keyword in TASK_KEYWORDS["creative"] if keyword.lower() in text.lower())
-    weights["creative"] = min(creative_count * 0.2, 1.0)
+    weights["creative"] = min(len(matches["task:creative"]) * 0.2, 1.0)
     
     # Análise prática
-    practical_count = sum(1 for keyword in TASK_KEYWORDS["factual"] if keyword.lower() in text.lower())
-    weights["practical"] = min(practical_count * 0.15, 1.0)  # Reduzido peso para prático
+    weights["practical"] = min(len(matches["task:factual"]) * 0.15, 1.0)  # Reduzido peso para prático
     
     return weights
 
@@ -301,44 +312,23 @@ def analyze_indicators(prompt: str) -> Dict[str, Any]:
         "simple": 0.0
     }
     
-    # Análise inicial - pergunta simples
-    simple_patterns = [
-        r"^qual[^?]*\?",  # Perguntas começando com "qual"
-        r"^onde[^?]*\?",  # Perguntas começando com "onde"
-        r"^quem[^?]*\?",  # Perguntas começando com "quem"
-        r"^quando[^?]*\?",  # Perguntas começando com "quando"
-        r"^como[^?]*\?",  # Perguntas começando com "como"
-        r"^o que[^?]*\?",  # Perguntas começando com "o que"
-        r"^por que[^?]*\?"  # Perguntas começando com "por que"
-    ]
+    # Uma única varredura encontra as palavras-chave de todas as listas
+    matches = _KEYWORD_MATCHER.scan(prompt)
     
-    # Se a pergunta corresponde a um padrão simples
-    if any(re.match(pattern, prompt.lower()) for pattern in simple_patterns):
+    # Análise inicial - pergunta simples
+    if SIMPLE_QUESTION_PATTERN.match(prompt.lower()):
         scores["simple"] += 0.6  # Aumenta significativamente o score de simplicidade
     
     # Análise baseada em palavras-chave
-    for level, keywords in COMPLEXITY_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword.lower() in prompt.lower():
-                if level == "high":
-                    scores["complex"] += 0.5
-                elif level == "medium":
-                    scores["technical"] += 0.3
-                else:
-                    scores["simple"] += 0.3  # Aumentado de 0.2 para 0.3
+    scores["complex"] += 0.5 * len(matches["complexity:high"])
+    scores["technical"] += 0.3 * len(matches["complexity:medium"])
+    scores["simple"] += 0.3 * len(matches["complexity:low"])  # Aumentado de 0.2 para 0.3
     
     # Análise de tipos de tarefa
-    for task_type, keywords in TASK_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword.lower() in prompt.lower():
-                if task_type == "technical":
-                    scores["technical"] += 0.4
-                elif task_type == "analysis":
-                    scores["analytical"] += 0.3
-                elif task_type == "complex":
-                    scores["complex"] += 0.4
-                elif task_type == "factual":
-                    scores["simple"] += 0.3  # Adicionado para aumentar score de simplicidade
+    scores["technical"] += 0.4 * len(matches["task:technical"])
+    scores["analytical"] += 0.3 * len(matches["task:analysis"])
+    scores["complex"] += 0.4 * len(matches["task:complex"])
+    scores["simple"] += 0.3 * len(matches["task:factual"])  # Adicionado para aumentar score de simplicidade
     
     # Análise de comprimento e estrutura
     words = prompt.split()
@@ -3,6 +3,7 @@ from typing import Dict, Any, Optional
 import httpx
 import json
 from api.utils.logger import logger
+from api.utils.http_client import http_clients
 
 # Configurações do Claude
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
@@ -40,38 +41,38 @@ async def call_claude(prompt: str, system_prompt: Optional[str] = None) -> Dict[
         if system_prompt:
             data["system"] = system_prompt
             
-        # Realiza a chamada para a API
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                CLAUDE_URL,
-                headers=headers,
-                json=data
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Erro na API do Claude: {response.status_code}")
-                logger.error(f"Resposta: {response.text}")
-                raise ValueError(f"Erro na API do Claude: {response.status_code} - {response.text}")
-                
-            response_data = response.json()
+        # Realiza a chamada para a API usando o pool de conexões compartilhado
+        client = http_clients.get("anthropic")
+        response = await client.post(
+            CLAUDE_URL,
+            headers=headers,
+            json=data
+        )
+        
+        if response.status_code != 200:
+            logger.error(f"Erro na API do Claude: {response.status_code}")
+            logger.error(f"Resposta: {response.text}")
+            raise ValueError(f"Erro na API do Claude: {response.status_code} - {response.text}")
             
-            # Extrai o texto da resposta
-            content = response_data.get("content", [])
-            text = ""
-            for item in content:
-                if item.get("type") == "text":
-                    text += item.get("text", "")
+        response_data = response.json()
+        
+        # Extrai o texto da resposta
+        content = response_data.get("content", [])
+        text = ""
+        for item in content:
+            if item.get("type") == "text":
+                text += item.get("text", "")
+        
+        if not text:
+            raise ValueError("Resposta vazia do Claude")
             
-            if not text:
-                raise ValueError("Resposta vazia do Claude")
-                
-            return {
-                "text": text,
-                "model": "claude",
-                "success": True,
-                "confidence": 1.0,
-                "usage": response_data.get("usage", {})
-            }
+        return {
+            "text": text,
+            "model": "claude",
+            "success": True,
+            "confidence": 1.0,
+            "usage": response_data.get("usage", {})
+        }
             
     except Exception as e:
         error_msg = f"Erro ao chamar Claude: {str(e)}"
@@ -1,4 +1,5 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from functools import lru_cache
 import tiktoken
 from api.utils.logger import logger
 
@@ -36,17 +37,77 @@ def format_usd(value: float) -> str:
     """
     return f"${value:.6f}"
 
+@lru_cache(maxsize=None)
+def get_encoding(name: str = "cl100k_base") -> tiktoken.Encoding:
+    """
+    Retorna o tokenizador, carregado uma única vez por processo
+    """
+    return tiktoken.get_encoding(name)
+
 def count_tokens(text: str) -> int:
     """
     Conta tokens usando o tokenizador do GPT (aproximação para outros modelos)
     """
     try:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(text))
+        return len(get_encoding().encode(text, disallowed_special=()))
     except Exception as e:
         logger.error(f"Erro ao contar tokens: {str(e)}")
         return len(text.split()) * 2  # Estimativa aproximada se falhar
 
+def encode_batch(texts: List[str], num_threads: int = 8) -> List[List[int]]:
+    """
+    Tokeniza vários textos de uma vez (em paralelo pelo tiktoken); para um ou
+    dois textos, encode direto é mais barato que montar o pool de threads
+    """
+    if not texts:
+        return []
+    return get_encoding().encode_batch(texts, num_threads=num_threads, disallowed_special=())
+
+def get_reported_usage(response: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """
+    Extrai o uso de tokens informado pelo provedor, se houver.
+    Aceita o formato "tokens" (DeepSeek, Mistral) e o "usage" da OpenAI/Anthropic.
+    """
+    tokens = response.get("tokens")
+    if tokens and tokens.get("prompt") is not None and tokens.get("completion") is not None:
+        return {
+            "prompt": tokens["prompt"],
+            "completion": tokens["completion"],
+            "total": tokens.get("total") or tokens["prompt"] + tokens["completion"]
+        }
+
+    usage = response.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+    if prompt_tokens is None or completion_tokens is None:
+        return None
+    return {
+        "prompt": prompt_tokens,
+        "completion": completion_tokens,
+        "total": usage.get("total_tokens") or prompt_tokens + completion_tokens
+    }
+
+def estimate_call_cost(model: str, prompt: str, max_output_tokens: int = 1000) -> float:
+    """
+    Estima o custo máximo (USD) de uma chamada usando MODEL_PRICING
+    """
+    pricing = MODEL_PRICING.get(model)
+    if not pricing:
+        return 0.0
+    input_cost = (count_tokens(prompt) / 1000) * pricing["input_price_per_1k"]
+    output_cost = (max_output_tokens / 1000) * pricing["output_price_per_1k"]
+    return input_cost + output_cost
+
+def analyze_result_cost(prompt: str, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Custo de uma resposta do router, com o uso informado pelo provedor
+    (result["tokens"]) quando houver. Respostas do cache ou com falha não
+    geram chamada paga e retornam None.
+    """
+    if result.get("from_cache") or not result.get("success", True):
+        return None
+    return analyze_cost(result["model"], prompt, result.get("text", ""), usage=result.get("tokens"))
+
 def get_model_info(model: str) -> dict:
     """
     Retorna informações de preço e documentação para cada modelo
@@ -80,15 +141,27 @@ def get_model_info(model: str) -> dict:
     
     return models.get(model, models["gpt"])
 
-def analyze_cost(model: str, prompt: str, response: str) -> Dict[str, Any]:
-    """Analisa o custo da chamada ao modelo."""
+def analyze_cost(
+    model: str,
+    prompt: str,
+    response: str,
+    usage: Optional[Dict[str, int]] = None
+) -> Dict[str, Any]:
+    """
+    Analisa o custo da chamada ao modelo.
+    Se o provedor informou o uso de tokens (usage), ele é usado no lugar da contagem local.
+    """
     try:
         # Taxa de câmbio USD para BRL (atualizar conforme necessário)
         USD_TO_BRL = 5.0
 
         # Calcula tokens
-        prompt_tokens = count_tokens(prompt)
-        completion_tokens = count_tokens(response)
+        if usage and usage.get("prompt") is not None and usage.get("completion") is not None:
+            prompt_tokens = usage["prompt"]
+            completion_tokens = usage["completion"]
+        else:
+            prompt_tokens = count_tokens(prompt)
+            completion_tokens = count_tokens(response)
         total_tokens = prompt_tokens + completion_tokens
 
         # Obtém informações do modelo
@@ -1,5 +1,5 @@
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
@@ -49,4 +49,25 @@ async def call_deepseek(prompt: str, system_prompt: Optional[str] = None) -> Dic
             "text": error_msg,
             "model": "deepseek",
             "success": False
-        }
\ No newline at end of file
+        }
+
+async def stream_deepseek(prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Stream Deepseek completion chunks. Raises on error, unlike call_deepseek.
+    """
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+    
+    stream = await client.chat.completions.create(
+        model="deepseek-chat",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=2000,
+        stream=True
+    )
+    
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
\ No newline at end of file
@@ -1,7 +1,8 @@
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 import google.generativeai as genai
 from api.utils.logger import logger
+from api.utils.executor import run_blocking, iterate_in_thread
 
 # Configure Gemini
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -42,8 +43,11 @@ async def call_gemini(prompt: str, system_prompt: Optional[str] = None) -> Dict[
             
             # Criar o chat e gerar resposta
             chat = model.start_chat(history=[])
-            response = chat.send_message(
+            # send_message é bloqueante, então roda no pool de threads dos LLMs
+            response = await run_blocking(
+                chat.send_message,
                 full_prompt,
+                pool="llm",
                 generation_config={
                     "temperature": 0.7,
                     "top_p": 0.8,
@@ -85,4 +89,33 @@ async def call_gemini(prompt: str, system_prompt: Optional[str] = None) -> Dict[
             "model": "gemini",
             "success": False,
             "confidence": 0.0
-        }
\ No newline at end of file
+        }
+
+async def stream_gemini(prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Stream Gemini response chunks. Raises on error, unlike call_gemini.
+    """
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY não configurada")
+
+    full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+
+    def generate():
+        # O iterador do SDK é bloqueante, então é consumido em uma thread do pool
+        model = genai.GenerativeModel(GEMINI_MODEL)
+        chat = model.start_chat(history=[])
+        response = chat.send_message(
+            full_prompt,
+            stream=True,
+            generation_config={
+                "temperature": 0.7,
+                "top_p": 0.8,
+                "top_k": 40
+            }
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    async for text in iterate_in_thread(generate, pool="llm"):
+        yield text
\ No newline at end of file
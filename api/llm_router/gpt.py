@@ -1,8 +1,9 @@
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 import httpx
 import json
 from api.utils.logger import logger
+from api.utils.http_client import http_clients
 
 # Configurações do GPT
 GPT_API_KEY = os.getenv("GPT_API_KEY")
@@ -44,38 +45,38 @@ async def call_gpt(prompt: str, system_prompt: Optional[str] = None) -> Dict[str
             "temperature": 0.7
         }
             
-        # Realiza a chamada para a API
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                GPT_URL,
-                headers=headers,
-                json=data
-            )
+        # Realiza a chamada para a API usando o pool de conexões compartilhado
+        client = http_clients.get("openai")
+        response = await client.post(
+            GPT_URL,
+            headers=headers,
+            json=data
+        )
+        
+        if response.status_code != 200:
+            logger.error(f"Erro na API do GPT: {response.status_code}")
+            logger.error(f"Resposta: {response.text}")
+            raise ValueError(f"Erro na API do GPT: {response.status_code} - {response.text}")
             
-            if response.status_code != 200:
-                logger.error(f"Erro na API do GPT: {response.status_code}")
-                logger.error(f"Resposta: {response.text}")
-                raise ValueError(f"Erro na API do GPT: {response.status_code} - {response.text}")
-                
-            response_data = response.json()
+        response_data = response.json()
+        
+        # Extrai o texto da resposta
+        choices = response_data.get("choices", [])
+        if not choices:
+            raise ValueError("Resposta vazia do GPT")
             
-            # Extrai o texto da resposta
-            choices = response_data.get("choices", [])
-            if not choices:
-                raise ValueError("Resposta vazia do GPT")
-                
-            text = choices[0].get("message", {}).get("content", "")
+        text = choices[0].get("message", {}).get("content", "")
+        
+        if not text:
+            raise ValueError("Texto vazio na resposta do GPT")
             
-            if not text:
-                raise ValueError("Texto vazio na resposta do GPT")
-                
-            return {
-                "text": text,
-                "model": "gpt",
-                "success": True,
-                "confidence": 1.0,
-                "usage": response_data.get("usage", {})
-            }
+        return {
+            "text": text,
+            "model": "gpt",
+            "success": True,
+            "confidence": 1.0,
+            "usage": response_data.get("usage", {})
+        }
             
     except Exception as e:
         error_msg = f"Erro ao chamar GPT: {str(e)}"
@@ -85,4 +86,48 @@ async def call_gpt(prompt: str, system_prompt: Optional[str] = None) -> Dict[str
             "model": "gpt",
             "success": False,
             "confidence": 0.0
-        }
\ No newline at end of file
+        }
+
+async def stream_gpt(prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Chama o GPT em modo streaming (SSE), gerando os trechos de texto conforme chegam.
+    Diferente de call_gpt, levanta exceção em caso de erro.
+    """
+    if not GPT_API_KEY:
+        raise ValueError("GPT_API_KEY não configurada")
+        
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {GPT_API_KEY}"
+    }
+    
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+    
+    data = {
+        "model": GPT_MODEL,
+        "messages": messages,
+        "max_tokens": 1000,
+        "temperature": 0.7,
+        "stream": True
+    }
+    
+    client = http_clients.get("openai")
+    async with client.stream("POST", GPT_URL, headers=headers, json=data) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            raise ValueError(f"Erro na API do GPT: {response.status_code} - {body.decode(errors='replace')}")
+        
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            choices = json.loads(payload).get("choices", [])
+            if choices:
+                text = choices[0].get("delta", {}).get("content")
+                if text:
+                    yield text
\ No newline at end of file
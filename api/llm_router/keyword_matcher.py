@@ -0,0 +1,64 @@
+from typing import Dict, Iterable, List, Set
+import re
+
+
+def _build_trie_pattern(keywords: Iterable[str]) -> str:
+    """Monta uma regex em forma de trie: prefixos comuns são testados uma única vez"""
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Uma palavra-chave termina aqui: o restante do caminho é opcional
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Busca várias listas de palavras-chave em uma única passada pelo texto.
+
+    Todas as listas são compiladas em uma só regex (trie) com lookahead, que
+    encontra em cada posição a palavra-chave mais longa; as palavras-chave que
+    são prefixo dela são acrescentadas por um mapa pré-calculado. O resultado
+    equivale a testar `keyword in text.lower()` para cada palavra de cada lista.
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self.groups = {name: [kw.lower() for kw in keywords] for name, keywords in groups.items()}
+
+        self._groups_by_keyword: Dict[str, List[str]] = {}
+        for name, keywords in self.groups.items():
+            for keyword in keywords:
+                owners = self._groups_by_keyword.setdefault(keyword, [])
+                if name not in owners:
+                    owners.append(name)
+
+        all_keywords = list(self._groups_by_keyword)
+        self._prefixes: Dict[str, List[str]] = {
+            keyword: [other for other in all_keywords if keyword.startswith(other)]
+            for keyword in all_keywords
+        }
+        self._pattern = re.compile("(?=(" + _build_trie_pattern(all_keywords) + "))")
+
+    def scan(self, text: str) -> Dict[str, Set[str]]:
+        """Retorna, para cada grupo, o conjunto de palavras-chave presentes no texto"""
+        found: Set[str] = set()
+        for match in self._pattern.finditer(text.lower()):
+            keyword = match.group(1)
+            if keyword not in found:
+                found.update(self._prefixes[keyword])
+
+        result: Dict[str, Set[str]] = {name: set() for name in self.groups}
+        for keyword in found:
+            for name in self._groups_by_keyword[keyword]:
+                result[name].add(keyword)
+        return result
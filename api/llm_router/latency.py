@@ -0,0 +1,40 @@
+from typing import Dict, Any, Optional
+from collections import deque
+import math
+
+
+class LatencyTracker:
+    """Mantém uma janela das latências recentes de cada modelo"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, model: str, percentile: float = 0.95, min_samples: int = 10) -> Optional[float]:
+        """Retorna o percentil da latência ou None se não houver amostras suficientes"""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(percentile * len(ordered)) - 1))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": self.percentile(model, 0.5, min_samples=1),
+                "p95": self.percentile(model, 0.95, min_samples=1)
+            }
+            for model, samples in self._samples.items()
+        }
+
+
+# Instância global compartilhada por todos os routers
+latency_tracker = LatencyTracker()
@@ -1,145 +1,348 @@
-from typing import Dict, Any, List
-import json
-from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import heapq
+import itertools
+import os
+import random
+import socket
+import time
+import uuid
 from loguru import logger
-from ..utils.database import SupabaseManager
+from ..utils.supabase import supabase
+from ..utils.executor import execute_query
+from ..utils.config import (
+    QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS, QUEUE_RETRY_BACKOFF, QUEUE_RETRY_BACKOFF_MAX
+)
 
+# Estados de um job: pending -> processing -> completed | pending (retry) | dead
+JOB_STATUSES = ("pending", "processing", "completed", "dead")
 
-class MessageQueue:
-    def __init__(self):
-        self.db = SupabaseManager()
-        logger.info("📬 Message Queue inicializada com Supabase")
 
-    async def add_message(
-        self, sender: str, prompt: str, response: Dict[str, Any]
-    ) -> None:
-        """
-        Adiciona uma mensagem à fila do sender no Supabase
-        """
-        try:
-            query = """
-            INSERT INTO message_queue (sender, prompt, response, status, created_at)
-            VALUES (:sender, :prompt, :response, 'pending', NOW())
-            """
-
-            await self.db.execute(
-                query,
-                {
-                    "sender": sender,
-                    "prompt": prompt,
-                    "response": json.dumps(response),
-                },
-            )
+def _utc_after(seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
 
-            logger.info(f"📨 Mensagem adicionada à fila para sender: {sender}")
 
-        except Exception as e:
-            logger.error(f"❌ Erro ao adicionar mensagem à fila: {str(e)}")
+class HeapQueueBackend:
+    """
+    Fila em memória do processo, para desenvolvimento e instâncias únicas.
 
-    async def get_messages(self, sender: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """
-        Retorna as últimas mensagens do sender do Supabase
-        """
-        try:
-            query = """
-            SELECT prompt, response, created_at, status
-            FROM message_queue
-            WHERE sender = :sender
-            ORDER BY created_at DESC
-            LIMIT :limit
-            """
+    Jobs prontos ficam num heap por (prioridade desc, ordem de chegada) e os
+    agendados para depois (retries) num heap por horário de liberação.
+    """
 
-            result = await self.db.fetch_all(query, {"sender": sender, "limit": limit})
+    def __init__(self, dead_letter_size: int = 1000):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._ready: List[Tuple[int, int, str]] = []
+        self._delayed: List[Tuple[float, int, str]] = []
+        self._leases: Dict[str, float] = {}
+        self._seq = itertools.count(1)
+        self.dead_letter_size = dead_letter_size
+        self.dead_letter: Dict[str, Dict[str, Any]] = {}
+        self.completed = 0
 
-            if result:
-                logger.info(
-                    f"📋 Retornando {len(result)} mensagens para sender: {sender}"
-                )
-                return [dict(row) for row in result]
+    def _push(self, job: Dict[str, Any], available_at: float) -> None:
+        job["status"] = "pending"
+        job["lease_owner"] = None
+        if available_at > time.time():
+            heapq.heappush(self._delayed, (available_at, next(self._seq), job["id"]))
+        else:
+            heapq.heappush(self._ready, (-job["priority"], next(self._seq), job["id"]))
 
-            logger.info(f"ℹ️ Nenhuma mensagem encontrada para sender: {sender}")
-            return []
+    def _leased(self, job_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != "processing" or job["lease_owner"] != owner:
+            return None
+        return job
 
-        except Exception as e:
-            logger.error(f"❌ Erro ao buscar mensagens: {str(e)}")
-            return []
+    async def enqueue(
+        self, sender: str, payload: Dict[str, Any], priority: int, max_attempts: int, delay: float = 0.0
+    ) -> str:
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "id": job_id,
+            "sender": sender,
+            "payload": payload,
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "last_error": None
+        }
+        self._push(self._jobs[job_id], time.time() + delay)
+        return job_id
 
-    async def mark_processed(self, message_id: int) -> None:
-        """
-        Marca uma mensagem como processada
-        """
-        try:
-            query = """
-            UPDATE message_queue
-            SET status = 'processed',
-                processed_at = NOW()
-            WHERE id = :message_id
-            """
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        now = time.time()
+        # Leases vencidas: o worker morreu ou travou, o job volta para a fila
+        for job_id, lease_until in list(self._leases.items()):
+            if lease_until <= now:
+                del self._leases[job_id]
+                self._push(self._jobs[job_id], now)
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, job_id = heapq.heappop(self._delayed)
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] == "pending":
+                heapq.heappush(self._ready, (-job["priority"], next(self._seq), job_id))
 
-            await self.db.execute(query, {"message_id": message_id})
-            logger.info(f"✅ Mensagem {message_id} marcada como processada")
+        claimed = []
+        while self._ready and len(claimed) < limit:
+            _, _, job_id = heapq.heappop(self._ready)
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "pending":
+                continue
+            job.update(status="processing", lease_owner=owner, attempts=job["attempts"] + 1)
+            self._leases[job_id] = now + lease_seconds
+            claimed.append(dict(job))
+        return claimed
 
-        except Exception as e:
-            logger.error(f"❌ Erro ao marcar mensagem como processada: {str(e)}")
+    async def extend_lease(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        if self._leased(job_id, owner) is None:
+            return False
+        self._leases[job_id] = time.time() + lease_seconds
+        return True
 
-    async def get_pending_messages(self, limit: int = 100) -> List[Dict[str, Any]]:
-        """
-        Retorna mensagens pendentes ordenadas por prioridade
-        """
-        try:
-            query = """
-            SELECT id, sender, prompt, response, priority
-            FROM message_queue
-            WHERE status = 'pending'
-            ORDER BY priority DESC, created_at ASC
-            LIMIT :limit
-            """
+    async def complete(self, job_id: str, owner: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        if self._leased(job_id, owner) is None:
+            return False
+        # Jobs concluídos saem da memória; só o contador fica
+        del self._jobs[job_id]
+        self._leases.pop(job_id, None)
+        self.completed += 1
+        return True
 
-            result = await self.db.fetch_all(query, {"limit": limit})
+    async def retry(self, job_id: str, owner: str, error: str, delay: float) -> bool:
+        job = self._leased(job_id, owner)
+        if job is None:
+            return False
+        self._leases.pop(job_id, None)
+        job["last_error"] = error
+        self._push(job, time.time() + delay)
+        return True
 
-            if result:
-                logger.info(f"📥 Retornando {len(result)} mensagens pendentes")
-                return [dict(row) for row in result]
+    async def dead(self, job_id: str, owner: str, error: str) -> bool:
+        job = self._leased(job_id, owner)
+        if job is None:
+            return False
+        self._leases.pop(job_id, None)
+        del self._jobs[job_id]
+        job.update(status="dead", lease_owner=None, last_error=error)
+        self.dead_letter[job_id] = job
+        while len(self.dead_letter) > self.dead_letter_size:
+            self.dead_letter.pop(next(iter(self.dead_letter)))
+        return True
 
-            return []
+    async def stats(self) -> Dict[str, int]:
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in self._jobs.values():
+            counts[job["status"]] += 1
+        counts["completed"] = self.completed
+        counts["dead"] = len(self.dead_letter)
+        return counts
 
-        except Exception as e:
-            logger.error(f"❌ Erro ao buscar mensagens pendentes: {str(e)}")
-            return []
+
+class SQLQueueBackend:
+    """
+    Fila na tabela message_queue do Supabase (ver migrations/message_queue.sql).
+
+    O claim é feito pela função claim_queue_messages, que reserva as linhas com
+    FOR UPDATE SKIP LOCKED; as demais operações só valem enquanto a lease do
+    worker (lease_owner) ainda for a dele.
+    """
+
+    table_name = "message_queue"
+
+    @staticmethod
+    def _to_job(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": str(row["id"]),
+            "sender": row["sender"],
+            "payload": (row.get("message_queue") or {}).get("payload", {}),
+            "priority": row.get("priority", 0),
+            "attempts": row.get("attempts", 0),
+            "max_attempts": row.get("max_attempts", QUEUE_MAX_ATTEMPTS),
+            "lease_owner": row.get("lease_owner"),
+            "last_error": row.get("last_error")
+        }
+
+    async def _update_leased(self, job_id: str, owner: str, values: Dict[str, Any]) -> bool:
+        result = await execute_query(
+            supabase.table(self.table_name)
+            .update(values)
+            .eq("id", job_id)
+            .eq("lease_owner", owner)
+            .eq("status", "processing")
+        )
+        return bool(result.data)
+
+    async def enqueue(
+        self, sender: str, payload: Dict[str, Any], priority: int, max_attempts: int, delay: float = 0.0
+    ) -> str:
+        result = await execute_query(
+            supabase.table(self.table_name).insert({
+                "sender": sender,
+                "status": "pending",
+                "message_queue": {"payload": payload},
+                "priority": priority,
+                "attempts": 0,
+                "max_attempts": max_attempts,
+                "available_at": _utc_after(delay)
+            })
+        )
+        return str(result.data[0]["id"])
+
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        result = await execute_query(
+            supabase.rpc("claim_queue_messages", {
+                "p_owner": owner,
+                "p_limit": limit,
+                "p_lease_seconds": int(lease_seconds)
+            })
+        )
+        jobs = [self._to_job(row) for row in result.data or []]
+        # O UPDATE ... RETURNING não garante ordem
+        jobs.sort(key=lambda job: -job["priority"])
+        return jobs
+
+    async def extend_lease(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        return await self._update_leased(job_id, owner, {"lease_until": _utc_after(lease_seconds)})
+
+    async def complete(self, job_id: str, owner: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        return await self._update_leased(job_id, owner, {
+            "status": "completed",
+            "lease_owner": None,
+            "lease_until": None,
+            "processed_at": datetime.now(timezone.utc).isoformat()
+        })
+
+    async def retry(self, job_id: str, owner: str, error: str, delay: float) -> bool:
+        return await self._update_leased(job_id, owner, {
+            "status": "pending",
+            "lease_owner": None,
+            "lease_until": None,
+            "available_at": _utc_after(delay),
+            "last_error": error
+        })
+
+    async def dead(self, job_id: str, owner: str, error: str) -> bool:
+        return await self._update_leased(job_id, owner, {
+            "status": "dead",
+            "lease_owner": None,
+            "lease_until": None,
+            "processed_at": datetime.now(timezone.utc).isoformat(),
+            "last_error": error
+        })
+
+    async def stats(self) -> Dict[str, int]:
+        counts = {}
+        for status in JOB_STATUSES:
+            result = await execute_query(
+                supabase.table(self.table_name)
+                .select("id", count="exact")
+                .eq("status", status)
+                .limit(1)
+            )
+            counts[status] = result.count or 0
+        return counts
+
+
+class MessageQueue:
+    """
+    Fila de jobs com claim atômico, lease, retries com backoff e dead-letter.
+
+    claim() reserva até N jobs por chamada, na ordem de prioridade. Cada job
+    reservado fica com uma lease: se o worker não concluir nem renovar a lease
+    a tempo, o job volta a ficar visível para outro worker. Falhas voltam para
+    a fila com backoff exponencial até max_attempts; depois o job vai para o
+    estado "dead".
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        lease_seconds: float = QUEUE_LEASE_SECONDS,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+        backoff_base: float = QUEUE_RETRY_BACKOFF,
+        backoff_max: float = QUEUE_RETRY_BACKOFF_MAX
+    ):
+        self.backend = backend if backend is not None else SQLQueueBackend()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.retried = 0
+        self.dead_lettered = 0
+        logger.info(f"📬 Message Queue inicializada ({type(self.backend).__name__})")
+
+    def retry_delay(self, attempts: int) -> float:
+        """Backoff exponencial com jitter para a próxima tentativa"""
+        delay = min(self.backoff_base * (2 ** max(attempts - 1, 0)), self.backoff_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def enqueue(
+        self,
+        sender: str,
+        payload: Dict[str, Any],
+        priority: int = 0,
+        max_attempts: Optional[int] = None,
+        delay: float = 0.0
+    ) -> str:
+        job_id = await self.backend.enqueue(
+            sender, payload, priority, max_attempts or self.max_attempts, delay
+        )
+        logger.info(f"📨 Job {job_id} enfileirado para sender: {sender} (prioridade {priority})")
+        return job_id
+
+    async def claim(self, limit: int) -> List[Dict[str, Any]]:
+        """Reserva até limit jobs; cada lote recebe um dono próprio para a lease"""
+        owner = f"{self.worker_id}-{uuid.uuid4().hex[:8]}"
+        jobs = await self.backend.claim(owner, limit, self.lease_seconds)
+        claimed = []
+        for job in jobs:
+            job["lease_owner"] = owner
+            # Job que já estourou as tentativas (ex.: leases vencidas seguidas) não roda de novo
+            if job["attempts"] > job["max_attempts"]:
+                await self.backend.dead(job["id"], owner, job.get("last_error") or "lease_expired")
+                self.dead_lettered += 1
+                logger.error(f"☠️ Job {job['id']} movido para dead-letter após {job['attempts'] - 1} tentativas")
+                continue
+            claimed.append(job)
+        return claimed
+
+    async def extend_lease(self, job: Dict[str, Any]) -> bool:
+        return await self.backend.extend_lease(job["id"], job["lease_owner"], self.lease_seconds)
+
+    async def complete(self, job: Dict[str, Any], result: Optional[Dict[str, Any]] = None) -> bool:
+        done = await self.backend.complete(job["id"], job["lease_owner"], result)
+        if not done:
+            logger.warning(f"⚠️ Lease do job {job['id']} expirou antes da conclusão")
+        return done
+
+    async def fail(self, job: Dict[str, Any], error: str, retryable: bool = True) -> str:
+        """Devolve o job para a fila com backoff ou o move para dead-letter; retorna o novo estado"""
+        if retryable and job["attempts"] < job["max_attempts"]:
+            delay = self.retry_delay(job["attempts"])
+            await self.backend.retry(job["id"], job["lease_owner"], error, delay)
+            self.retried += 1
+            logger.warning(f"🔁 Job {job['id']} falhou (tentativa {job['attempts']}), nova tentativa em {delay:.1f}s")
+            return "pending"
+        await self.backend.dead(job["id"], job["lease_owner"], error)
+        self.dead_lettered += 1
+        logger.error(f"☠️ Job {job['id']} movido para dead-letter: {error}")
+        return "dead"
 
     async def get_stats(self) -> Dict[str, Any]:
         """
         Retorna estatísticas da fila
         """
         try:
-            query = """
-            SELECT 
-                COUNT(*) as total_messages,
-                COUNT(*) FILTER (WHERE status = 'pending') as pending_messages,
-                COUNT(*) FILTER (WHERE status = 'processed') as processed_messages,
-                COUNT(DISTINCT sender) as total_senders
-            FROM message_queue
-            """
-
-            result = await self.db.fetch_one(query)
-
-            if result:
-                stats = dict(result)
-                logger.info(f"📊 Estatísticas da fila: {stats}")
-                return stats
-
-            return {
-                "total_messages": 0,
-                "pending_messages": 0,
-                "processed_messages": 0,
-                "total_senders": 0,
-            }
-
+            counts = await self.backend.stats()
         except Exception as e:
             logger.error(f"❌ Erro ao obter estatísticas: {str(e)}")
-            return {
-                "total_messages": 0,
-                "pending_messages": 0,
-                "processed_messages": 0,
-                "total_senders": 0,
-            }
+            counts = {}
+        return {
+            "jobs": counts,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "lease_seconds": self.lease_seconds,
+            "max_attempts": self.max_attempts
+        }
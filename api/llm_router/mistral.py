@@ -1,9 +1,10 @@
 import os
-from typing import Dict, Any, Optional
-from mistralai.client import MistralClient
+from typing import Dict, Any, Optional, AsyncIterator
+from mistralai.async_client import MistralAsyncClient
 from mistralai.models.chat_completion import ChatMessage
 
-client = MistralClient(api_key=os.getenv("MISTRAL_API_KEY"))
+# Cliente assíncrono nativo: não bloqueia o event loop
+client = MistralAsyncClient(api_key=os.getenv("MISTRAL_API_KEY"))
 
 async def call_mistral(prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
     """
@@ -15,7 +16,7 @@ async def call_mistral(prompt: str, system_prompt: Optional[str] = None) -> Dict
             messages.append(ChatMessage(role="system", content=system_prompt))
         messages.append(ChatMessage(role="user", content=prompt))
 
-        response = client.chat(
+        response = await client.chat(
             model="mistral-large-latest",
             messages=messages
         )
@@ -39,4 +40,20 @@ async def call_mistral(prompt: str, system_prompt: Optional[str] = None) -> Dict
             "text": error_msg,
             "model": "mistral",
             "success": False
-        }
\ No newline at end of file
+        }
+
+async def stream_mistral(prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Stream Mistral completion chunks. Raises on error, unlike call_mistral.
+    """
+    messages = []
+    if system_prompt:
+        messages.append(ChatMessage(role="system", content=system_prompt))
+    messages.append(ChatMessage(role="user", content=prompt))
+
+    async for chunk in client.chat_stream(
+        model="mistral-large-latest",
+        messages=messages
+    ):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
\ No newline at end of file
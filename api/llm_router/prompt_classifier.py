@@ -1,8 +1,116 @@
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 import re
 import json
 from api.utils.logger import logger
 from ..llm_router.gpt import GPT_API_KEY
+from ..utils.cache_manager import LocalCache
+from ..utils.config import CLASSIFICATION_MEMO_SIZE, CLASSIFICATION_MEMO_TTL
+from .keyword_matcher import KeywordMatcher
+
+# Termos que indicam um prompt complexo
+COMPLEX_TERMS = [
+    "explique", "detalhe", "análise", "compare", "contraste",
+    "discuta", "avalie", "critique", "sintetize", "filosófico",
+    "profund", "complex", "abrangente"
+]
+
+# Termos técnicos para diferentes áreas
+TECHNICAL_TERMS = [
+    # Programação/Tecnologia
+    "código", "programa", "função", "api", "algoritmo", "cloud", "aws", "azure",
+    "docker", "kubernetes", "linux", "servidor", "frontend", "backend", "devops",
+    "javascript", "python", "java", "c++", "sql", "banco de dados", "framework",
+
+    # Ciência
+    "física", "química", "biologia", "matemática", "equação", "fórmula",
+    "científic", "quantum", "átomo", "molecular", "genética", "célula",
+
+    # Medicina
+    "médic", "clínic", "doença", "patologia", "diagnóstico", "tratamento",
+    "anatomia", "fisiologia", "cirurgia", "farmacologia", "terapia",
+
+    # Finanças/Economia
+    "finanças", "economi", "contabilidade", "mercado", "ações", "investimento",
+    "bolsa", "taxa", "juros", "fiscal", "tributári", "imposto", "lucro", "custo",
+
+    # Engenharia
+    "engenhari", "estrutura", "mecânica", "elétrica", "civil", "construção",
+    "projeto", "design", "cad", "material", "resistência", "torque"
+]
+
+# Termos que indicam análise ou pensamento crítico
+ANALYTICAL_TERMS = [
+    "analis", "compar", "contrast", "avali", "critic", "pros e contras",
+    "vantagens", "desvantagens", "melhor", "pior", "recomend", "aconselharia",
+    "por que", "razão", "causa", "efeito", "impacto", "consequência",
+    "evidência", "argumento", "justific", "demonstr", "prov"
+]
+
+# Termos relacionados a áudio
+AUDIO_TERMS = [
+    "áudio", "ouvir", "escutar", "voz", "som", "narração", "narrar",
+    "canção", "música", "falar", "pronuncia", "sotaque", "falando",
+    "grave", "agudo", "timbre", "entonação", "dicção", "cantado",
+    "melodia", "speaker", "fone", "alto-falante", "rádio", "podcasts",
+    "audiobook", "livro falado", "dublagem", "tonalidade", "sonoro"
+]
+
+# Menções explícitas a áudio, que aumentam o score do GPT
+AUDIO_MENTION_TERMS = ["áudio", "ouvir", "escutar", "voz", "som"]
+
+# Todas as listas compiladas uma única vez, na importação do módulo
+_MATCHER = KeywordMatcher({
+    "complex": COMPLEX_TERMS,
+    "technical": TECHNICAL_TERMS,
+    "analytical": ANALYTICAL_TERMS,
+    "audio_related": AUDIO_TERMS,
+    "audio_mention": AUDIO_MENTION_TERMS
+})
+
+_SENTENCE_END = re.compile(r'[.!?]')
+
+# Classificações já calculadas, indexadas pelo texto normalizado
+_classification_memo = LocalCache(max_size=CLASSIFICATION_MEMO_SIZE, ttl=CLASSIFICATION_MEMO_TTL)
+
+
+def _analyze(prompt: str) -> Tuple[Dict[str, bool], bool]:
+    """Calcula todos os indicadores com uma única varredura do prompt"""
+    matches = _MATCHER.scan(prompt)
+    length = len(prompt)
+    word_count = len(prompt.split())
+    sentence_count = len(_SENTENCE_END.findall(prompt))
+
+    complex_ = sum([
+        length > 300,  # Prompt longo
+        word_count > 50,  # Muitas palavras
+        sentence_count > 3,  # Múltiplas frases
+        bool(matches["complex"])
+    ]) >= 2  # Se pelo menos 2 indicadores forem verdadeiros
+    technical = bool(matches["technical"])
+    analytical = bool(matches["analytical"])
+    simple = sum([
+        length < 100,  # Prompt curto
+        word_count < 20,  # Poucas palavras
+        sentence_count <= 1,  # Uma frase ou menos
+        not complex_,
+        not technical,
+        not analytical
+    ]) >= 3  # Se pelo menos 3 indicadores forem verdadeiros
+
+    indicators = {
+        "complex": complex_,
+        "technical": technical,
+        "analytical": analytical,
+        "simple": simple,
+        "audio_related": bool(matches["audio_related"])
+    }
+    return indicators, bool(matches["audio_mention"])
+
+
+def analyze_prompt(prompt: str) -> Dict[str, bool]:
+    """Retorna todos os indicadores do prompt (complex, technical, analytical, simple, audio_related)"""
+    return _analyze(prompt)[0]
+
 
 def classify_prompt(prompt: str) -> Dict[str, Any]:
     """
@@ -29,20 +137,12 @@ def classify_prompt(prompt: str) -> Dict[str, Any]:
     if GPT_API_KEY:
         model_scores["gpt"] = 0.1  # Score mais baixo pois é reservado para áudio
     
+    # Indicadores para análise do prompt (uma única varredura)
+    indicators, mentions_audio = _analyze(prompt)
+
     # Se o prompt menciona explicitamente áudio, aumenta o score do GPT
-    if ("áudio" in prompt.lower() or "ouvir" in prompt.lower() or 
-        "escutar" in prompt.lower() or "voz" in prompt.lower() or
-        "som" in prompt.lower()):
+    if mentions_audio:
         model_scores["gpt"] = model_scores.get("gpt", 0) + 0.4
-        
-    # Indicadores para análise do prompt
-    indicators = {
-        "complex": is_complex(prompt),
-        "technical": is_technical(prompt),
-        "analytical": is_analytical(prompt),
-        "simple": is_simple(prompt),
-        "audio_related": is_audio_related(prompt)
-    }
     
     # Calcula scores com base nos indicadores
     if indicators["complex"]:
@@ -84,93 +184,42 @@ def classify_prompt(prompt: str) -> Dict[str, Any]:
         "indicators": indicators
     }
 
+def normalize_prompt(text: str) -> str:
+    """Normaliza o texto para a chave de memorização (minúsculas, espaços colapsados)"""
+    return " ".join(text.lower().split())
+
+def classify_prompt_cached(text: str) -> Dict[str, Any]:
+    """
+    Classifica o texto do usuário reaproveitando o resultado de textos iguais
+    já classificados. O resultado é compartilhado e não deve ser alterado.
+    """
+    key = normalize_prompt(text)
+    result = _classification_memo.get(key)
+    if result is None:
+        result = classify_prompt(key)
+        _classification_memo.set(key, result)
+    return result
+
+def get_classification_memo_stats() -> Dict[str, Any]:
+    """Estatísticas da memorização de classificações (hits, misses, tamanho)"""
+    return _classification_memo.stats()
+
 def is_complex(prompt: str) -> bool:
     """Verifica se o prompt é complexo"""
-    # Indicadores de complexidade
-    indicators = [
-        len(prompt) > 300,  # Prompt longo
-        len(prompt.split()) > 50,  # Muitas palavras
-        len(re.findall(r'[.!?]', prompt)) > 3,  # Múltiplas frases
-        any(term in prompt.lower() for term in [
-            "explique", "detalhe", "análise", "compare", "contraste",
-            "discuta", "avalie", "critique", "sintetize", "filosófico",
-            "profund", "complex", "abrangente"
-        ])
-    ]
-    
-    return sum(indicators) >= 2  # Se pelo menos 2 indicadores forem verdadeiros
+    return analyze_prompt(prompt)["complex"]
 
 def is_technical(prompt: str) -> bool:
     """Verifica se o prompt é técnico"""
-    # Termos técnicos para diferentes áreas
-    technical_terms = [
-        # Programação/Tecnologia
-        "código", "programa", "função", "api", "algoritmo", "cloud", "aws", "azure",
-        "docker", "kubernetes", "linux", "servidor", "frontend", "backend", "devops",
-        "javascript", "python", "java", "c++", "sql", "banco de dados", "framework",
-        
-        # Ciência
-        "física", "química", "biologia", "matemática", "equação", "fórmula",
-        "científic", "quantum", "átomo", "molecular", "genética", "célula",
-        
-        # Medicina
-        "médic", "clínic", "doença", "patologia", "diagnóstico", "tratamento",
-        "anatomia", "fisiologia", "cirurgia", "farmacologia", "terapia",
-        
-        # Finanças/Economia
-        "finanças", "economi", "contabilidade", "mercado", "ações", "investimento",
-        "bolsa", "taxa", "juros", "fiscal", "tributári", "imposto", "lucro", "custo",
-        
-        # Engenharia
-        "engenhari", "estrutura", "mecânica", "elétrica", "civil", "construção",
-        "projeto", "design", "cad", "material", "resistência", "torque"
-    ]
-    
-    # Verifica se há termos técnicos no prompt
-    prompt_lower = prompt.lower()
-    matches = [term for term in technical_terms if term in prompt_lower]
-    
-    return len(matches) >= 1
+    return analyze_prompt(prompt)["technical"]
 
 def is_analytical(prompt: str) -> bool:
     """Verifica se o prompt requer análise ou pensamento crítico"""
-    analytical_indicators = [
-        "analis", "compar", "contrast", "avali", "critic", "pros e contras",
-        "vantagens", "desvantagens", "melhor", "pior", "recomend", "aconselharia",
-        "por que", "razão", "causa", "efeito", "impacto", "consequência",
-        "evidência", "argumento", "justific", "demonstr", "prov"
-    ]
-    
-    prompt_lower = prompt.lower()
-    matches = [indicator for indicator in analytical_indicators if indicator in prompt_lower]
-    
-    return len(matches) >= 1
+    return analyze_prompt(prompt)["analytical"]
 
 def is_simple(prompt: str) -> bool:
     """Verifica se o prompt é simples"""
-    # Indicadores de simplicidade
-    indicators = [
-        len(prompt) < 100,  # Prompt curto
-        len(prompt.split()) < 20,  # Poucas palavras
-        len(re.findall(r'[.!?]', prompt)) <= 1,  # Uma frase ou menos
-        not is_complex(prompt),  # Não é complexo
-        not is_technical(prompt),  # Não é técnico
-        not is_analytical(prompt)  # Não é analítico
-    ]
-    
-    return sum(indicators) >= 3  # Se pelo menos 3 indicadores forem verdadeiros
+    return analyze_prompt(prompt)["simple"]
 
 def is_audio_related(prompt: str) -> bool:
     """Verifica se o prompt está relacionado a áudio"""
-    audio_indicators = [
-        "áudio", "ouvir", "escutar", "voz", "som", "narração", "narrar",
-        "canção", "música", "falar", "pronuncia", "sotaque", "falando",
-        "grave", "agudo", "timbre", "entonação", "dicção", "cantado",
-        "melodia", "speaker", "fone", "alto-falante", "rádio", "podcasts",
-        "audiobook", "livro falado", "dublagem", "tonalidade", "sonoro"
-    ]
-    
-    prompt_lower = prompt.lower()
-    matches = [indicator for indicator in audio_indicators if indicator in prompt_lower]
-    
-    return len(matches) >= 1 
\ No newline at end of file
+    return analyze_prompt(prompt)["audio_related"]
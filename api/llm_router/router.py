@@ -1,15 +1,25 @@
-from typing import Dict, Any, Optional, Callable, Awaitable
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Tuple, AsyncIterator
+import asyncio
 import json
+import time
 from datetime import datetime
 from api.utils.logger import logger
-from .gemini import call_gemini
-from .mistral import call_mistral
-from .deepseek import call_deepseek
-from .gpt import call_gpt
-from .prompt_classifier import classify_prompt
+from .gemini import call_gemini, stream_gemini
+from .mistral import call_mistral, stream_mistral
+from .deepseek import call_deepseek, stream_deepseek
+from .gpt import call_gpt, stream_gpt
+from .prompt_classifier import classify_prompt_cached
+from .cost_analyzer import estimate_call_cost, get_reported_usage
+from .latency import latency_tracker
+from .circuit_breaker import circuit_breakers, CircuitOpenError
+from ..utils.config import (
+    ROUTER_HEDGING_ENABLED, ROUTER_HEDGE_DELAY, ROUTER_HEDGE_PERCENTILE,
+    ROUTER_HEDGE_MAX_COST_USD, ROUTER_HEDGE_OUTPUT_TOKENS
+)
 from ..utils.cache_manager import cache_manager
 from ..utils.conversation_memory import conversation_manager
 from ..utils.audio_service import audio_service
+from ..utils.side_effects import side_effects
 
 class LLMRouter:
     """
@@ -27,10 +37,18 @@ class LLMRouter:
             "deepseek": call_deepseek,
         }
         
+        # Versões em streaming dos adaptadores (geram trechos de texto)
+        self.stream_models: Dict[str, Callable[..., AsyncIterator[str]]] = {
+            "gemini": stream_gemini,
+            "mistral": stream_mistral,
+            "deepseek": stream_deepseek,
+        }
+        
         # Adiciona GPT apenas se tiver API key válida (reservado para áudio)
         from ..llm_router.gpt import GPT_API_KEY
         if GPT_API_KEY:
             self.models["gpt"] = call_gpt
+            self.stream_models["gpt"] = stream_gpt
             logger.info("GPT adicionado aos modelos disponíveis (reservado para áudio)")
         else:
             logger.warning("GPT não disponível - API key não configurada")
@@ -38,15 +56,134 @@ class LLMRouter:
         # Define a ordem de fallback para quando um modelo falha
         self.fallback_order = ["deepseek", "mistral", "gemini", "gpt"]
         
+        # Hedging: dispara o próximo modelo se o principal passar do seu p95
+        self.hedging_enabled = ROUTER_HEDGING_ENABLED
+        
         logger.info(f"LLM Router inicializado com {len(self.models)} modelos: {', '.join(self.models.keys())}")
         
-    async def _try_model_with_fallback(self, model_name: str, prompt: str, **kwargs) -> Dict[str, Any]:
+    @staticmethod
+    def _is_successful(response: Any) -> bool:
+        """Os adaptadores sinalizam falha com success=False em vez de exceção"""
+        return not (isinstance(response, dict) and response.get("success") is False)
+
+    async def _call_model(self, model_name: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        """
+        Chama um modelo passando pelo circuit breaker e registrando a latência.
+        Levanta exceção quando o adaptador retorna success=False, para que o
+        fallback seja acionado.
+        """
+        breaker = circuit_breakers.get(model_name)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuito aberto para o modelo {model_name}")
+        
+        start = time.perf_counter()
+        try:
+            response = await self.models[model_name](prompt, **kwargs)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        
+        if not self._is_successful(response):
+            breaker.record_failure()
+            raise ValueError(response.get("text") or f"Falha no modelo {model_name}")
+        
+        latency = time.perf_counter() - start
+        breaker.record_success(latency)
+        latency_tracker.record(model_name, latency)
+        return response
+
+    def _next_fallback(self, used_models: List[Dict[str, Any]]) -> Optional[str]:
+        """Próximo modelo a tentar, com a ordem de fallback reordenada pela saúde atual"""
+        tried = {u["model"] for u in used_models}
+        options = [m for m in self.fallback_order if m not in tried]
+        ordered = circuit_breakers.order_by_health(options)
+        return ordered[0] if ordered else None
+
+    def _hedge_delay(self, model_name: str) -> float:
+        """Tempo de espera antes de disparar o modelo reserva"""
+        observed = latency_tracker.percentile(model_name, ROUTER_HEDGE_PERCENTILE)
+        return observed if observed is not None else ROUTER_HEDGE_DELAY
+
+    def _pick_hedge_backup(self, model_name: str, prompt: str) -> Optional[str]:
+        """Escolhe o modelo reserva respeitando o teto de custo por requisição"""
+        primary_cost = estimate_call_cost(model_name, prompt, ROUTER_HEDGE_OUTPUT_TOKENS)
+        for candidate in circuit_breakers.order_by_health(self.fallback_order):
+            if candidate == model_name or candidate not in self.models:
+                continue
+            if not circuit_breakers.get(candidate).is_available():
+                continue
+            backup_cost = estimate_call_cost(candidate, prompt, ROUTER_HEDGE_OUTPUT_TOKENS)
+            if primary_cost + backup_cost <= ROUTER_HEDGE_MAX_COST_USD:
+                return candidate
+        return None
+
+    async def _hedged_call(
+        self,
+        primary: str,
+        backup: str,
+        prompt: str,
+        **kwargs
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Chama o modelo principal e, se ele não responder dentro do delay, dispara
+        o reserva. A primeira resposta bem-sucedida vence e a outra é cancelada.
+        
+        Returns:
+            (modelo vencedor, resposta, tentativas) ou (None, None, tentativas)
+        """
+        attempts: List[Dict[str, Any]] = []
+        tasks: Dict[asyncio.Task, str] = {
+            asyncio.create_task(self._call_model(primary, prompt, **kwargs)): primary
+        }
+        delay = self._hedge_delay(primary)
+        hedge_started = False
+        
+        try:
+            while tasks:
+                timeout = None if hedge_started else delay
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done or (not hedge_started and not any(not t.exception() for t in done)):
+                    # Principal lento ou com falha: dispara o reserva uma única vez
+                    if not hedge_started:
+                        hedge_started = True
+                        logger.info(f"Hedging: disparando {backup} após {delay:.2f}s de espera por {primary}")
+                        tasks[asyncio.create_task(self._call_model(backup, prompt, **kwargs))] = backup
+                
+                for task in done:
+                    model = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        attempts.append({"model": model, "status": "success", "hedged": True})
+                        return model, task.result(), attempts
+                    
+                    logger.error(f"Hedging: modelo {model} falhou: {str(error)}")
+                    attempts.append({"model": model, "status": "error", "error": str(error), "hedged": True})
+            
+            return None, None, attempts
+        finally:
+            # Cancela a chamada perdedora
+            for task, model in tasks.items():
+                task.cancel()
+                attempts.append({"model": model, "status": "cancelled", "hedged": True})
+
+    async def _try_model_with_fallback(
+        self,
+        model_name: str,
+        prompt: str,
+        hedge: Optional[bool] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
         """
         Tenta usar um modelo com fallback para outros modelos em caso de falha
         
         Args:
             model_name: Nome do modelo a ser usado
             prompt: Texto do prompt
+            hedge: Força ligar/desligar o hedging (padrão: ROUTER_HEDGING_ENABLED)
             **kwargs: Argumentos adicionais para a chamada
             
         Returns:
@@ -55,17 +192,41 @@ class LLMRouter:
         used_models = []
         current_model = model_name
         
+        # Hedging opcional entre o modelo solicitado e o primeiro reserva dentro do teto de custo
+        hedge = self.hedging_enabled if hedge is None else hedge
+        backup = None
+        if hedge and model_name in self.models and circuit_breakers.get(model_name).is_available():
+            backup = self._pick_hedge_backup(model_name, prompt)
+        if backup:
+            winner, response, attempts = await self._hedged_call(model_name, backup, prompt, **kwargs)
+            used_models.extend(attempts)
+            if winner:
+                if "text" not in response:
+                    response["text"] = f"Resposta sem texto do modelo {winner}"
+                response["model"] = winner
+                response["original_model"] = model_name
+                response["used_fallback"] = winner != model_name
+                response["fallback_info"] = used_models
+                return response
+            
+            # Os dois falharam: segue para o fallback sequencial com os demais
+            current_model = self._next_fallback(used_models)
+        
         # Tenta o modelo solicitado e depois segue a ordem de fallback
-        while True:
+        while current_model is not None:
             if current_model not in self.models:
                 # Pula este modelo se não estiver disponível
                 logger.warning(f"Modelo {current_model} não está disponível, pulando")
                 used_models.append({"model": current_model, "status": "unavailable"})
+            elif not circuit_breakers.get(current_model).is_available():
+                # Circuito aberto: pula sem gastar tempo com a chamada
+                logger.warning(f"Circuito aberto para {current_model}, pulando")
+                used_models.append({"model": current_model, "status": "circuit_open"})
             else:
                 try:
                     # Tenta chamar o modelo atual
                     logger.info(f"Tentando modelo: {current_model}")
-                    response = await self.models[current_model](prompt, **kwargs)
+                    response = await self._call_model(current_model, prompt, **kwargs)
                     
                     # Se chegou aqui, a chamada foi bem-sucedida
                     used_models.append({"model": current_model, "status": "success"})
@@ -91,28 +252,19 @@ class LLMRouter:
                     used_models.append({"model": current_model, "status": "error", "error": str(e)})
             
             # Tenta o próximo modelo na ordem de fallback
-            try:
-                # Remove os modelos já tentados da lista de fallback
-                fallback_options = [m for m in self.fallback_order if m not in [u["model"] for u in used_models]]
-                
-                if not fallback_options:
-                    # Não há mais modelos para tentar
-                    logger.error("Todos os modelos falharam, não há mais fallbacks disponíveis")
-                    raise ValueError("Todos os modelos de fallback falharam")
-                
-                current_model = fallback_options[0]
+            current_model = self._next_fallback(used_models)
+            if current_model:
                 logger.info(f"Fallback para modelo: {current_model}")
-                
-            except Exception as e:
-                # Se não houver mais modelos de fallback, retorna erro
-                logger.error(f"Erro no processo de fallback: {str(e)}")
-                return {
-                    "text": f"Erro em todos os modelos disponíveis. Por favor, tente novamente mais tarde.",
-                    "model": "fallback_error",
-                    "original_model": model_name,
-                    "success": False,
-                    "used_fallback": True,
-                    "fallback_info": used_models
+        
+        # Não há mais modelos para tentar
+        logger.error("Todos os modelos falharam, não há mais fallbacks disponíveis")
+        return {
+            "text": f"Erro em todos os modelos disponíveis. Por favor, tente novamente mais tarde.",
+            "model": "fallback_error",
+            "original_model": model_name,
+            "success": False,
+            "used_fallback": True,
+            "fallback_info": used_models
         }
         
     async def route_prompt(
@@ -122,6 +274,8 @@ class LLMRouter:
         model: Optional[str] = None,
         use_cache: bool = True,
         generate_audio: bool = False,
+        classification_text: Optional[str] = None,
+        defer_audio: bool = False,
         **kwargs: Dict[str, Any]
     ) -> Dict[str, Any]:
         """
@@ -133,6 +287,10 @@ class LLMRouter:
             model: Modelo específico a ser usado (opcional)
             use_cache: Se deve usar o cache
             generate_audio: Se deve gerar áudio da resposta
+            classification_text: Texto do usuário usado na classificação, sem
+                instruções adicionadas ao prompt (padrão: o próprio prompt)
+            defer_audio: Não espera o áudio; retorna em "speech" um SpeechStream
+                já em andamento para o texto poder ser entregue antes
             **kwargs: Argumentos adicionais para a chamada do modelo
             
         Returns:
@@ -163,29 +321,6 @@ class LLMRouter:
                 if cached_response:
                     logger.info("Resposta encontrada no cache")
                     
-                    # Adiciona resposta do cache à memória
-                    if sender_phone:
-                        await conversation_manager.add_message(
-                            sender_phone=sender_phone,
-                            role="assistant",
-                            content=cached_response["text"],
-                            model_used=cached_response["model"],
-                            save_to_db=True
-                        )
-                    
-                    # Se precisar gerar áudio, gera a partir do texto do cache
-                    audio_info = None
-                    if generate_audio:
-                        logger.info("Gerando áudio para resposta do cache")
-                        try:
-                            audio_result = await audio_service.text_to_speech(
-                                text=cached_response["text"],
-                                request_id=str(datetime.utcnow().timestamp())
-                            )
-                            audio_info = audio_result
-                        except Exception as audio_error:
-                            logger.error(f"Erro ao gerar áudio: {str(audio_error)}")
-                    
                     result = {
                         "text": cached_response["text"],
                         "model": cached_response["model"],
@@ -199,10 +334,8 @@ class LLMRouter:
                         "has_memory": bool(sender_phone)
                     }
                     
-                    # Adiciona informações de áudio ao resultado se gerado
-                    if audio_info:
-                        result["audio"] = audio_info
-                    
+                    # Memória e áudio da resposta do cache (sem regravar o cache)
+                    await self._record_response(prompt, result, sender_phone, generate_audio, cache=False, defer_audio=defer_audio)
                     return result
             
             # Se um modelo específico foi solicitado
@@ -215,49 +348,24 @@ class LLMRouter:
                     # Chama o modelo com fallback automático
                     response = await self._try_model_with_fallback(model, prompt, **kwargs)
                     
-                    # Adiciona resposta à memória
-                    if sender_phone:
-                        await conversation_manager.add_message(
-                            sender_phone=sender_phone,
-                            role="assistant",
-                            content=response["text"],
-                            model_used=response["model"],
-                            save_to_db=True
-                        )
-                    
-                    # Gera áudio se solicitado
-                    audio_info = None
-                    if generate_audio:
-                        try:
-                            audio_result = await audio_service.text_to_speech(
-                                text=response["text"],
-                                request_id=str(datetime.utcnow().timestamp())
-                            )
-                            audio_info = audio_result
-                        except Exception as audio_error:
-                            logger.error(f"Erro ao gerar áudio: {str(audio_error)}")
-                    
                     result = {
                         "text": response["text"],
                         "model": response["model"],
-                        "success": True,
+                        "success": response.get("success", True),
                         "from_cache": False,
                         "has_memory": bool(sender_phone)
                     }
                     
-                    # Adiciona informações de áudio ao resultado se gerado
-                    if audio_info:
-                        result["audio"] = audio_info
-                    
-                    # Salva no cache
-                    if use_cache:
-                        await cache_manager.cache_response(prompt, result, response["model"])
+                    usage = get_reported_usage(response)
+                    if usage:
+                        result["tokens"] = usage
                     
+                    await self._record_response(prompt, result, sender_phone, generate_audio, cache=use_cache, defer_audio=defer_audio)
                     return result
             
             # Se não foi especificado um modelo, usa classificação automática
-            classification = await classify_prompt(prompt)
-            chosen_model = classification["best_model"]
+            classification = classify_prompt_cached(classification_text or prompt)
+            chosen_model = classification["model"]
             confidence = classification["confidence"]
             model_scores = classification["model_scores"]
             indicators = classification["indicators"]
@@ -270,28 +378,6 @@ class LLMRouter:
             used_model = response["model"]
             used_fallback = response.get("used_fallback", False)
             
-            # Adiciona resposta à memória
-            if sender_phone:
-                await conversation_manager.add_message(
-                    sender_phone=sender_phone,
-                    role="assistant",
-                    content=response_text,
-                    model_used=used_model,
-                    save_to_db=True
-                )
-            
-            # Gera áudio se solicitado
-            audio_info = None
-            if generate_audio:
-                try:
-                    audio_result = await audio_service.text_to_speech(
-                        text=response_text,
-                        request_id=str(datetime.utcnow().timestamp())
-                    )
-                    audio_info = audio_result
-                except Exception as audio_error:
-                    logger.error(f"Erro ao gerar áudio: {str(audio_error)}")
-            
             result = {
                 "text": response_text,
                 "model": used_model,
@@ -301,22 +387,240 @@ class LLMRouter:
                 "indicators": indicators,
                 "used_fallback": used_fallback,
                 "fallback_info": response.get("fallback_info", []),
-                "success": True,
+                "success": response.get("success", True),
                 "from_cache": False,
                 "has_memory": bool(sender_phone)
             }
             
-            # Adiciona informações de áudio ao resultado se gerado
-            if audio_info:
-                result["audio"] = audio_info
-            
-            # Salva no cache
-            if use_cache:
-                await cache_manager.cache_response(prompt, result, used_model)
+            # Uso de tokens informado pelo provedor (evita tokenizar de novo na análise de custo)
+            usage = get_reported_usage(response)
+            if usage:
+                result["tokens"] = usage
             
+            await self._record_response(prompt, result, sender_phone, generate_audio, cache=use_cache, defer_audio=defer_audio)
             return result
             
         except Exception as e:
             logger.error(f"Erro no roteamento: {str(e)}")
             logger.exception("Stacktrace completo:")
-            raise
\ No newline at end of file
+            raise
+
+    async def _open_stream(
+        self,
+        model_name: str,
+        prompt: str,
+        used_models: List[Dict[str, Any]],
+        **kwargs
+    ) -> Tuple[Optional[str], Optional[AsyncIterator[str]], Optional[str]]:
+        """
+        Abre o stream do modelo solicitado ou do próximo da ordem de fallback.
+        O fallback só é possível até o primeiro trecho chegar.
+        
+        Returns:
+            (modelo, iterador com os trechos restantes, primeiro trecho)
+        """
+        current_model = model_name
+        while current_model is not None:
+            breaker = circuit_breakers.get(current_model)
+            if current_model not in self.stream_models:
+                used_models.append({"model": current_model, "status": "unavailable"})
+            elif not breaker.allow_request():
+                used_models.append({"model": current_model, "status": "circuit_open"})
+            else:
+                stream = self.stream_models[current_model](prompt, **kwargs)
+                try:
+                    logger.info(f"Abrindo stream do modelo: {current_model}")
+                    first_chunk = await stream.__anext__()
+                    return current_model, stream, first_chunk
+                except StopAsyncIteration:
+                    breaker.record_failure()
+                    used_models.append({"model": current_model, "status": "error", "error": "Resposta vazia"})
+                except asyncio.CancelledError:
+                    breaker.release()
+                    raise
+                except Exception as e:
+                    breaker.record_failure()
+                    logger.error(f"Erro ao abrir stream do modelo {current_model}: {str(e)}")
+                    used_models.append({"model": current_model, "status": "error", "error": str(e)})
+            
+            current_model = self._next_fallback(used_models)
+        return None, None, None
+
+    async def _record_response(
+        self,
+        prompt: str,
+        result: Dict[str, Any],
+        sender_phone: Optional[str],
+        generate_audio: bool,
+        cache: bool,
+        defer_audio: bool = False
+    ) -> None:
+        """
+        Dispara em background a gravação na memória e no cache, para a resposta
+        ser entregue sem esperar o Supabase. A memória mantém a ordem da
+        conversa (a próxima mensagem do número espera esta gravação). Só o
+        áudio síncrono é aguardado, porque entra no resultado. Falhas e
+        timeouts de cada etapa ficam isoladas.
+        """
+        if result.get("success") is False:
+            # Aviso de falha geral: não vai para o cache nem vira áudio
+            cache = generate_audio = False
+        if sender_phone:
+            conversation_manager.add_message_background(
+                sender_phone=sender_phone,
+                role="assistant",
+                content=result["text"],
+                model_used=result["model"]
+            )
+        if cache:
+            side_effects.fire_and_forget("cache", cache_manager.cache_response(prompt, result, result["model"]))
+        if not generate_audio:
+            return
+        if defer_audio:
+            # A síntese começa agora e segue em paralelo com o envio do texto
+            result["speech"] = audio_service.stream_speech(result["text"])
+            return
+        audio = await side_effects.call("tts", audio_service.text_to_speech(
+            text=result["text"],
+            request_id=str(datetime.utcnow().timestamp())
+        ))
+        if audio:
+            result["audio"] = audio
+
+    def _finish_turn(
+        self,
+        prompt: str,
+        response_text: str,
+        model: str,
+        sender_phone: Optional[str],
+        cache: bool
+    ) -> None:
+        """Dispara a gravação da resposta na memória e no cache, sem segurar o stream"""
+        if sender_phone:
+            conversation_manager.add_message_background(
+                sender_phone=sender_phone,
+                role="assistant",
+                content=response_text,
+                model_used=model
+            )
+        if cache:
+            side_effects.fire_and_forget(
+                "cache", cache_manager.cache_response(prompt, {"text": response_text, "success": True}, model)
+            )
+
+    async def stream_prompt(
+        self,
+        prompt: str,
+        sender_phone: Optional[str] = None,
+        model: Optional[str] = None,
+        use_cache: bool = True,
+        classification_text: Optional[str] = None,
+        **kwargs: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versão em streaming de route_prompt. Gera eventos:
+        - {"type": "start", "model": ...}
+        - {"type": "delta", "text": ...} para cada trecho
+        - {"type": "done", ...} com a resposta completa, ou {"type": "error", ...}
+        
+        A mensagem do usuário é gravada antes do stream (um stream interrompido
+        não perde o turno); a resposta e o cache são gravados em background
+        depois do evento final, sem segurar a conexão.
+        """
+        logger.info(f"Iniciando roteamento em streaming para sender_phone: {sender_phone}")
+        
+        if sender_phone:
+            await conversation_manager.add_message(
+                sender_phone=sender_phone,
+                role="user",
+                content=prompt,
+                save_to_db=True
+            )
+        
+        # Verifica cache primeiro
+        if use_cache:
+            cached_response = await cache_manager.get_cached_response(prompt)
+            if cached_response:
+                logger.info("Resposta encontrada no cache")
+                yield {"type": "start", "model": cached_response["model"], "from_cache": True}
+                yield {"type": "delta", "text": cached_response["text"]}
+                yield {
+                    "type": "done",
+                    "text": cached_response["text"],
+                    "model": cached_response["model"],
+                    "success": True,
+                    "from_cache": True,
+                    "has_memory": bool(sender_phone)
+                }
+                self._finish_turn(prompt, cached_response["text"], cached_response["model"], sender_phone, cache=False)
+                return
+        
+        # Escolhe o modelo: solicitado ou por classificação automática
+        classification = None
+        if model and model not in self.models and model not in self.fallback_order:
+            logger.warning(f"Modelo solicitado '{model}' não existe, usando classificação automática")
+            model = None
+        if not model:
+            classification = classify_prompt_cached(classification_text or prompt)
+            model = classification["model"]
+            logger.info(f"Classificação: modelo={model}, confiança={classification['confidence']}")
+        
+        used_models: List[Dict[str, Any]] = []
+        start = time.perf_counter()
+        used_model, stream, first_chunk = await self._open_stream(model, prompt, used_models, **kwargs)
+        if used_model is None:
+            yield {
+                "type": "error",
+                "text": "Erro em todos os modelos disponíveis. Por favor, tente novamente mais tarde.",
+                "model": "fallback_error",
+                "success": False,
+                "fallback_info": used_models
+            }
+            return
+        
+        yield {"type": "start", "model": used_model, "from_cache": False}
+        
+        chunks = [first_chunk]
+        breaker = circuit_breakers.get(used_model)
+        try:
+            yield {"type": "delta", "text": first_chunk}
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield {"type": "delta", "text": chunk}
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            # Depois do primeiro trecho não há fallback: encerra com erro
+            breaker.record_failure()
+            logger.error(f"Erro durante o stream do modelo {used_model}: {str(e)}")
+            yield {"type": "error", "text": str(e), "model": used_model, "success": False}
+            return
+        
+        latency = time.perf_counter() - start
+        breaker.record_success(latency)
+        latency_tracker.record(used_model, latency)
+        used_models.append({"model": used_model, "status": "success"})
+        
+        response_text = "".join(chunks)
+        done_event = {
+            "type": "done",
+            "text": response_text,
+            "model": used_model,
+            "original_model": model,
+            "used_fallback": used_model != model,
+            "fallback_info": used_models,
+            "success": True,
+            "from_cache": False,
+            "has_memory": bool(sender_phone)
+        }
+        if classification:
+            done_event.update({
+                "classified_model": classification["model"],
+                "confidence": classification["confidence"],
+                "model_scores": classification["model_scores"],
+                "indicators": classification["indicators"]
+            })
+        yield done_event
+        
+        self._finish_turn(prompt, response_text, used_model, sender_phone, cache=use_cache)
@@ -17,6 +17,11 @@ from api.routers import rag as rag_router
 from api.routers import slack as slack_router
 from api.utils.logger import logger
 from api.utils.cache_manager import cache_manager
+from api.utils.http_client import http_clients
+from api.utils.executor import blocking_executor, loop_lag_monitor
+from api.utils.side_effects import side_effects
+from api.utils.config import QUEUE_ENABLED, RAG_INDEX_BACKEND
+from api.utils.vector_index import vector_index
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -58,8 +63,24 @@ app.include_router(slack_router.router, prefix="/api/v1", tags=["slack"])
 async def startup_event():
     """Evento de inicialização da API"""
     try:
+        # Cria os clientes HTTP compartilhados (keep-alive entre requisições)
+        await http_clients.startup()
+        
+        # Mede continuamente o atraso do event loop
+        loop_lag_monitor.start()
+        
         # Inicializa tabela de cache
         cache_manager._ensure_cache_table()
+        # Inicia a gravação em lote dos contadores de hit do cache
+        cache_manager.start_hit_flusher()
+        # Cache semântico: reconstrói o índice a partir do response_cache
+        cache_manager.start_semantic_sync()
+        # Índice vetorial local: carrega os documentos já gravados
+        if RAG_INDEX_BACKEND == "local":
+            await vector_index.load_from_supabase()
+        # Inicia os workers que processam as mensagens enfileiradas pelo webhook
+        if QUEUE_ENABLED:
+            whatsapp.webhook_queue.start()
         logger.info("API iniciada com sucesso")
     except Exception as e:
         logger.error(f"Erro ao inicializar API: {str(e)}")
@@ -69,6 +90,17 @@ async def startup_event():
 async def shutdown_event():
     """Evento de encerramento da API"""
     try:
+        # Termina os jobs em andamento antes de fechar os clientes HTTP
+        await whatsapp.webhook_queue.stop()
+        # Espera os envios disparados em background (ex.: Make)
+        await side_effects.drain()
+        # Grava os contadores de hit pendentes antes de encerrar
+        await cache_manager.stop_hit_flusher()
+        await cache_manager.stop_semantic_sync()
+        # Fecha as conexões dos clientes HTTP compartilhados
+        await http_clients.aclose()
+        await loop_lag_monitor.stop()
+        blocking_executor.shutdown()
         logger.info("API encerrada com sucesso")
     except Exception as e:
         logger.error(f"Erro ao encerrar API: {str(e)}")
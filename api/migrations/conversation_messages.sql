@@ -0,0 +1,39 @@
+-- Memória de conversas append-only: uma linha por mensagem, com sequência por número
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    id BIGSERIAL PRIMARY KEY,
+    sender_phone TEXT NOT NULL,
+    seq BIGINT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    model_used TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (sender_phone, seq)
+);
+
+-- A restrição UNIQUE já cria o índice (sender_phone, seq) usado na leitura do final da conversa
+CREATE INDEX IF NOT EXISTS idx_conversation_messages_created_at ON conversation_messages (created_at);
+
+-- Copia as mensagens do formato antigo (JSON em conversation_memory), preservando a ordem
+INSERT INTO conversation_messages (sender_phone, seq, role, content, model_used, created_at)
+SELECT
+    m.sender_phone,
+    msg.ordinality,
+    msg.value->>'role',
+    msg.value->>'content',
+    msg.value->>'model_used',
+    COALESCE((msg.value->>'timestamp')::timestamptz, NOW())
+FROM conversation_memory m,
+     jsonb_array_elements(m.conversation_memory->'messages') WITH ORDINALITY AS msg(value, ordinality)
+ON CONFLICT (sender_phone, seq) DO NOTHING;
+
+-- Tokens de cada mensagem, calculados uma única vez na gravação
+ALTER TABLE conversation_messages ADD COLUMN IF NOT EXISTS token_count INTEGER;
+
+-- Resumo contínuo das mensagens antigas de cada conversa
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    sender_phone TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_seq BIGINT NOT NULL,
+    token_count INTEGER,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
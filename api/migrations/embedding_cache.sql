@@ -0,0 +1,7 @@
+-- Cache persistente de embeddings, endereçado pelo hash de modelo e texto
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    content_hash TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    embedding REAL[] NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,43 @@
+-- Fila de jobs com claim atômico e lease
+CREATE TABLE IF NOT EXISTS message_queue (
+    id BIGSERIAL PRIMARY KEY,
+    sender TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    message_queue JSONB NOT NULL DEFAULT '{}'::jsonb,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    processed_at TIMESTAMPTZ
+);
+
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS max_attempts INTEGER NOT NULL DEFAULT 3;
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS available_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ;
+ALTER TABLE message_queue ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+-- Jobs prontos na ordem do claim e leases a vencer
+CREATE INDEX IF NOT EXISTS idx_message_queue_ready ON message_queue (priority DESC, available_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_message_queue_leases ON message_queue (lease_until) WHERE status = 'processing';
+
+-- Reserva até p_limit jobs: pendentes já disponíveis ou com lease vencida.
+-- SKIP LOCKED faz cada worker pegar linhas diferentes sem esperar os outros.
+CREATE OR REPLACE FUNCTION claim_queue_messages(p_owner TEXT, p_limit INTEGER, p_lease_seconds INTEGER)
+RETURNS SETOF message_queue
+LANGUAGE sql
+AS $$
+    UPDATE message_queue AS q
+    SET status = 'processing',
+        lease_owner = p_owner,
+        lease_until = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = q.attempts + 1
+    WHERE q.id IN (
+        SELECT id FROM message_queue
+        WHERE (status = 'pending' AND available_at <= NOW())
+           OR (status = 'processing' AND lease_until < NOW())
+        ORDER BY priority DESC, available_at, id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING q.*
+$$;
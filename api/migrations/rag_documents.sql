@@ -0,0 +1,63 @@
+-- Busca vetorial do RAG no banco (pgvector)
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS rag_documents (
+    id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    metadata JSONB NOT NULL DEFAULT '{}'::jsonb,
+    embedding vector(1536) NOT NULL,
+    namespace TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Instalações anteriores gravavam o embedding como lista (JSONB ou array):
+-- converte a coluna para vector(1536) só se ela ainda não for desse tipo
+DO $$
+BEGIN
+    IF (
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = 'rag_documents'::regclass AND attname = 'embedding'
+    ) <> 'vector(1536)' THEN
+        ALTER TABLE rag_documents
+            ALTER COLUMN embedding TYPE vector(1536)
+            USING translate(embedding::text, '{}', '[]')::vector(1536);
+    END IF;
+END
+$$;
+
+-- Índice aproximado (HNSW) para distância de cosseno
+CREATE INDEX IF NOT EXISTS idx_rag_documents_embedding ON rag_documents USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS idx_rag_documents_namespace ON rag_documents (namespace);
+CREATE INDEX IF NOT EXISTS idx_rag_documents_parent ON rag_documents ((metadata->>'parent_id'));
+
+-- Top-k por similaridade de cosseno, opcionalmente filtrado por namespace.
+-- O HNSW filtra depois de buscar ef_search candidatos (padrão 40): com
+-- namespace, isso devolvia menos de match_count linhas. ef_search maior só
+-- vale dentro da função.
+CREATE OR REPLACE FUNCTION match_documents(query_embedding vector(1536), match_count INTEGER, filter_namespace TEXT DEFAULT NULL)
+RETURNS TABLE (id TEXT, content TEXT, metadata JSONB, namespace TEXT, similarity DOUBLE PRECISION)
+LANGUAGE sql STABLE
+SET hnsw.ef_search = 400
+AS $$
+    SELECT d.id, d.content, d.metadata, d.namespace, 1 - (d.embedding <=> query_embedding) AS similarity
+    FROM rag_documents AS d
+    WHERE filter_namespace IS NULL OR d.namespace = filter_namespace
+    ORDER BY d.embedding <=> query_embedding
+    LIMIT match_count
+$$;
+
+-- Remove trechos "<id>:<n>" que sobraram quando um documento reindexado
+-- ficou com menos trechos (p_chunk_counts: quantidade atual de cada documento)
+CREATE OR REPLACE FUNCTION delete_stale_chunks(p_parent_ids TEXT[], p_chunk_counts INTEGER[])
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH deleted AS (
+        DELETE FROM rag_documents AS d
+        USING unnest(p_parent_ids, p_chunk_counts) AS k(parent_id, chunk_count)
+        WHERE d.metadata->>'parent_id' = k.parent_id
+          AND (d.metadata->>'chunk_index')::INTEGER >= k.chunk_count
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM deleted
+$$;
@@ -0,0 +1,12 @@
+-- Soma em lote os hits acumulados em memória pelos processos (cache_manager.flush_hit_counts).
+-- Atualiza só hit_count e last_accessed das linhas que ainda existem.
+CREATE OR REPLACE FUNCTION increment_cache_hits(p_hashes TEXT[], p_deltas INTEGER[], p_last_accessed TIMESTAMPTZ[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE response_cache AS c
+    SET hit_count = c.hit_count + h.delta,
+        last_accessed = h.last_accessed
+    FROM unnest(p_hashes, p_deltas, p_last_accessed) AS h(prompt_hash, delta, last_accessed)
+    WHERE c.prompt_hash = h.prompt_hash
+$$;
@@ -0,0 +1,3 @@
+-- Embedding do prompt de cada resposta cacheada, usado pelo cache semântico
+-- (SEMANTIC_CACHE_ENABLED) para reconstruir o índice ao iniciar e entre processos
+ALTER TABLE response_cache ADD COLUMN IF NOT EXISTS prompt_embedding REAL[];
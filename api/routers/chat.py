@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, File, UploadFile, Form
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, Union
 from loguru import logger
 from ..llm_router.router import LLMRouter
-from ..llm_router.cost_analyzer import analyze_cost
+from ..llm_router.cost_analyzer import analyze_result_cost
 from ..utils.supabase import supabase, save_llm_data
 from ..utils.conversation_memory import conversation_manager
 import uuid
@@ -11,9 +12,6 @@ import json
 import base64
 from ..utils.audio_service import AudioService
 from ..utils.rag import search_similar, format_chunks_as_context
-import os
-import tempfile
-import aiofiles
 
 router = APIRouter()
 llm_router = LLMRouter()
@@ -26,6 +24,7 @@ class ChatRequest(BaseModel):
     use_rag: Optional[bool] = False
     rag_namespace: Optional[str] = None
     rag_top_k: Optional[int] = 5
+    stream: Optional[bool] = False
 
 class CostDetail(BaseModel):
     cents: int
@@ -60,9 +59,27 @@ async def cleanup_old_memories(background_tasks: BackgroundTasks):
     except Exception as e:
         logger.error(f"Erro ao limpar memórias antigas: {str(e)}")
 
+async def stream_chat_events(router: LLMRouter, request: ChatRequest, system_prompt: Optional[str]):
+    """Converte os eventos do router em Server-Sent Events"""
+    try:
+        async for event in router.stream_prompt(
+            prompt=request.prompt,
+            sender_phone=request.sender_phone,
+            model=request.model,
+            system_prompt=system_prompt
+        ):
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    except Exception as e:
+        logger.error(f"Erro no streaming do chat: {str(e)}")
+        error = {"type": "error", "text": str(e), "success": False}
+        yield f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+
 @router.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     """Endpoint principal de chat que processa texto e opcionalmente gera áudio."""
+    # O streaming entrega só texto; o áudio precisa da resposta completa
+    if request.stream and request.generate_audio:
+        raise HTTPException(status_code=400, detail="generate_audio não é suportado com stream=true")
     try:
         # Gera um ID único para a requisição
         request_id = str(uuid.uuid4())
@@ -84,12 +101,23 @@ async def chat_endpoint(request: ChatRequest):
 
         # Roteamento do prompt
         router = LLMRouter()
+        
+        # Modo streaming: envia os trechos via SSE conforme o modelo gera
+        if request.stream:
+            return StreamingResponse(
+                stream_chat_events(router, request, system_prompt),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
         response = await router.route_prompt(
             prompt=request.prompt,
             sender_phone=request.sender_phone,
             model=request.model,
             system_prompt=system_prompt
         )
+        # Custo pelo uso informado pelo provedor (contagem local só na falta dele)
+        response["cost_analysis"] = analyze_result_cost(request.prompt, response)
 
         # Se solicitado, gera áudio da resposta
         if request.generate_audio and response.get("text"):
@@ -122,52 +150,40 @@ async def audio_chat_endpoint(
         request_id = str(uuid.uuid4())
         logger.info(f"Nova requisição de áudio: {request_id}")
 
-        # Salva o arquivo de áudio temporariamente
-        temp_path = AudioService.get_temp_path(f"upload_{request_id}.mp3")
-        try:
-            with open(temp_path, "wb") as f:
-                content = await audio.read()
-                f.write(content)
-            logger.info(f"Áudio salvo temporariamente em: {temp_path}")
-
-            # Transcreve o áudio
-            transcription = await AudioService.speech_to_text(temp_path, request_id)
-            if not transcription.get("text"):
-                raise HTTPException(status_code=400, detail="Falha ao transcrever áudio")
-
-            # Processa o texto transcrito
-            router = LLMRouter()
-            response = await router.route_prompt(
-                prompt=transcription["text"],
-                sender_phone=sender_phone,
-                model=model
-            )
+        # Lê o upload direto para a memória, sem arquivo temporário
+        content = await audio.read()
+        logger.info(f"Áudio recebido: {len(content)} bytes")
+
+        # Transcreve o áudio
+        transcription = await AudioService.speech_to_text(content, request_id)
+        if not transcription.get("text"):
+            raise HTTPException(status_code=400, detail="Falha ao transcrever áudio")
 
-            # Adiciona informação da transcrição à resposta
-            response["transcription"] = transcription["text"]
-
-            # Se solicitado, gera áudio da resposta
-            if generate_audio and response.get("text"):
-                try:
-                    audio_result = await AudioService.text_to_speech(
-                        text=response["text"],
-                        request_id=f"{request_id}_response"
-                    )
-                    response["audio"] = audio_result
-                except Exception as e:
-                    logger.error(f"Erro ao gerar áudio da resposta: {str(e)}")
-                    response["audio_error"] = str(e)
-
-            return response
-
-        finally:
-            # Limpa o arquivo temporário
-            if os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                    logger.info(f"Arquivo temporário removido: {temp_path}")
-                except Exception as e:
-                    logger.warning(f"Erro ao remover arquivo temporário: {str(e)}")
+        # Processa o texto transcrito
+        router = LLMRouter()
+        response = await router.route_prompt(
+            prompt=transcription["text"],
+            sender_phone=sender_phone,
+            model=model
+        )
+        response["cost_analysis"] = analyze_result_cost(transcription["text"], response)
+
+        # Adiciona informação da transcrição à resposta
+        response["transcription"] = transcription["text"]
+
+        # Se solicitado, gera áudio da resposta
+        if generate_audio and response.get("text"):
+            try:
+                audio_result = await AudioService.text_to_speech(
+                    text=response["text"],
+                    request_id=f"{request_id}_response"
+                )
+                response["audio"] = audio_result
+            except Exception as e:
+                logger.error(f"Erro ao gerar áudio da resposta: {str(e)}")
+                response["audio_error"] = str(e)
+
+        return response
 
     except Exception as e:
         logger.error(f"Erro no endpoint de áudio: {str(e)}")
@@ -177,7 +193,7 @@ async def audio_chat_endpoint(
 async def clear_memory_endpoint(sender_phone: str):
     """Limpa o histórico de conversa para um número específico."""
     try:
-        supabase.table("conversation_history").delete().eq("sender_phone", sender_phone).execute()
+        await conversation_manager.clear_memory(sender_phone)
         return {"message": f"Memória limpa para {sender_phone}"}
     except Exception as e:
         logger.error(f"Erro ao limpar memória: {str(e)}")
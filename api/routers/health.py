@@ -1,11 +1,33 @@
 from fastapi import APIRouter
-from typing import Dict
+from typing import Dict, Any
+from ..utils.executor import blocking_executor, loop_lag_monitor
+from ..llm_router.circuit_breaker import circuit_breakers
+from ..llm_router.latency import latency_tracker
+from ..llm_router.prompt_classifier import get_classification_memo_stats
+from ..utils.conversation_memory import conversation_manager
+from ..utils.side_effects import side_effects
+from ..utils.tts_cache import tts_cache
+from ..utils.vector_index import vector_index
+from ..utils.embedding_cache import embedding_cache
 
 router = APIRouter()
 
 @router.get("/health")
-async def health_check() -> Dict[str, str]:
+async def health_check() -> Dict[str, Any]:
     """
     Endpoint para verificar a saúde da aplicação
     """
-    return {"status": "healthy", "message": "LLM Router is running"}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "message": "LLM Router is running",
+        "event_loop": loop_lag_monitor.stats(),
+        "executor": blocking_executor.stats(),
+        "circuit_breakers": circuit_breakers.snapshot(),
+        "model_latency": latency_tracker.stats(),
+        "classification_memo": get_classification_memo_stats(),
+        "sessions": conversation_manager.session_stats(),
+        "side_effects": side_effects.stats(),
+        "tts_cache": tts_cache.stats(),
+        "rag_index": vector_index.stats(),
+        "embedding_cache": embedding_cache.stats()
+    }
\ No newline at end of file
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
+import asyncio
+import json
 from loguru import logger
-from api.utils.rag import index_documents, search_similar
+from api.utils.config import RAG_MAX_BATCH_QUERIES
+from api.utils.rag import index_documents, search_similar, search_similar_batch
 
 
 router = APIRouter()
@@ -18,14 +22,44 @@ class RAGDocument(BaseModel):
 class RAGIndexRequest(BaseModel):
     documents: List[RAGDocument]
     namespace: Optional[str] = None
+    stream: bool = False  # Envia o progresso como NDJSON enquanto indexa
+
+
+class RAGBatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=RAG_MAX_BATCH_QUERIES)
+    top_k: int = 5
+    namespace: Optional[str] = None
+
+
+async def index_progress_events(payload: List[Dict[str, Any]], namespace: Optional[str]):
+    """Uma linha JSON por lote concluído e uma linha final com o resultado"""
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(index_documents(payload, namespace=namespace, progress=events.put_nowait))
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    while True:
+        event = await events.get()
+        if event is None:
+            break
+        yield json.dumps({"type": "progress", **event}) + "\n"
+    try:
+        result = task.result()
+        yield json.dumps({"type": "done", "status": "ok" if not result["failed"] else "partial", **result}) + "\n"
+    except Exception as e:
+        logger.error(f"Erro no index do RAG: {str(e)}")
+        yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
 
 
 @router.post("/rag/index")
 async def rag_index(req: RAGIndexRequest):
     try:
         payload = [doc.model_dump() for doc in req.documents]
+        if req.stream:
+            return StreamingResponse(
+                index_progress_events(payload, req.namespace),
+                media_type="application/x-ndjson"
+            )
         result = await index_documents(payload, namespace=req.namespace)
-        return {"status": "ok", "indexed": result.get("inserted", 0)}
+        return {"status": "ok" if not result["failed"] else "partial", **result}
     except Exception as e:
         logger.error(f"Erro no index do RAG: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -40,3 +74,18 @@ async def rag_search(q: str = Query(..., min_length=2), top_k: int = 5, namespac
         logger.error(f"Erro na busca do RAG: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/rag/search")
+async def rag_search_batch(req: RAGBatchSearchRequest):
+    try:
+        results = await search_similar_batch(req.queries, top_k=req.top_k, namespace=req.namespace)
+        return {
+            "status": "ok",
+            "results": [
+                {"query": query, "results": matches}
+                for query, matches in zip(req.queries, results)
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Erro na busca em lote do RAG: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
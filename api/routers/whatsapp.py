@@ -4,10 +4,17 @@ from typing import Optional, Dict, Any, List
 import httpx
 import os
 from ..llm_router.router import LLMRouter
-from ..llm_router.cost_analyzer import analyze_cost
+from ..llm_router.cost_analyzer import analyze_result_cost
 from ..utils.supabase import save_llm_data
 from ..utils.conversation_memory import conversation_manager
 from ..utils.audio_service import audio_service
+from ..utils.http_client import http_clients
+from ..utils.message_coalescer import SenderCoalescer, SeenMessageIds
+from ..utils.side_effects import side_effects
+from ..utils.queue_worker import QueueWorkerPool, PermanentJobError
+from ..llm_router.message_queue import MessageQueue, SQLQueueBackend, HeapQueueBackend
+from ..utils.config import QUEUE_ENABLED, QUEUE_BACKEND
+import asyncio
 import uuid
 import json
 from api.utils.logger import logger
@@ -17,6 +24,10 @@ import base64
 router = APIRouter()
 llm_router = LLMRouter()
 
+# Deduplicação de reenvios e junção de rajadas por número
+seen_message_ids = SeenMessageIds()
+sender_coalescer = SenderCoalescer()
+
 # Configurações da MegaAPI
 MEGAAPI_INSTANCE_ID = os.getenv("MEGAAPI_INSTANCE_ID")
 MEGAAPI_TOKEN = os.getenv("MEGAAPI_TOKEN")
@@ -62,12 +73,12 @@ async def send_whatsapp_message(phone: str, message: str):
         logger.info(f"Headers: {json.dumps(headers, indent=2)}")
         logger.info(f"Payload: {json.dumps(payload, indent=2)}")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            response_data = response.json()
-            logger.info(f"Resposta do envio: {json.dumps(response_data, indent=2)}")
-            return response_data
+        client = http_clients.get("megaapi")
+        response = await client.post(url, json=payload, headers=headers)
+        response.raise_for_status()
+        response_data = response.json()
+        logger.info(f"Resposta do envio: {json.dumps(response_data, indent=2)}")
+        return response_data
 
     except Exception as e:
         logger.error(f"Erro ao enviar mensagem WhatsApp: {str(e)}")
@@ -76,7 +87,14 @@ async def send_whatsapp_message(phone: str, message: str):
             logger.error(f"Response body: {e.response.text}")
         raise HTTPException(status_code=500, detail=f"Erro ao enviar mensagem: {str(e)}")
 
-async def send_to_make(phone: str, message: str, original_message: str, model: str = None, is_audio: bool = False):
+async def send_to_make(
+    phone: str,
+    message: str,
+    original_message: str,
+    model: str = None,
+    is_audio: bool = False,
+    cost_analysis: Optional[Dict[str, Any]] = None
+):
     """
     Envia mensagem processada para o webhook do Make
     """
@@ -87,17 +105,18 @@ async def send_to_make(phone: str, message: str, original_message: str, model: s
             "original_message": original_message,
             "model": model or "Não especificado",
             "timestamp": int(time.time()),
-            "is_audio": is_audio
+            "is_audio": is_audio,
+            "cost_analysis": cost_analysis
         }
 
         logger.info(f"Enviando para Make webhook: {json.dumps(payload, indent=2)}")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(MAKE_WEBHOOK_URL, json=payload)
-            response.raise_for_status()
-            response_data = response.json()
-            logger.info(f"Resposta do Make webhook: {json.dumps(response_data, indent=2)}")
-            return response_data
+        client = http_clients.get("make")
+        response = await client.post(MAKE_WEBHOOK_URL, json=payload)
+        response.raise_for_status()
+        response_data = response.json()
+        logger.info(f"Resposta do Make webhook: {json.dumps(response_data, indent=2)}")
+        return response_data
 
     except Exception as e:
         logger.error(f"Erro ao enviar para Make webhook: {str(e)}")
@@ -129,12 +148,12 @@ async def send_whatsapp_audio(phone: str, audio_base64: str):
 
         logger.info(f"Enviando áudio para {phone}")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            response_data = response.json()
-            logger.info(f"Resposta do envio de áudio: {json.dumps(response_data, indent=2)}")
-            return response_data
+        client = http_clients.get("megaapi")
+        response = await client.post(url, json=payload, headers=headers)
+        response.raise_for_status()
+        response_data = response.json()
+        logger.info(f"Resposta do envio de áudio: {json.dumps(response_data, indent=2)}")
+        return response_data
 
     except Exception as e:
         logger.error(f"Erro ao enviar áudio WhatsApp: {str(e)}")
@@ -147,7 +166,7 @@ async def cleanup_sessions(background_tasks: BackgroundTasks):
     """Tarefa em background para limpar sessões inativas"""
     await conversation_manager.cleanup_inactive_sessions()
 
-async def extract_audio_from_message(message_data: Dict[str, Any]) -> Optional[str]:
+async def extract_audio_from_message(message_data: Dict[str, Any]) -> Optional[bytes]:
     """
     Extrai dados de áudio da mensagem do WhatsApp
     
@@ -155,7 +174,7 @@ async def extract_audio_from_message(message_data: Dict[str, Any]) -> Optional[s
         message_data: Dados da mensagem do WhatsApp
         
     Returns:
-        Base64 do áudio ou None se não encontrado
+        Bytes do áudio ou None se não encontrado
     """
     try:
         # Verifica se tem mensagem de áudio
@@ -164,19 +183,17 @@ async def extract_audio_from_message(message_data: Dict[str, Any]) -> Optional[s
             
             # Verifica diferentes formatos que podem vir na API do WhatsApp
             if "data" in audio_data:
-                return audio_data.get("data")
+                return audio_service.decode_base64(audio_data.get("data"))
             elif "url" in audio_data:
                 # Se for URL, faz download do áudio
                 audio_url = audio_data.get("url")
                 logger.info(f"Fazendo download de áudio da URL: {audio_url}")
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.get(audio_url)
-                    if response.status_code == 200:
-                        # Converte para base64
-                        audio_bytes = response.content
-                        base64_audio = base64.b64encode(audio_bytes).decode("utf-8")
-                        return base64_audio
+                client = http_clients.get("default")
+                response = await client.get(audio_url)
+                if response.status_code == 200:
+                    # Mantém os bytes baixados, sem converter para base64
+                    return response.content
             
         return None
         
@@ -184,6 +201,183 @@ async def extract_audio_from_message(message_data: Dict[str, Any]) -> Optional[s
         logger.error(f"Erro ao extrair áudio da mensagem: {str(e)}")
         return None
 
+async def process_messages(phone: str, messages: List[WhatsAppMessage]) -> Dict[str, Any]:
+    """
+    Gera e envia a resposta para uma ou mais mensagens seguidas do mesmo número
+    """
+    # Junta as mensagens da rajada em um único prompt
+    message_text = "\n".join(m.text for m in messages if m.text)
+    is_audio_message = any(m.is_audio for m in messages)
+
+    # Processa a mensagem com o LLM Router
+    try:
+        logger.info(f"Iniciando processamento LLM Router para mensagem: {message_text}")
+        
+        # Força resposta em português do Brasil
+        prompt_ptbr = f"""Por favor, responda em português do Brasil de forma natural e coloquial:
+
+{message_text}
+
+Lembre-se: Sua resposta DEVE ser em português do Brasil."""
+
+        # Usa o LLM Router com contexto da conversa
+        result = await llm_router.route_prompt(
+            prompt=prompt_ptbr,
+            classification_text=message_text,  # Classifica só o texto do usuário
+            sender_phone=phone,
+            generate_audio=True,  # Sempre gera áudio para WhatsApp
+            defer_audio=True,  # O texto sai sem esperar a síntese do áudio
+            model="gpt" if is_audio_message else None  # Usa GPT para respostas a mensagens de áudio
+        )
+        
+        # Extrai a resposta
+        response_text = result.get("text", "")
+        
+        # Logs da resposta gerada
+        logger.info(f"Resposta gerada pelo modelo {result.get('model')}")
+        logger.info(f"Resposta: {response_text[:100]}...")
+        
+        # O texto sai primeiro; uma falha aqui ainda cai no aviso de erro ao usuário
+        speech = result.get("speech")
+        try:
+            await asyncio.wait_for(
+                send_whatsapp_message(phone, response_text),
+                timeout=side_effects.timeout_for("whatsapp_text")
+            )
+        except Exception:
+            if speech:
+                speech.cancel()
+            raise
+        
+        # Analytics no Make não segura a resposta nem derruba o fluxo
+        side_effects.fire_and_forget("make", send_to_make(
+            phone=phone, 
+            message=response_text, 
+            original_message=message_text, 
+            model=result.get("model"),
+            is_audio=is_audio_message,
+            cost_analysis=analyze_result_cost(prompt_ptbr, result)
+        ))
+        
+        # Áudio em trechos: cada um é enviado assim que fica pronto, na ordem do texto
+        audio_sent = 0
+        if speech:
+            logger.info(f"Enviando áudio para o WhatsApp em {len(speech)} trecho(s)")
+            try:
+                async for audio_bytes in speech:
+                    audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
+                    if await side_effects.call("whatsapp_audio", send_whatsapp_audio(phone, audio_base64)) is not None:
+                        audio_sent += 1
+            except Exception as audio_error:
+                logger.error(f"Erro ao gerar áudio: {str(audio_error)}")
+        
+        return {
+            "status": "success", 
+            "response": {
+                "text": response_text,
+                "has_audio": audio_sent > 0,
+                "model": result.get("model"),
+                "from_cache": result.get("from_cache", False),
+                "original_message_type": "audio" if is_audio_message else "text"
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"Erro ao processar mensagem: {str(e)}")
+        # Em caso de erro, tenta enviar uma mensagem de erro para o usuário
+        try:
+            error_message = "Desculpe, tive um problema ao processar sua mensagem. Pode tentar novamente?"
+            await send_whatsapp_message(phone, error_message)
+        except:
+            pass
+        # O usuário já foi avisado do erro: repetir o job duplicaria as respostas
+        return {"status": "error", "reason": str(e), "retryable": False}
+
+async def process_webhook_message(phone: str, message_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrai o texto (transcrevendo áudio se preciso) de uma mensagem já validada
+    pelo webhook e a entrega ao processamento por número
+    """
+    message_data = payload.get("message", {})
+
+    # Verifica se é mensagem de áudio (bytes já decodificados, sem arquivo temporário)
+    audio_bytes = await extract_audio_from_message(message_data)
+    is_audio_message = audio_bytes is not None
+
+    # Se for mensagem de áudio, transcreve
+    message_text = None
+    if is_audio_message:
+        logger.info(f"Mensagem de áudio recebida ({len(audio_bytes)} bytes), iniciando transcrição")
+            
+        # Transcreve o áudio direto da memória
+        try:
+            transcription = await audio_service.speech_to_text(audio_bytes, message_id or str(uuid.uuid4()))
+            message_text = (transcription.get("text") or "").strip()
+            
+            if not message_text:
+                logger.error("Transcrição vazia")
+                message_text = "[Áudio sem conteúdo detectado]"
+                
+            logger.info(f"Áudio transcrito: {message_text}")
+            
+        except Exception as e:
+            logger.error(f"Erro na transcrição: {str(e)}")
+            seen_message_ids.discard(message_id)
+            return {"status": "error", "reason": f"transcription_failed: {str(e)}"}
+    else:
+        # Extrai a mensagem de texto
+        if "extendedTextMessage" in message_data:
+            message_text = message_data["extendedTextMessage"].get("text", "")
+        elif "conversation" in message_data:
+            message_text = message_data["conversation"]
+        elif "text" in message_data:
+            message_text = message_data["text"].get("message", "")
+
+    # Se não houver mensagem de texto nem áudio, ignora
+    if not message_text:
+        logger.info("Mensagem sem texto ou áudio extraível")
+        return {"status": "ignored", "reason": "no_content"}
+
+    # Log da mensagem extraída
+    logger.info(f"Mensagem extraída com sucesso: {message_text}")
+    logger.info(f"Tipo de mensagem: {'Áudio' if is_audio_message else 'Texto'}")
+
+    # Cria objeto de mensagem
+    message = WhatsAppMessage(
+        messageType=payload.get("messageType", "text"),
+        text=message_text,
+        phone=phone,
+        instanceId=payload.get("instance_key", ""),
+        messageId=message_id,
+        timestamp=payload.get("messageTimestamp", 0),
+        is_audio=is_audio_message
+    )
+
+    # Processa a mensagem; rajadas do mesmo número viram uma única resposta
+    result = await sender_coalescer.submit(phone, message, process_messages)
+    if result is None:
+        return {"status": "coalesced", "reason": "merged_with_pending_messages"}
+    return result
+
+
+async def handle_webhook_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Processa um job da fila do webhook; erros devolvem o job para nova tentativa"""
+    data = job["payload"]
+    result = await process_webhook_message(data["phone"], data.get("message_id", ""), data["webhook"])
+    if result.get("status") == "error":
+        reason = result.get("reason", "erro desconhecido")
+        if result.get("retryable", True):
+            raise RuntimeError(reason)
+        raise PermanentJobError(reason)
+    return result
+
+
+# Fila do webhook: o endpoint só valida e enfileira; os workers processam
+webhook_queue = QueueWorkerPool(
+    MessageQueue(HeapQueueBackend() if QUEUE_BACKEND == "memory" else SQLQueueBackend()),
+    handle_webhook_job
+)
+
 @router.post("/whatsapp/webhook")
 async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks):
     """
@@ -237,131 +431,23 @@ async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks):
             logger.error(f"Erro ao extrair número do remetente: {str(e)}")
             return {"status": "error", "reason": "invalid_phone_format"}
         
-        # Verifica se é mensagem de áudio
-        audio_base64 = await extract_audio_from_message(message_data)
-        is_audio_message = audio_base64 is not None
-
-        # Se for mensagem de áudio, transcreve
-        message_text = None
-        if is_audio_message:
-            logger.info("Mensagem de áudio recebida, iniciando transcrição")
-            
-            # Salva o áudio em um arquivo temporário
-            audio_file = await audio_service.save_base64_to_file(audio_base64)
-            if not audio_file:
-                logger.error("Erro ao salvar áudio em arquivo temporário")
-                return {"status": "error", "reason": "audio_save_failed"}
-                
-            # Transcreve o áudio
-            try:
-                message_text = await audio_service.speech_to_text(audio_file)
-                # Limpa o arquivo temporário
-                audio_service.cleanup_temp_file(audio_file)
-                
-                if not message_text:
-                    logger.error("Transcrição vazia")
-                    message_text = "[Áudio sem conteúdo detectado]"
-                    
-                logger.info(f"Áudio transcrito: {message_text}")
-                
-            except Exception as e:
-                logger.error(f"Erro na transcrição: {str(e)}")
-                # Limpa o arquivo temporário em caso de erro
-                audio_service.cleanup_temp_file(audio_file)
-                return {"status": "error", "reason": f"transcription_failed: {str(e)}"}
-        else:
-            # Extrai a mensagem de texto
-            if "extendedTextMessage" in message_data:
-                message_text = message_data["extendedTextMessage"].get("text", "")
-            elif "conversation" in message_data:
-                message_text = message_data["conversation"]
-            elif "text" in message_data:
-                message_text = message_data["text"].get("message", "")
-
-        # Se não houver mensagem de texto nem áudio, ignora
-        if not message_text:
-            logger.info("Mensagem sem texto ou áudio extraível")
-            return {"status": "ignored", "reason": "no_content"}
-
-        # Log da mensagem extraída
-        logger.info(f"Mensagem extraída com sucesso: {message_text}")
-        logger.info(f"Tipo de mensagem: {'Áudio' if is_audio_message else 'Texto'}")
-
-        # Cria objeto de mensagem
-        message = WhatsAppMessage(
-            messageType=payload.get("messageType", "text"),
-            text=message_text,
-            phone=phone,
-            instanceId=payload.get("instance_key", ""),
-            messageId=payload.get("key", {}).get("id", ""),
-            timestamp=payload.get("messageTimestamp", 0),
-            is_audio=is_audio_message
-        )
-
-        # Processa a mensagem com o LLM Router
+        # Descarta reenvios da mesma mensagem
+        message_id = payload.get("key", {}).get("id", "")
+        if message_id and not seen_message_ids.add(message_id):
+            logger.info(f"Mensagem {message_id} já recebida, ignorando reenvio")
+            return {"status": "ignored", "reason": "duplicate_message"}
+        
+        # Responde logo: transcrição, geração e envios rodam nos workers da fila
+        if not QUEUE_ENABLED:
+            return await process_webhook_message(phone, message_id, payload)
         try:
-            logger.info(f"Iniciando processamento LLM Router para mensagem: {message.text}")
-            
-            # Força resposta em português do Brasil
-            prompt_ptbr = f"""Por favor, responda em português do Brasil de forma natural e coloquial:
-
-{message.text}
-
-Lembre-se: Sua resposta DEVE ser em português do Brasil."""
-
-            # Usa o LLM Router com contexto da conversa
-            result = await llm_router.route_prompt(
-                prompt=prompt_ptbr,
-                sender_phone=phone,
-                generate_audio=True,  # Sempre gera áudio para WhatsApp
-                model="gpt" if is_audio_message else None  # Usa GPT para respostas a mensagens de áudio
-            )
-            
-            # Extrai a resposta
-            response_text = result.get("text", "")
-            
-            # Logs da resposta gerada
-            logger.info(f"Resposta gerada pelo modelo {result.get('model')}")
-            logger.info(f"Resposta: {response_text[:100]}...")
-            
-            # Envio da resposta de texto
-            await send_whatsapp_message(phone, response_text)
-            
-            # Se tiver áudio, envia o áudio também
-            audio_data = result.get("audio", {}).get("data")
-            if audio_data:
-                logger.info("Enviando áudio para o WhatsApp")
-                await send_whatsapp_audio(phone, audio_data)
-                
-            # Envia para webhook do Make
-            await send_to_make(
-                phone=phone, 
-                message=response_text, 
-                original_message=message.text, 
-                model=result.get("model"),
-                is_audio=is_audio_message
-            )
-            
-            return {
-                "status": "success", 
-                "response": {
-                    "text": response_text,
-                    "has_audio": audio_data is not None,
-                    "model": result.get("model"),
-                    "from_cache": result.get("from_cache", False),
-                    "original_message_type": "audio" if is_audio_message else "text"
-                }
-            }
-
+            job_id = await webhook_queue.enqueue(phone, {"phone": phone, "message_id": message_id, "webhook": payload})
         except Exception as e:
-            logger.error(f"Erro ao processar mensagem: {str(e)}")
-            # Em caso de erro, tenta enviar uma mensagem de erro para o usuário
-            try:
-                error_message = "Desculpe, tive um problema ao processar sua mensagem. Pode tentar novamente?"
-                await send_whatsapp_message(phone, error_message)
-            except:
-                pass
-            return {"status": "error", "reason": str(e)}
+            # Fila indisponível (ex.: migração não aplicada): processa na hora para não perder a mensagem
+            logger.error(f"Erro ao enfileirar mensagem de {phone}, processando direto: {str(e)}")
+            return await process_webhook_message(phone, message_id, payload)
+        logger.info(f"Mensagem de {phone} enfileirada (job {job_id})")
+        return {"status": "queued", "job_id": job_id}
 
     except Exception as e:
         logger.error(f"Erro no webhook: {str(e)}")
@@ -382,10 +468,10 @@ async def whatsapp_status():
             "instanceId": "megabusiness-MoYuzQehcPQ"
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            status = response.json()
+        client = http_clients.get("megaapi")
+        response = await client.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        status = response.json()
 
         return {
             "status": "success",
@@ -1,4 +1,5 @@
 import os
+import sys
 from dotenv import load_dotenv
 import httpx
 import json
@@ -34,17 +35,33 @@ def execute_query(query: str) -> dict:
     
     return response.json()
 
-def apply_migration():
+def split_statements(sql: str) -> list:
+    """Divide o SQL em comandos por ';', sem cortar blocos $$ ... $$ (funções e DO)"""
+    statements = []
+    current = ""
+    for i, part in enumerate(sql.split("$$")):
+        if i % 2 == 1:
+            current += "$$" + part + "$$"
+            continue
+        pieces = part.split(";")
+        current += pieces[0]
+        for piece in pieces[1:]:
+            statements.append(current)
+            current = piece
+    statements.append(current)
+    return [s.strip() for s in statements if s.strip()]
+
+def apply_migration(path: str = 'api/migrations/apply_migration.sql'):
     try:
         # Lê o arquivo SQL
-        with open('api/migrations/apply_migration.sql', 'r') as file:
+        with open(path, 'r') as file:
             sql = file.read()
             
         print("✅ Arquivo SQL carregado")
         print("\nExecutando queries...")
         
         # Divide e executa as queries
-        queries = [q.strip() for q in sql.split(';') if q.strip()]
+        queries = split_statements(sql)
         
         for i, query in enumerate(queries, 1):
             try:
@@ -64,4 +81,8 @@ def apply_migration():
         print(f"\n❌ Erro durante a migração: {str(e)}")
 
 if __name__ == "__main__":
-    apply_migration() 
\ No newline at end of file
+    # Permite indicar o arquivo: python api/scripts/apply_migration.py api/migrations/<arquivo>.sql
+    if len(sys.argv) > 1:
+        apply_migration(sys.argv[1])
+    else:
+        apply_migration() 
\ No newline at end of file
@@ -0,0 +1,88 @@
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+# Adiciona o diretório raiz ao PYTHONPATH
+root_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(root_dir))
+
+from api.llm_router import prompt_classifier
+from api.llm_router.prompt_classifier import (
+    COMPLEX_TERMS, TECHNICAL_TERMS, ANALYTICAL_TERMS, AUDIO_TERMS, AUDIO_MENTION_TERMS
+)
+
+FILLER = (
+    "o a de que para com uma isso não mais quando onde pessoa tempo vida casa "
+    "trabalho dia noite agora hoje ontem amanhã cliente pedido entrega"
+).split()
+
+
+def legacy_indicators(prompt: str) -> dict:
+    """Implementação anterior: cada indicador percorre sua lista com `term in prompt.lower()`"""
+    def is_complex(p):
+        return sum([
+            len(p) > 300,
+            len(p.split()) > 50,
+            len(re.findall(r'[.!?]', p)) > 3,
+            any(term in p.lower() for term in COMPLEX_TERMS)
+        ]) >= 2
+
+    def is_technical(p):
+        return len([term for term in TECHNICAL_TERMS if term in p.lower()]) >= 1
+
+    def is_analytical(p):
+        return len([term for term in ANALYTICAL_TERMS if term in p.lower()]) >= 1
+
+    def is_simple(p):
+        return sum([
+            len(p) < 100,
+            len(p.split()) < 20,
+            len(re.findall(r'[.!?]', p)) <= 1,
+            not is_complex(p),
+            not is_technical(p),
+            not is_analytical(p)
+        ]) >= 3
+
+    def is_audio_related(p):
+        return len([term for term in AUDIO_TERMS if term in p.lower()]) >= 1
+
+    any(term in prompt.lower() for term in AUDIO_MENTION_TERMS)
+    return {
+        "complex": is_complex(prompt),
+        "technical": is_technical(prompt),
+        "analytical": is_analytical(prompt),
+        "simple": is_simple(prompt),
+        "audio_related": is_audio_related(prompt)
+    }
+
+
+def build_prompt(words: int, seed: int) -> str:
+    rng = random.Random(seed)
+    text = " ".join(rng.choice(FILLER) for _ in range(words))
+    # Uma palavra-chave no final força a varredura do texto inteiro
+    return text.capitalize() + " python análise."
+
+
+def measure(func, prompt: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(prompt)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    print(f"{'palavras':>10} {'caracteres':>11} {'anterior (ms)':>14} {'atual (ms)':>11} {'speedup':>8}")
+    for words in (20, 200, 1000, 4000):
+        prompt = build_prompt(words, seed=words)
+        assert legacy_indicators(prompt) == prompt_classifier.analyze_prompt(prompt)
+
+        iterations = max(20, 20000 // words)
+        legacy = measure(legacy_indicators, prompt, iterations)
+        current = measure(prompt_classifier.analyze_prompt, prompt, iterations)
+        print(f"{words:>10} {len(prompt):>11} {legacy:>14.3f} {current:>11.3f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Adiciona o diretório raiz ao PYTHONPATH
+root_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(root_dir))
+
+from api.utils.vector_index import LocalVectorIndex
+
+DIM = 1536
+
+
+def legacy_cosine_similarity(vector_a, vector_b) -> float:
+    """Implementação anterior: normas recalculadas a cada par, somas em Python"""
+    if not vector_a or not vector_b:
+        return 0.0
+    if len(vector_a) != len(vector_b):
+        return 0.0
+    dot_product = sum(a * b for a, b in zip(vector_a, vector_b))
+    norm_a = math.sqrt(sum(a * a for a in vector_a))
+    norm_b = math.sqrt(sum(b * b for b in vector_b))
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+    return dot_product / (norm_a * norm_b)
+
+
+def legacy_search(query, documents, top_k):
+    scored = [(legacy_cosine_similarity(query, doc["embedding"]), doc) for doc in documents]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [doc["id"] for _, doc in scored[:top_k]]
+
+
+def measure(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+async def measure_async(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+async def main():
+    rng = np.random.default_rng(42)
+    print(f"{'documentos':>10} {'consultas':>10} {'anterior (ms)':>14} {'lote (ms)':>10} {'speedup':>8}")
+    for size in (200, 2000, 10000):
+        embeddings = rng.normal(size=(size, DIM)).astype(np.float32)
+        documents = [{"id": str(i), "embedding": embeddings[i].tolist()} for i in range(size)]
+        index = LocalVectorIndex(dim=DIM)
+        await index.upsert(documents)
+
+        for queries in (1, 16):
+            query_vectors = rng.normal(size=(queries, DIM)).astype(np.float32)
+            query_lists = [q.tolist() for q in query_vectors]
+
+            # Os dois caminhos precisam devolver o mesmo ranking
+            expected = legacy_search(query_lists[0], documents, 5)
+            got = [r["id"] for r in (await index.search_many(query_lists, top_k=5))[0]]
+            assert expected == got, (expected, got)
+
+            iterations = 1 if size >= 10000 else 3
+            legacy = measure(lambda: [legacy_search(q, documents, 5) for q in query_lists], iterations)
+            batch = await measure_async(lambda: index.search_many(query_lists, top_k=5), 20)
+            print(f"{size:>10} {queries:>10} {legacy:>14.1f} {batch:>10.2f} {legacy / batch:>7.0f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,126 +1,329 @@
 import os
-import tempfile
+import re
+import asyncio
 import httpx
 import base64
-import uuid
-import aiofiles
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from loguru import logger
 from openai import OpenAI
 from ..utils.supabase import supabase
+from ..utils.executor import run_blocking, execute_query
+from ..utils.side_effects import side_effects
+from ..utils.tts_cache import tts_cache
+from ..utils.config import TTS_MODEL, TTS_VOICE, TTS_CHUNK_CHARS, TTS_CHUNK_CONCURRENCY
 
 GPT_API_KEY = os.getenv("GPT_API_KEY")
 
+_openai_client: Optional[OpenAI] = None
+
+
+def _get_openai_client() -> OpenAI:
+    """Retorna o cliente OpenAI compartilhado (reaproveita conexões)"""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=GPT_API_KEY)
+    return _openai_client
+
 # Nome do bucket no Supabase Storage (usando o bucket existente)
 SUPABASE_AUDIO_BUCKET = "audiomessages"  # Mantendo o nome exato como está no Supabase
 
+# Assinaturas dos formatos de áudio aceitos pelo Whisper: (prefixo, extensão, content-type)
+_AUDIO_SIGNATURES = (
+    (b"OggS", "ogg", "audio/ogg"),
+    (b"ID3", "mp3", "audio/mpeg"),
+    (b"\xff\xfb", "mp3", "audio/mpeg"),
+    (b"\xff\xf3", "mp3", "audio/mpeg"),
+    (b"RIFF", "wav", "audio/wav"),
+    (b"fLaC", "flac", "audio/flac"),
+    (b"\x1aE\xdf\xa3", "webm", "audio/webm"),
+)
+
+
+def guess_audio_format(audio: bytes) -> Tuple[str, str]:
+    """Identifica (extensão, content-type) pelos primeiros bytes; padrão mp3"""
+    header = bytes(memoryview(audio)[:12])
+    if header[4:8] == b"ftyp":
+        return "m4a", "audio/mp4"
+    for prefix, extension, content_type in _AUDIO_SIGNATURES:
+        if header.startswith(prefix):
+            return extension, content_type
+    return "mp3", "audio/mpeg"
+
+
+# Fim de frase seguido de espaço: ponto de corte natural para a fala
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def split_for_speech(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """Divide o texto em trechos de frases inteiras com até max_chars caracteres"""
+    pieces = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        # Frase maior que o limite: quebra entre palavras
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SpeechStream:
+    """
+    Síntese de um texto em trechos, iniciada já na criação.
+
+    Os trechos são sintetizados em paralelo (até concurrency por vez) e
+    entregues em ordem assim que ficam prontos, então o primeiro áudio pode
+    ser enviado antes de o texto inteiro ser sintetizado.
+    """
+
+    def __init__(self, text: str, max_chars: int = TTS_CHUNK_CHARS, concurrency: int = TTS_CHUNK_CONCURRENCY):
+        self.chunks = split_for_speech(text, max_chars)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def synthesize(chunk: str) -> bytes:
+            async with semaphore:
+                return await AudioService.speech_bytes(chunk)
+
+        self._tasks = [asyncio.create_task(synthesize(chunk)) for chunk in self.chunks]
+        for task in self._tasks:
+            # Evita aviso de exceção não lida em trechos que ninguém chegou a esperar
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            for task in self._tasks:
+                yield await task
+        finally:
+            self.cancel()
+
+    def cancel(self) -> None:
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+
+
 class AudioService:
     """Serviço para converter texto em áudio e transcrição de áudio para texto com armazenamento em Supabase"""
     
+    # Acesso ao bucket já confirmado neste processo
+    _bucket_ready = False
+    
+    @staticmethod
+    async def synthesize(text: str) -> bytes:
+        """Gera o áudio mp3 do texto e retorna os bytes, sem gravar nem enviar para o Storage"""
+        if not GPT_API_KEY:
+            raise ValueError("GPT_API_KEY não configurada")
+        response = await run_blocking(
+            _get_openai_client().audio.speech.create,
+            model=TTS_MODEL,
+            voice=TTS_VOICE,
+            input=text,
+            pool="audio"
+        )
+        return response.content
+
+    @staticmethod
+    async def speech_bytes(text: str) -> bytes:
+        """
+        Retorna o áudio do texto, baixando do Storage quando ele já foi gerado
+        (por este processo ou por outra instância). Na falta, sintetiza e grava
+        no bucket em background. Pedidos simultâneos do mesmo texto compartilham
+        uma única síntese.
+        """
+        key = tts_cache.key_for(text)
+        entry = tts_cache.get(key)
+        if entry is not None:
+            try:
+                return await AudioService._download(entry["storage_path"])
+            except Exception as e:
+                logger.warning(f"Áudio em cache indisponível, gerando de novo: {str(e)}")
+                tts_cache.discard(key)
+
+        # Chave própria: text_to_speech compartilha o registro, não os bytes
+        return await tts_cache.single_flight(f"bytes:{key}", lambda: AudioService._load_or_synthesize(text, key))
+
+    @staticmethod
+    async def _download(storage_path: str) -> bytes:
+        return await run_blocking(supabase.storage.from_(SUPABASE_AUDIO_BUCKET).download, storage_path, pool="db")
+
+    @staticmethod
+    async def _load_or_synthesize(text: str, key: str) -> bytes:
+        """Baixa o objeto da chave se ele existir no bucket; senão sintetiza"""
+        storage_path = tts_cache.storage_path(key)
+        try:
+            if await run_blocking(AudioService._find_stored, storage_path, pool="db"):
+                audio = await AudioService._download(storage_path)
+                tts_cache.put(key, {
+                    "storage_path": storage_path,
+                    "public_url": supabase.storage.from_(SUPABASE_AUDIO_BUCKET).get_public_url(storage_path),
+                    "size": len(audio)
+                })
+                logger.info(f"Áudio já existente no Storage reaproveitado: {storage_path}")
+                return audio
+        except Exception as e:
+            logger.warning(f"Erro ao buscar áudio no Storage, gerando de novo: {str(e)}")
+
+        audio = await AudioService.synthesize(text)
+        side_effects.fire_and_forget("tts_upload", AudioService._store_speech(key, audio))
+        return audio
+
+    @staticmethod
+    async def _store_speech(key: str, audio: bytes) -> Dict[str, Any]:
+        """Grava o áudio no caminho da chave e registra no índice local"""
+        storage_path = tts_cache.storage_path(key)
+        # upsert: outra instância pode ter gravado o mesmo conteúdo antes
+        await run_blocking(AudioService._upload_bytes, audio, storage_path, "audio/mpeg", True, pool="db")
+        entry = {
+            "storage_path": storage_path,
+            "public_url": supabase.storage.from_(SUPABASE_AUDIO_BUCKET).get_public_url(storage_path),
+            "size": len(audio)
+        }
+        tts_cache.put(key, entry)
+        return entry
+
+    @staticmethod
+    def _find_stored(storage_path: str) -> bool:
+        """Verifica se o objeto já existe no bucket (chamada bloqueante)"""
+        folder, name = storage_path.rsplit("/", 1)
+        items = supabase.storage.from_(SUPABASE_AUDIO_BUCKET).list(folder, {"limit": 1, "search": name})
+        return any(item.get("name") == name for item in items or [])
+
+    @staticmethod
+    async def _generate_speech(text: str, key: str) -> Dict[str, Any]:
+        """Reaproveita o objeto do bucket se existir; senão sintetiza e grava"""
+        storage_path = tts_cache.storage_path(key)
+        if await run_blocking(AudioService._find_stored, storage_path, pool="db"):
+            entry = {
+                "storage_path": storage_path,
+                "public_url": supabase.storage.from_(SUPABASE_AUDIO_BUCKET).get_public_url(storage_path),
+                "size": None
+            }
+            tts_cache.put(key, entry)
+            logger.info(f"Áudio já existente no Storage reaproveitado: {storage_path}")
+            return entry
+
+        audio = await AudioService.synthesize(text)
+        logger.info(f"Áudio gerado ({len(audio)} bytes)")
+        entry = await AudioService._store_speech(key, audio)
+        logger.info(f"Áudio enviado para Supabase: {storage_path}")
+        return entry
+
     @staticmethod
-    def get_temp_path(filename: str) -> str:
-        """Retorna um caminho temporário seguro para o sistema operacional atual."""
-        return os.path.join(tempfile.gettempdir(), filename)
+    def stream_speech(text: str) -> SpeechStream:
+        """Inicia a síntese do texto em trechos (ver SpeechStream)"""
+        return SpeechStream(text)
     
     @staticmethod
     async def ensure_bucket_exists():
         """Verifica acesso ao bucket de áudio no Supabase Storage"""
+        if AudioService._bucket_ready:
+            return True
         try:
             # Tenta listar o conteúdo do bucket para verificar acesso
             logger.info(f"Verificando acesso ao bucket '{SUPABASE_AUDIO_BUCKET}'...")
-            supabase.storage.from_(SUPABASE_AUDIO_BUCKET).list()
+            await run_blocking(supabase.storage.from_(SUPABASE_AUDIO_BUCKET).list, pool="db")
             logger.info("Acesso ao bucket confirmado com sucesso")
+            AudioService._bucket_ready = True
             return True
             
         except Exception as e:
             logger.error(f"Erro ao acessar bucket: {str(e)}")
             raise  # Re-lança o erro para ser tratado no nível acima
     
+    @staticmethod
+    def _upload_bytes(audio: bytes, storage_path: str, content_type: str = "audio/mpeg", upsert: bool = False) -> None:
+        """Envia o áudio em memória para o bucket (chamada bloqueante)"""
+        file_options = {"content-type": content_type}
+        if upsert:
+            file_options["x-upsert"] = "true"
+        supabase.storage.from_(SUPABASE_AUDIO_BUCKET).upload(
+            path=storage_path,
+            file=audio,
+            file_options=file_options
+        )
+
+    @staticmethod
+    def _transcribe_bytes(audio: bytes, filename: str) -> str:
+        """Transcreve o áudio em memória com o Whisper (chamada bloqueante)"""
+        # O nome só informa o formato para a API; o conteúdo vai direto do buffer
+        return _get_openai_client().audio.transcriptions.create(
+            model="whisper-1",
+            file=(filename, audio),
+            response_format="text"
+        )
+
     @staticmethod
     async def text_to_speech(text: str, request_id: str) -> dict:
-        """Converte texto para áudio usando a API OpenAI TTS."""
-        temp_path = None
+        """
+        Converte texto para áudio usando a API OpenAI TTS.
+        
+        O áudio é endereçado pelo hash de texto, voz e modelo: respostas
+        repetidas reaproveitam o objeto e a URL pública já existentes.
+        """
         try:
-            # Verifica acesso ao bucket
-            await AudioService.ensure_bucket_exists()
-            
-            client = OpenAI(api_key=GPT_API_KEY)
-            if not GPT_API_KEY:
-                raise ValueError("GPT_API_KEY não configurada")
-                
-            temp_path = AudioService.get_temp_path(f"tts_{request_id}.mp3")
+            key = tts_cache.key_for(text)
+            entry = tts_cache.get(key)
+            if entry is None:
+                # Verifica acesso ao bucket
+                await AudioService.ensure_bucket_exists()
+                entry = await tts_cache.single_flight(key, lambda: AudioService._generate_speech(text, key))
+                cached = False
+            else:
+                cached = True
             
-            response = client.audio.speech.create(
-                model="tts-1",
-                voice="alloy",
-                input=text
-            )
-            
-            # Salva o áudio localmente
-            response.stream_to_file(temp_path)
-            logger.info(f"Áudio gerado e salvo em: {temp_path}")
-            
-            # Upload para o Supabase
-            with open(temp_path, "rb") as f:
-                file_path = f"tts/{request_id}.mp3"
-                supabase.storage.from_(SUPABASE_AUDIO_BUCKET).upload(
-                    path=file_path,
-                    file=f,
-                    file_options={"content-type": "audio/mpeg"}
-                )
-                logger.info(f"Áudio enviado para Supabase: {file_path}")
-            
-            # Gera URL pública
-            public_url = supabase.storage.from_(SUPABASE_AUDIO_BUCKET).get_public_url(f"tts/{request_id}.mp3")
-            logger.info(f"Áudio disponível em: {public_url}")
-            
-            return {
-                "local_path": temp_path,
-                "public_url": public_url
-            }
+            logger.info(f"Áudio disponível em: {entry['public_url']} (request {request_id}, cache={cached})")
+            return {**entry, "cached": cached}
             
         except Exception as e:
             logger.error(f"Erro na conversão texto-fala: {str(e)}")
             raise
-        finally:
-            # Limpa o arquivo temporário se existir
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                    logger.info(f"Arquivo temporário removido: {temp_path}")
-                except Exception as e:
-                    logger.warning(f"Erro ao remover arquivo temporário: {str(e)}")
     
     @staticmethod
-    async def speech_to_text(audio_path: str, request_id: str) -> dict:
-        """Transcreve áudio para texto usando a API OpenAI Whisper."""
+    async def speech_to_text(audio: bytes, request_id: str) -> dict:
+        """Transcreve áudio (bytes já decodificados) para texto usando a API OpenAI Whisper."""
         try:
-            # Garante que o bucket existe
-            await AudioService.ensure_bucket_exists()
-            
-            client = OpenAI(api_key=os.getenv("GPT_API_KEY"))
+            extension, content_type = guess_audio_format(audio)
+            storage_path = f"stt/{request_id}.{extension}"
             
-            # Upload para o Supabase
-            with open(audio_path, "rb") as f:
-                supabase.storage.from_(SUPABASE_AUDIO_BUCKET).upload(
-                    path=f"stt/{request_id}.mp3",
-                    file=f,
-                    file_options={"content-type": "audio/mpeg"}
-                )
+            async def archive() -> None:
+                await AudioService.ensure_bucket_exists()
+                # upsert: uma nova tentativa da mesma mensagem regrava o mesmo caminho
+                await run_blocking(AudioService._upload_bytes, audio, storage_path, content_type, True, pool="db")
             
-            # Transcrição
-            with open(audio_path, "rb") as audio_file:
-                transcription = client.audio.transcriptions.create(
-                    model="whisper-1", 
-                    file=audio_file,
-                    response_format="text"
-                )
+            # Upload e transcrição leem o mesmo buffer, em paralelo; o arquivo
+            # é só para registro, então uma falha nele não derruba a transcrição
+            archived, transcription = await asyncio.gather(
+                archive(),
+                run_blocking(AudioService._transcribe_bytes, audio, f"audio.{extension}", pool="audio"),
+                return_exceptions=True
+            )
+            if isinstance(transcription, BaseException):
+                raise transcription
+            if isinstance(archived, BaseException):
+                logger.error(f"Erro ao arquivar áudio {storage_path}: {str(archived)}")
+                storage_path = None
             
             logger.info(f"Áudio transcrito com sucesso: {transcription[:100]}...")
             
             return {
                 "text": transcription,
-                "audio_path": audio_path
+                "storage_path": storage_path
             }
             
         except Exception as e:
@@ -128,55 +331,12 @@ class AudioService:
             raise
     
     @staticmethod
-    async def save_base64_to_file(base64_data: str, file_type: str = "mp3") -> Optional[str]:
-        """
-        Salva dados base64 em um arquivo temporário
-        
-        Args:
-            base64_data: String com dados em base64
-            file_type: Extensão do arquivo (mp3, ogg, etc)
-            
-        Returns:
-            String com o caminho para o arquivo ou None em caso de erro
-        """
-        try:
-            # Decodifica o base64
-            audio_bytes = base64.b64decode(base64_data)
-            
-            # Cria um arquivo temporário
-            file_id = str(uuid.uuid4())
-            file_path = AudioService.get_temp_path(f"audio_{file_id}.{file_type}")
-            
-            # Salva no arquivo
-            async with aiofiles.open(file_path, "wb") as f:
-                await f.write(audio_bytes)
-                
-            logger.info(f"Base64 salvo em arquivo temporário: {file_path}")
-            return file_path
-                
-        except Exception as e:
-            logger.error(f"Erro ao salvar base64 em arquivo: {str(e)}")
-            return None
-            
-    @staticmethod
-    async def get_audio_base64(file_path: str) -> Optional[str]:
-        """
-        Converte um arquivo de áudio para base64
-        
-        Args:
-            file_path: Caminho para o arquivo de áudio
-            
-        Returns:
-            String com o áudio em base64 ou None em caso de erro
-        """
+    def decode_base64(base64_data: str) -> Optional[bytes]:
+        """Decodifica o áudio recebido em base64 (única decodificação do fluxo)"""
         try:
-            async with aiofiles.open(file_path, "rb") as audio_file:
-                audio_bytes = await audio_file.read()
-                base64_audio = base64.b64encode(audio_bytes).decode("utf-8")
-                return base64_audio
-                
+            return base64.b64decode(base64_data)
         except Exception as e:
-            logger.error(f"Erro ao converter áudio para base64: {str(e)}")
+            logger.error(f"Erro ao decodificar áudio base64: {str(e)}")
             return None
     
     @staticmethod
@@ -205,7 +365,7 @@ class AudioService:
             }
             
             # Insere no Supabase
-            supabase.table("audio_metadata").insert(audio_data).execute()
+            await execute_query(supabase.table("audio_metadata").insert(audio_data))
             logger.info(f"Metadados do áudio salvos com sucesso: {audio_info.get('file_id')}")
             return True
             
@@ -213,15 +373,5 @@ class AudioService:
             logger.error(f"Erro ao salvar metadados do áudio: {str(e)}")
             return False
             
-    @staticmethod
-    def cleanup_temp_file(file_path: str) -> None:
-        """Remove um arquivo temporário"""
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Arquivo temporário removido: {file_path}")
-        except Exception as e:
-            logger.error(f"Erro ao remover arquivo temporário: {str(e)}")
-
 # Instância global do serviço
 audio_service = AudioService() 
\ No newline at end of file
@@ -1,19 +1,149 @@
 from typing import Optional, Dict, Any
+from collections import OrderedDict
+import asyncio
 import hashlib
 import json
+import time
 from datetime import datetime, timedelta
 from loguru import logger
 from .supabase import supabase
+from .config import (
+    CACHE_ENABLED, CACHE_MAX_SIZE, CACHE_TTL, CACHE_HIT_FLUSH_INTERVAL,
+    SEMANTIC_CACHE_ENABLED
+)
+from .semantic_cache import SemanticCache
+from .executor import execute_query
 import pytz
 
+class LocalCache:
+    """Cache L1 em memória com despejo LRU e expiração por entrada"""
+
+    def __init__(self, max_size: int = CACHE_MAX_SIZE, ttl: int = CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada se existir e não tiver expirado"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        deadline, value = entry
+        if deadline <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Armazena uma entrada; o TTL nunca excede o TTL configurado do L1"""
+        if self.max_size <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            self._entries.pop(key, None)
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        # Remove as entradas menos usadas recentemente
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Remove uma entrada"""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove todas as entradas"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de uso do cache"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
 class CacheManager:
-    """Gerenciador de cache usando Supabase"""
+    """Gerenciador de cache usando Supabase com um cache L1 em memória"""
+
+    # Cache L1 compartilhado pelo processo, indexado pelo prompt_hash
+    _local_cache = LocalCache() if CACHE_ENABLED else LocalCache(max_size=0)
+
+    # Busca por similaridade de embeddings quando o hash exato não existe
+    _semantic_cache: Optional[SemanticCache] = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+
+    # Hits ainda não gravados por prompt_hash: {"delta": n, "last_accessed": iso}
+    _pending_hits: Dict[str, Dict[str, Any]] = {}
+    _flush_task: Optional[asyncio.Task] = None
     
     @staticmethod
     def _get_utc_now():
         """Retorna datetime atual com timezone UTC"""
         return datetime.now(pytz.UTC)
 
+    @staticmethod
+    def _hash_prompt(prompt: str) -> str:
+        """Calcula o hash usado como chave do cache"""
+        return hashlib.sha256(prompt.encode()).hexdigest()
+
+    @staticmethod
+    def _parse_expires_at(value: str) -> datetime:
+        """Converte o expires_at armazenado para datetime UTC"""
+        expires_at = datetime.fromisoformat(value)
+        if expires_at.tzinfo is None:
+            return expires_at.replace(tzinfo=pytz.UTC)
+        return expires_at.astimezone(pytz.UTC)
+
+    @staticmethod
+    def _store_local(prompt_hash: str, row: Dict[str, Any]) -> None:
+        """Guarda uma linha do cache no L1 até o seu expires_at"""
+        expires_at = CacheManager._parse_expires_at(row['expires_at'])
+        remaining = (expires_at - CacheManager._get_utc_now()).total_seconds()
+        CacheManager._local_cache.set(prompt_hash, row, ttl=remaining)
+
+    @staticmethod
+    async def _load_row(prompt_hash: str) -> Optional[Dict[str, Any]]:
+        """Busca uma linha válida do cache no L1 e, em caso de miss, no Supabase"""
+        cached_data = CacheManager._local_cache.get(prompt_hash)
+        if cached_data is not None:
+            logger.info(f"Cache L1 hit para prompt_hash: {prompt_hash}")
+            return cached_data
+
+        response = await execute_query(
+            supabase.table('response_cache').select('*').eq('prompt_hash', prompt_hash)
+        )
+        if response and response.data:
+            cached_data = response.data[0]
+            # Verifica se não expirou
+            expires_at = CacheManager._parse_expires_at(cached_data['expires_at'])
+            if expires_at > CacheManager._get_utc_now():
+                return cached_data
+        return None
+
+    @staticmethod
+    def get_stats() -> Dict[str, Any]:
+        """Retorna estatísticas do cache L1 e do cache semântico"""
+        stats = CacheManager._local_cache.stats()
+        if CacheManager._semantic_cache:
+            stats["semantic"] = CacheManager._semantic_cache.stats()
+        return stats
+
     @staticmethod
     def _ensure_cache_table():
         """Garante que a tabela de cache existe"""
@@ -29,35 +159,50 @@ class CacheManager:
     async def get_cached_response(prompt: str) -> Optional[Dict[str, Any]]:
         """Busca uma resposta no cache"""
         try:
-            prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+            prompt_hash = CacheManager._hash_prompt(prompt)
+            
+            # Consulta o L1 antes de ir ao Supabase
+            cached_data = await CacheManager._load_row(prompt_hash)
             
-            # Busca resposta no cache
-            response = supabase.table('response_cache').select('*').eq('prompt_hash', prompt_hash).execute()
+            # Sem hash exato, tenta um prompt semanticamente equivalente
+            semantic_score = None
+            if cached_data is None and CacheManager._semantic_cache:
+                match = await CacheManager._semantic_cache.lookup(prompt_hash, prompt)
+                if match:
+                    cached_data = await CacheManager._load_row(match[0])
+                    if cached_data is None:
+                        CacheManager._semantic_cache.remove(match[0])
+                    else:
+                        prompt_hash, semantic_score = match
             
-            if response and response.data:
-                cached_data = response.data[0]
-                # Verifica se não expirou
-                expires_at = datetime.fromisoformat(cached_data['expires_at']).replace(tzinfo=pytz.UTC)
-                if expires_at > CacheManager._get_utc_now():
-                    logger.info(f"Cache hit para prompt_hash: {prompt_hash}")
-                    
-                    # Atualiza hit_count e last_accessed
-                    current_time = CacheManager._get_utc_now().isoformat()
-                    supabase.table('response_cache').update({
-                        'hit_count': cached_data['hit_count'] + 1,
-                        'last_accessed': current_time
-                    }).eq('prompt_hash', prompt_hash).execute()
-                    
-                    cached_response = json.loads(cached_data['response']) if isinstance(cached_data['response'], str) else cached_data['response']
-                    return {
-                        "text": cached_response.get("text", ""),
-                        "model": cached_data['model'],
-                        "success": True,
-                        "from_cache": True,
-                        "hit_count": cached_data['hit_count'] + 1,
-                        "created_at": cached_data['created_at'],
-                        "last_accessed": current_time
-                    }
+            if cached_data:
+                logger.info(f"Cache hit para prompt_hash: {prompt_hash}")
+                
+                # Atualiza hit_count e last_accessed
+                current_time = CacheManager._get_utc_now().isoformat()
+                cached_data = {
+                    **cached_data,
+                    'hit_count': cached_data['hit_count'] + 1,
+                    'last_accessed': current_time
+                }
+                CacheManager._store_local(prompt_hash, cached_data)
+                
+                # Só o incremento fica para o próximo flush em lote
+                pending = CacheManager._pending_hits.setdefault(prompt_hash, {"delta": 0})
+                pending["delta"] += 1
+                pending["last_accessed"] = current_time
+                
+                cached_response = json.loads(cached_data['response']) if isinstance(cached_data['response'], str) else cached_data['response']
+                return {
+                    "text": cached_response.get("text", ""),
+                    "model": cached_data['model'],
+                    "success": True,
+                    "from_cache": True,
+                    "hit_count": cached_data['hit_count'],
+                    "created_at": cached_data['created_at'],
+                    "last_accessed": current_time,
+                    "semantic_score": semantic_score
+                }
             return None
                 
         except Exception as e:
@@ -73,7 +218,7 @@ class CacheManager:
     ) -> bool:
         """Salva uma resposta no cache"""
         try:
-            prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+            prompt_hash = CacheManager._hash_prompt(prompt)
             current_time = CacheManager._get_utc_now()
             expires_at = (current_time + timedelta(hours=ttl_hours)).isoformat()
             
@@ -84,8 +229,7 @@ class CacheManager:
                 "success": response.get("success", True)
             }
             
-            # Usa upsert para lidar com entradas duplicadas
-            supabase.table('response_cache').upsert({
+            row = {
                 'prompt_hash': prompt_hash,
                 'prompt': prompt,
                 'response': json.dumps(response_to_cache),
@@ -93,7 +237,27 @@ class CacheManager:
                 'expires_at': expires_at,
                 'last_accessed': current_time.isoformat(),
                 'hit_count': 1
-            }).execute()
+            }
+            
+            # O embedding do prompt vai junto na linha: outros processos e
+            # reinícios reconstroem o índice semântico a partir dela
+            prompt_embedding = None
+            if CacheManager._semantic_cache:
+                try:
+                    prompt_embedding = await CacheManager._semantic_cache.embed(prompt_hash, prompt)
+                    row['prompt_embedding'] = prompt_embedding
+                except Exception as e:
+                    logger.error(f"Erro ao gerar embedding do prompt cacheado: {str(e)}")
+            
+            # Usa upsert para lidar com entradas duplicadas
+            await execute_query(supabase.table('response_cache').upsert(row))
+            
+            # Mantém o L1 coerente com o que foi gravado (sem o embedding)
+            CacheManager._pending_hits.pop(prompt_hash, None)
+            local_row = {k: v for k, v in row.items() if k != 'prompt_embedding'}
+            CacheManager._store_local(prompt_hash, {**local_row, 'created_at': current_time.isoformat()})
+            if prompt_embedding is not None:
+                CacheManager._semantic_cache.add(prompt_hash, prompt_embedding)
             
             logger.info(f"Resposta cacheada com sucesso: {prompt_hash}")
             return True
@@ -102,14 +266,92 @@ class CacheManager:
             logger.error(f"Erro ao salvar cache: {str(e)}")
             return False
 
+    @staticmethod
+    async def flush_hit_counts() -> int:
+        """
+        Soma os hits acumulados no banco com uma chamada a increment_cache_hits.
+        Só incremento e last_accessed são enviados: contagens de outros
+        processos, respostas mais novas e linhas já removidas ficam intactas.
+        """
+        if not CacheManager._pending_hits:
+            return 0
+
+        pending = CacheManager._pending_hits
+        CacheManager._pending_hits = {}
+        hashes = list(pending)
+
+        try:
+            await execute_query(supabase.rpc('increment_cache_hits', {
+                'p_hashes': hashes,
+                'p_deltas': [pending[h]["delta"] for h in hashes],
+                'p_last_accessed': [pending[h]["last_accessed"] for h in hashes]
+            }))
+            logger.info(f"Contadores de hit gravados: {len(hashes)} entradas")
+            return len(hashes)
+
+        except Exception as e:
+            logger.error(f"Erro ao gravar contadores de hit: {str(e)}")
+            # Devolve os incrementos ao buffer, somando aos hits mais recentes
+            for prompt_hash, hit in pending.items():
+                current = CacheManager._pending_hits.setdefault(prompt_hash, {"delta": 0})
+                current["delta"] += hit["delta"]
+                current.setdefault("last_accessed", hit["last_accessed"])
+            return 0
+
+    @staticmethod
+    async def _run_hit_flusher(interval: float) -> None:
+        """Loop que grava os contadores de hit periodicamente"""
+        while True:
+            await asyncio.sleep(interval)
+            await CacheManager.flush_hit_counts()
+
+    @staticmethod
+    def start_hit_flusher(interval: float = CACHE_HIT_FLUSH_INTERVAL) -> None:
+        """Inicia a tarefa de gravação periódica dos contadores de hit"""
+        if CacheManager._flush_task and not CacheManager._flush_task.done():
+            return
+        CacheManager._flush_task = asyncio.create_task(CacheManager._run_hit_flusher(interval))
+        logger.info(f"Gravação de hit_count em lote a cada {interval}s")
+
+    @staticmethod
+    def start_semantic_sync() -> None:
+        """Carrega o índice do cache semântico e o mantém sincronizado entre processos"""
+        if CacheManager._semantic_cache:
+            CacheManager._semantic_cache.start_sync()
+
+    @staticmethod
+    async def stop_semantic_sync() -> None:
+        if CacheManager._semantic_cache:
+            await CacheManager._semantic_cache.stop_sync()
+
+    @staticmethod
+    async def stop_hit_flusher() -> None:
+        """Interrompe a tarefa periódica e grava o que estiver pendente"""
+        task = CacheManager._flush_task
+        CacheManager._flush_task = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await CacheManager.flush_hit_counts()
+
     @staticmethod
     async def cleanup_expired_cache() -> int:
         """Remove entradas expiradas do cache"""
         try:
             current_time = CacheManager._get_utc_now().isoformat()
-            response = supabase.table('response_cache').delete().lt('expires_at', current_time).execute()
+            response = await execute_query(
+                supabase.table('response_cache').delete().lt('expires_at', current_time)
+            )
             
             count = len(response.data) if response and response.data else 0
+            for row in (response.data or []) if response else []:
+                if row.get('prompt_hash'):
+                    CacheManager._local_cache.delete(row['prompt_hash'])
+                    if CacheManager._semantic_cache:
+                        CacheManager._semantic_cache.remove(row['prompt_hash'])
             logger.info(f"Limpeza de cache: {count} entradas removidas")
             return count
             
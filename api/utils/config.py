@@ -17,10 +17,47 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./llm_router.db")
 CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
 CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))  # 1 hora em segundos
 CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1000"))  # Máximo de itens no cache
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # Similaridade mínima (cosseno)
+SEMANTIC_CACHE_LOOKUP_TIMEOUT = float(os.getenv("SEMANTIC_CACHE_LOOKUP_TIMEOUT", "0.5"))  # Prazo do embedding na busca (segundos)
+SEMANTIC_CACHE_SYNC_INTERVAL = float(os.getenv("SEMANTIC_CACHE_SYNC_INTERVAL", "60"))  # Segundos entre sincronizações do índice
+CACHE_HIT_FLUSH_INTERVAL = int(os.getenv("CACHE_HIT_FLUSH_INTERVAL", "30"))  # Segundos entre gravações de hit_count
+CLASSIFICATION_MEMO_SIZE = int(os.getenv("CLASSIFICATION_MEMO_SIZE", "2048"))  # Classificações memorizadas por texto
+CLASSIFICATION_MEMO_TTL = int(os.getenv("CLASSIFICATION_MEMO_TTL", "86400"))  # 24 horas em segundos
+
+# Configurações do cache de sessões (janelas de conversa em memória por número)
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "1000"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Memória estimada
+SESSION_CACHE_IDLE_TIMEOUT = int(os.getenv("SESSION_CACHE_IDLE_TIMEOUT", "1800"))  # 30 minutos sem atividade
+
+# Orçamento de tokens do contexto da conversa por modelo de destino
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt": int(os.getenv("CONTEXT_TOKENS_GPT", "6000")),
+    "claude": int(os.getenv("CONTEXT_TOKENS_CLAUDE", "8000")),
+    "deepseek": int(os.getenv("CONTEXT_TOKENS_DEEPSEEK", "6000")),
+    "gemini": int(os.getenv("CONTEXT_TOKENS_GEMINI", "8000")),
+    "mistral": int(os.getenv("CONTEXT_TOKENS_MISTRAL", "6000")),
+    "default": int(os.getenv("CONTEXT_TOKENS_DEFAULT", "4000")),
+}
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "false").lower() == "true"
+CONTEXT_SUMMARY_EVERY = int(os.getenv("CONTEXT_SUMMARY_EVERY", "20"))  # Mensagens novas antes de atualizar o resumo
+CONTEXT_SUMMARY_KEEP_RECENT = int(os.getenv("CONTEXT_SUMMARY_KEEP_RECENT", "10"))  # Mensagens recentes fora do resumo
+
+# Junção de rajadas de mensagens do mesmo número (webhook do WhatsApp)
+COALESCE_DEBOUNCE_SECONDS = float(os.getenv("COALESCE_DEBOUNCE_SECONDS", "1.0"))  # Silêncio que encerra a rajada
+COALESCE_MAX_WAIT_SECONDS = float(os.getenv("COALESCE_MAX_WAIT_SECONDS", "4.0"))  # Espera máxima da primeira mensagem
+SEEN_MESSAGE_IDS_MAX = int(os.getenv("SEEN_MESSAGE_IDS_MAX", "10000"))  # messageIds lembrados para deduplicação
 
 # Configurações de fila
 QUEUE_ENABLED = os.getenv("QUEUE_ENABLED", "true").lower() == "true"
 QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "100"))
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "supabase")  # "supabase" (tabela message_queue) ou "memory" (heap no processo)
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "4"))  # Jobs processados em paralelo
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "1.0"))  # Segundos entre buscas na fila
+QUEUE_LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", "120"))  # Tempo de reserva de um job antes de voltar a ficar visível
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))  # Tentativas antes do dead-letter
+QUEUE_RETRY_BACKOFF = float(os.getenv("QUEUE_RETRY_BACKOFF", "5.0"))  # Espera base entre tentativas (dobra a cada falha)
+QUEUE_RETRY_BACKOFF_MAX = float(os.getenv("QUEUE_RETRY_BACKOFF_MAX", "300"))
 
 # Configurações de logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -29,6 +66,68 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 # Configurações de timeout
 API_TIMEOUT = int(os.getenv("API_TIMEOUT", "30"))  # segundos
 
+# Timeouts dos efeitos colaterais depois da resposta (segundos por destino)
+SIDE_EFFECT_TIMEOUTS = {
+    "whatsapp_text": float(os.getenv("SIDE_EFFECT_TIMEOUT_WHATSAPP_TEXT", "15")),
+    "whatsapp_audio": float(os.getenv("SIDE_EFFECT_TIMEOUT_WHATSAPP_AUDIO", "30")),
+    "make": float(os.getenv("SIDE_EFFECT_TIMEOUT_MAKE", "10")),
+    "tts": float(os.getenv("SIDE_EFFECT_TIMEOUT_TTS", "30")),
+    "cache": float(os.getenv("SIDE_EFFECT_TIMEOUT_CACHE", "5")),
+    "memory": float(os.getenv("SIDE_EFFECT_TIMEOUT_MEMORY", "10")),
+    "default": float(os.getenv("SIDE_EFFECT_TIMEOUT_DEFAULT", "10")),
+}
+
+# Configurações de áudio (TTS)
+TTS_MODEL = os.getenv("TTS_MODEL", "tts-1")
+TTS_VOICE = os.getenv("TTS_VOICE", "alloy")
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "400"))  # Tamanho máximo de cada trecho sintetizado
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "3"))  # Trechos sintetizados em paralelo
+TTS_CACHE_MAX_ENTRIES = int(os.getenv("TTS_CACHE_MAX_ENTRIES", "5000"))  # Áudios indexados localmente (só caminho e URL)
+
+# Configurações do RAG
+RAG_INDEX_BACKEND = os.getenv("RAG_INDEX_BACKEND", "supabase")  # "supabase" (pgvector) ou "local" (NumPy no processo)
+RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "text-embedding-3-small")
+RAG_EMBEDDING_DIM = int(os.getenv("RAG_EMBEDDING_DIM", "1536"))
+RAG_MAX_BATCH_QUERIES = int(os.getenv("RAG_MAX_BATCH_QUERIES", "64"))  # Consultas por chamada de /rag/search em lote
+RAG_CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "512"))  # Tamanho máximo de cada trecho indexado
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "64"))  # Tokens repetidos entre trechos vizinhos
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "128"))  # Trechos por chamada de embeddings (e por upsert)
+RAG_EMBED_BATCH_TOKENS = int(os.getenv("RAG_EMBED_BATCH_TOKENS", "100000"))  # Limite de tokens por chamada
+RAG_EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", "4"))  # Lotes em andamento ao mesmo tempo
+RAG_EMBED_MAX_ATTEMPTS = int(os.getenv("RAG_EMBED_MAX_ATTEMPTS", "3"))
+RAG_EMBED_RETRY_BACKOFF = float(os.getenv("RAG_EMBED_RETRY_BACKOFF", "1.0"))  # Espera base entre tentativas (dobra a cada falha)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "5000"))  # Vetores em memória (~6KB cada em float32)
+EMBEDDING_CACHE_PERSISTENT = os.getenv("EMBEDDING_CACHE_PERSISTENT", "true").lower() == "true"  # Usa a tabela embedding_cache na indexação de documentos
+
+# Configurações dos clientes HTTP compartilhados (limites por host)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))  # segundos
+
+# Pools de threads para chamadas síncronas (SDKs e Supabase) fora do event loop
+EXECUTOR_POOLS = {
+    "default": int(os.getenv("EXECUTOR_DEFAULT_WORKERS", "8")),
+    "db": int(os.getenv("EXECUTOR_DB_WORKERS", "16")),
+    "llm": int(os.getenv("EXECUTOR_LLM_WORKERS", "16")),
+    "audio": int(os.getenv("EXECUTOR_AUDIO_WORKERS", "4")),
+}
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))  # segundos entre medições
+
+# Configurações de hedging entre modelos (dispara um modelo reserva se o principal demorar)
+ROUTER_HEDGING_ENABLED = os.getenv("ROUTER_HEDGING_ENABLED", "false").lower() == "true"
+ROUTER_HEDGE_DELAY = float(os.getenv("ROUTER_HEDGE_DELAY", "3.0"))  # segundos, usado sem histórico de latência
+ROUTER_HEDGE_PERCENTILE = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "0.95"))
+ROUTER_HEDGE_MAX_COST_USD = float(os.getenv("ROUTER_HEDGE_MAX_COST_USD", "0.02"))  # teto por requisição
+ROUTER_HEDGE_OUTPUT_TOKENS = int(os.getenv("ROUTER_HEDGE_OUTPUT_TOKENS", "1000"))  # estimativa de saída
+
+# Circuit breakers por modelo
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))  # Últimas chamadas consideradas
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))  # Mínimo de chamadas antes de abrir
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "20"))
+CIRCUIT_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))  # Tempo aberto antes do teste
+
 # Configurações de rate limiting
 RATE_LIMIT = int(os.getenv("RATE_LIMIT", "100"))  # Requisições por minuto
 RATE_LIMIT_PERIOD = int(os.getenv("RATE_LIMIT_PERIOD", "60"))  # Período em segundos
@@ -1,41 +1,108 @@
-from typing import List, Dict, Any, Optional
-import os
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from collections import OrderedDict
+import asyncio
 from datetime import datetime, timedelta
 from .supabase import supabase
+from .executor import execute_query
+from .session_cache import SessionCache
+from .side_effects import side_effects
+from .config import (
+    CONTEXT_TOKEN_BUDGETS, CONTEXT_SUMMARY_ENABLED,
+    CONTEXT_SUMMARY_EVERY, CONTEXT_SUMMARY_KEEP_RECENT
+)
 from api.utils.logger import logger
-import json
+
+# Assinatura de um resumidor: recebe o texto e devolve o resumo
+Summarizer = Callable[[str], Awaitable[str]]
+
+# Tokens do prefixo de papel ("Usuário: ") e da quebra de linha de cada mensagem
+MESSAGE_OVERHEAD_TOKENS = 4
+
+ROLE_LABELS = {"user": "Usuário", "assistant": "Assistente"}
+
+
+def _count_tokens(text: str) -> int:
+    # Import tardio: o pacote llm_router importa este módulo
+    from ..llm_router.cost_analyzer import count_tokens
+    return count_tokens(text)
+
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    """Tokens da mensagem; linhas antigas sem token_count são contadas uma vez e memorizadas"""
+    tokens = message.get("token_count")
+    if tokens is None:
+        tokens = message["token_count"] = _count_tokens(message.get("content") or "")
+    return tokens
+
+
+async def _default_summarizer(text: str) -> str:
+    from ..llm_router.gemini import call_gemini
+    response = await call_gemini(
+        text,
+        system_prompt=(
+            "Resuma a conversa a seguir em português, em poucos parágrafos, mantendo "
+            "fatos, preferências e pedidos do usuário que possam ser úteis depois."
+        )
+    )
+    if not response.get("success"):
+        raise RuntimeError(response.get("text") or "Falha ao resumir a conversa")
+    return response["text"]
+
+
+def _is_duplicate_key_error(error: Exception) -> bool:
+    """Verifica se o erro do PostgREST é de chave duplicada (sequência já usada)"""
+    return getattr(error, "code", None) == "23505" or "duplicate key" in str(error)
+
 
 class ConversationManager:
+    """
+    Memória de conversas em modo append-only: cada mensagem é uma linha da
+    tabela conversation_messages com um número de sequência por remetente.
+
+    Gravar uma mensagem é um único insert (sem reler o histórico), a leitura
+    busca só as últimas mensagens e a poda das antigas roda em background.
+
+    As conversas ativas ficam em um cache de sessões (write-through): as
+    mensagens gravadas entram na janela em memória e a leitura não vai ao banco.
+    """
+
     def __init__(self):
-        self.table_name = "conversation_memory"
+        self.table_name = "conversation_messages"
         self.max_messages = 100  # Limite de mensagens por número
-    
-    async def _get_or_create_memory(self, sender_phone: str) -> Dict[str, Any]:
-        """Recupera ou cria o registro de memória para o número"""
-        try:
-            # Tenta recuperar o registro existente
-            result = supabase.table(self.table_name)\
-                .select("*")\
-                .eq("sender_phone", sender_phone)\
-                .execute()
-
-            if not result.data:
-                # Cria novo registro se não existir
-                data = {
-                    "sender_phone": sender_phone,
-                    "conversation_memory": {
-                        "messages": []
-                    }
-                }
-                result = supabase.table(self.table_name).insert(data).execute()
-                logger.info(f"Novo registro de memória criado para {sender_phone}")
-                return result.data[0]
-            
-            return result.data[0]
+        self.trim_every = 20  # Poda as mensagens antigas a cada N mensagens gravadas
+        self.max_insert_attempts = 3
+        # Última sequência conhecida por número (evita consultar antes de cada insert)
+        self._last_seq: "OrderedDict[str, int]" = OrderedDict()
+        self._last_seq_max_size = 10000
+        self._trim_tasks: Dict[str, asyncio.Task] = {}
+        self.sessions = SessionCache(window=self.max_messages)
+        self.summaries_table = "conversation_summaries"
+        self.summary_enabled = CONTEXT_SUMMARY_ENABLED
+        self._summarizer: Summarizer = _default_summarizer
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
+        # Última gravação em background de cada número (ver add_message_background)
+        self._pending_writes: Dict[str, asyncio.Task] = {}
 
-        except Exception as e:
-            logger.error(f"Erro ao recuperar/criar memória: {str(e)}")
-            raise
+    def set_summarizer(self, summarizer: Summarizer) -> None:
+        """Troca a função usada para resumir as mensagens antigas"""
+        self._summarizer = summarizer
+
+    def _remember_seq(self, sender_phone: str, seq: int) -> None:
+        self._last_seq[sender_phone] = seq
+        self._last_seq.move_to_end(sender_phone)
+        while len(self._last_seq) > self._last_seq_max_size:
+            self._last_seq.popitem(last=False)
+
+    async def _fetch_last_seq(self, sender_phone: str) -> int:
+        """Busca a maior sequência gravada para o número (0 se não houver mensagens)"""
+        result = await execute_query(
+            supabase.table(self.table_name)
+            .select("seq")
+            .eq("sender_phone", sender_phone)
+            .order("seq", desc=True)
+            .limit(1)
+        )
+        return result.data[0]["seq"] if result.data else 0
 
     async def add_message(
         self,
@@ -43,91 +110,326 @@ class ConversationManager:
         role: str,
         content: str,
         model_used: Optional[str] = None,
-        save_to_db: bool = True
-    ) -> None:
-        """Adiciona uma mensagem à memória"""
+        save_to_db: bool = True,
+        token_count: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Adiciona uma mensagem à memória (um insert por mensagem)"""
         if not save_to_db:
-            return
+            return None
+        # Gravações do mesmo número disparadas em background entram antes
+        previous = self._pending_writes.get(sender_phone)
+        if previous is not None:
+            await asyncio.wait([previous])
+        return await self._insert_message(sender_phone, role, content, model_used, token_count)
+
+    def add_message_background(
+        self,
+        sender_phone: str,
+        role: str,
+        content: str,
+        model_used: Optional[str] = None
+    ) -> asyncio.Task:
+        """
+        Grava a mensagem sem esperar o banco, mantendo a ordem da conversa: a
+        próxima gravação do mesmo número (em background ou não) espera esta.
+        """
+        previous = self._pending_writes.get(sender_phone)
+
+        async def write() -> Optional[Dict[str, Any]]:
+            if previous is not None:
+                await asyncio.wait([previous])
+            return await self._insert_message(sender_phone, role, content, model_used)
+
+        task = side_effects.fire_and_forget("memory", write())
+        self._pending_writes[sender_phone] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if self._pending_writes.get(sender_phone) is done:
+                del self._pending_writes[sender_phone]
 
+        task.add_done_callback(forget)
+        return task
+
+    async def _insert_message(
+        self,
+        sender_phone: str,
+        role: str,
+        content: str,
+        model_used: Optional[str] = None,
+        token_count: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
         try:
-            # Recupera ou cria o registro de memória
-            memory = await self._get_or_create_memory(sender_phone)
-            
-            # Prepara a nova mensagem
-            new_message = {
-                "role": role,
-                "content": content,
-                "timestamp": datetime.utcnow().isoformat(),
-                "model_used": model_used
-            }
+            # Tokens calculados uma única vez, na gravação
+            if token_count is None:
+                token_count = _count_tokens(content)
 
-            # Recupera as mensagens existentes
-            messages = memory["conversation_memory"]["messages"]
-            
-            # Adiciona a nova mensagem
-            messages.append(new_message)
-            
-            # Se exceder o limite, remove as mensagens mais antigas
-            if len(messages) > self.max_messages:
-                messages = messages[-self.max_messages:]
-            
-            # Atualiza o registro no Supabase
-            data = {
-                "conversation_memory": {"messages": messages},
-                "last_update": datetime.utcnow().isoformat()
-            }
-            
-            supabase.table(self.table_name)\
-                .update(data)\
-                .eq("sender_phone", sender_phone)\
-                .execute()
-            
-            logger.info(f"Memória atualizada para {sender_phone}: {len(messages)} mensagens")
+            session = self.sessions.peek(sender_phone)
+            last_seq = session.last_seq if session else self._last_seq.get(sender_phone)
+            if last_seq is None:
+                last_seq = await self._fetch_last_seq(sender_phone)
+
+            for attempt in range(self.max_insert_attempts):
+                row = {
+                    "sender_phone": sender_phone,
+                    "seq": last_seq + 1,
+                    "role": role,
+                    "content": content,
+                    "model_used": model_used,
+                    "token_count": token_count,
+                    "created_at": datetime.utcnow().isoformat()
+                }
+                try:
+                    await execute_query(supabase.table(self.table_name).insert(row))
+                    break
+                except Exception as e:
+                    # Outra instância gravou a mesma sequência: relê o final e tenta de novo
+                    if not _is_duplicate_key_error(e) or attempt == self.max_insert_attempts - 1:
+                        raise
+                    last_seq = await self._fetch_last_seq(sender_phone)
+
+            self._remember_seq(sender_phone, row["seq"])
+            if session is not None:
+                if row["seq"] == session.last_seq + 1:
+                    self.sessions.append(sender_phone, row)
+                else:
+                    # Outro processo gravou mensagens desta conversa: a janela está desatualizada
+                    self.sessions.discard(sender_phone)
+            if row["seq"] % self.trim_every == 0:
+                self._schedule_trim(sender_phone, row["seq"])
+            if self.summary_enabled and session is not None and session.summary is not None:
+                if row["seq"] - session.summary["summarized_seq"] >= CONTEXT_SUMMARY_KEEP_RECENT + CONTEXT_SUMMARY_EVERY:
+                    self._schedule_summary(sender_phone)
+
+            logger.info(f"Mensagem {row['seq']} gravada na memória de {sender_phone}")
+            return row
 
         except Exception as e:
+            # Descarta a sequência conhecida; o próximo insert relê do banco
+            self._last_seq.pop(sender_phone, None)
+            self.sessions.discard(sender_phone)
             logger.error(f"Erro ao adicionar mensagem: {str(e)}")
             logger.exception("Stacktrace completo:")
+            return None
+
+    def _schedule_trim(self, sender_phone: str, last_seq: int) -> None:
+        """Agenda a poda das mensagens antigas sem atrasar a gravação"""
+        running = self._trim_tasks.get(sender_phone)
+        if running and not running.done():
+            return
+        task = asyncio.create_task(self.trim_messages(sender_phone, last_seq))
+        self._trim_tasks[sender_phone] = task
+        task.add_done_callback(lambda _: self._trim_tasks.pop(sender_phone, None))
 
-    async def format_conversation_for_llm(self, sender_phone: str, max_tokens: int = 4000) -> str:
-        """Formata a conversa para o LLM"""
+    async def trim_messages(self, sender_phone: str, last_seq: Optional[int] = None) -> None:
+        """Remove as mensagens além das max_messages mais recentes"""
         try:
-            # Recupera o registro de memória
-            memory = await self._get_or_create_memory(sender_phone)
-            messages = memory["conversation_memory"]["messages"]
-            
-            formatted_messages = []
-            for msg in messages:
-                if msg["role"] == "user":
-                    formatted_messages.append(f"Usuário: {msg['content']}")
-                else:
-                    formatted_messages.append(f"Assistente: {msg['content']}\n")
-            
-            # Controle de tokens
-            context = "\n".join(formatted_messages)
-            if len(context.split()) > max_tokens:
-                words = context.split()
-                context = " ".join(words[-max_tokens:])
-            
-            return context
+            if last_seq is None:
+                last_seq = await self._fetch_last_seq(sender_phone)
+            cutoff = last_seq - self.max_messages
+            if cutoff <= 0:
+                return
+            await execute_query(
+                supabase.table(self.table_name)
+                .delete()
+                .eq("sender_phone", sender_phone)
+                .lte("seq", cutoff)
+            )
+        except Exception as e:
+            logger.error(f"Erro ao podar memória de {sender_phone}: {str(e)}")
+
+    async def get_recent_messages(self, sender_phone: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retorna as últimas mensagens do número, da mais antiga para a mais recente"""
+        limit = limit or self.max_messages
+        session = self.sessions.get(sender_phone)
+        if session and (session.complete or len(session.messages) >= limit):
+            return session.tail(limit)
 
+        fetch = max(limit, self.sessions.window)
+        result = await execute_query(
+            supabase.table(self.table_name)
+            .select("seq, role, content, model_used, token_count, created_at")
+            .eq("sender_phone", sender_phone)
+            .order("seq", desc=True)
+            .limit(fetch)
+        )
+        messages = list(reversed(result.data or []))
+        if messages:
+            self._remember_seq(sender_phone, max(self._last_seq.get(sender_phone, 0), messages[-1]["seq"]))
+        session = self.sessions.load(sender_phone, messages, complete=len(messages) < fetch)
+        if self.summary_enabled:
+            session.summary = await self._load_summary(sender_phone)
+        return messages[-limit:]
+
+    async def _load_summary(self, sender_phone: str) -> Dict[str, Any]:
+        try:
+            result = await execute_query(
+                supabase.table(self.summaries_table)
+                .select("summary, summarized_seq, token_count")
+                .eq("sender_phone", sender_phone)
+                .limit(1)
+            )
+            if result.data:
+                return result.data[0]
+        except Exception as e:
+            logger.error(f"Erro ao carregar resumo de {sender_phone}: {str(e)}")
+        return {"summary": "", "summarized_seq": 0, "token_count": 0}
+
+    def _schedule_summary(self, sender_phone: str) -> None:
+        """Atualiza o resumo em background, uma tarefa por número"""
+        running = self._summary_tasks.get(sender_phone)
+        if running and not running.done():
+            return
+        task = asyncio.create_task(self.update_summary(sender_phone))
+        self._summary_tasks[sender_phone] = task
+        task.add_done_callback(lambda _: self._summary_tasks.pop(sender_phone, None))
+
+    async def update_summary(self, sender_phone: str) -> Optional[Dict[str, Any]]:
+        """
+        Incorpora ao resumo as mensagens antigas ainda não resumidas, deixando de
+        fora as CONTEXT_SUMMARY_KEEP_RECENT mais recentes.
+        """
+        try:
+            messages = await self.get_recent_messages(sender_phone)
+            session = self.sessions.peek(sender_phone)
+            previous = (session.summary if session else None) or await self._load_summary(sender_phone)
+
+            pending = [
+                msg for msg in messages[:-CONTEXT_SUMMARY_KEEP_RECENT]
+                if msg["seq"] > previous["summarized_seq"]
+            ]
+            if not pending:
+                return previous
+
+            parts = []
+            if previous["summary"]:
+                parts.append(f"Resumo anterior:\n{previous['summary']}")
+            parts.append("Novas mensagens:\n" + "\n".join(
+                f"{ROLE_LABELS.get(msg['role'], 'Assistente')}: {msg['content']}" for msg in pending
+            ))
+            summary_text = await self._summarizer("\n\n".join(parts))
+
+            summary = {
+                "summary": summary_text,
+                "summarized_seq": pending[-1]["seq"],
+                "token_count": _count_tokens(summary_text)
+            }
+            await execute_query(
+                supabase.table(self.summaries_table).upsert({
+                    "sender_phone": sender_phone,
+                    **summary,
+                    "updated_at": datetime.utcnow().isoformat()
+                })
+            )
+            session = self.sessions.peek(sender_phone)
+            if session is not None:
+                session.summary = summary
+            logger.info(f"Resumo da conversa de {sender_phone} atualizado até a mensagem {summary['summarized_seq']}")
+            return summary
+
+        except Exception as e:
+            logger.error(f"Erro ao atualizar resumo de {sender_phone}: {str(e)}")
+            return None
+
+    async def build_context(
+        self,
+        sender_phone: str,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        use_summary: Optional[bool] = None
+    ) -> str:
+        """
+        Monta o contexto da conversa dentro do orçamento de tokens do modelo.
+
+        As mensagens são percorridas da mais recente para a mais antiga somando o
+        token_count gravado de cada uma, até o orçamento acabar. Se mensagens
+        antigas ficarem de fora e houver resumo, ele entra no início do contexto.
+        """
+        budget = max_tokens or CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGETS["default"])
+        use_summary = self.summary_enabled if use_summary is None else use_summary
+
+        messages = await self.get_recent_messages(sender_phone)
+        session = self.sessions.peek(sender_phone)
+        summary = session.summary if (use_summary and session) else None
+        if summary and summary["summary"]:
+            summary_tokens = (summary.get("token_count") or _count_tokens(summary["summary"])) + MESSAGE_OVERHEAD_TOKENS
+            if summary_tokens <= budget // 2:
+                budget -= summary_tokens
+            else:
+                summary = None
+        else:
+            summary = None
+
+        selected = []
+        used = 0
+        for msg in reversed(messages):
+            tokens = _message_tokens(msg) + MESSAGE_OVERHEAD_TOKENS
+            if used + tokens > budget:
+                break
+            selected.append(msg)
+            used += tokens
+        selected.reverse()
+
+        lines = []
+        # O resumo só é útil se há mensagens antigas fora do contexto
+        left_out = len(selected) < len(messages) or (messages and messages[0]["seq"] > 1)
+        if summary and left_out:
+            lines.append(f"Resumo da conversa anterior: {summary['summary']}\n")
+        for msg in selected:
+            if msg["role"] == "user":
+                lines.append(f"Usuário: {msg['content']}")
+            else:
+                lines.append(f"Assistente: {msg['content']}\n")
+        return "\n".join(lines)
+
+    async def format_conversation_for_llm(
+        self,
+        sender_phone: str,
+        max_tokens: Optional[int] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """Formata a conversa para o LLM, limitada a max_tokens (padrão: orçamento do modelo)"""
+        try:
+            return await self.build_context(sender_phone, model=model, max_tokens=max_tokens)
         except Exception as e:
             logger.error(f"Erro ao formatar conversa: {str(e)}")
             return ""
 
+    async def clear_memory(self, sender_phone: str) -> None:
+        """Remove todas as mensagens do número"""
+        await execute_query(
+            supabase.table(self.table_name)
+            .delete()
+            .eq("sender_phone", sender_phone)
+        )
+        self._last_seq.pop(sender_phone, None)
+        self.sessions.discard(sender_phone)
+
+    async def cleanup_inactive_sessions(self, max_age_hours: Optional[float] = None) -> int:
+        """Remove da memória do processo as sessões ociosas (os dados continuam no banco)"""
+        max_idle = max_age_hours * 3600 if max_age_hours is not None else None
+        evicted = self.sessions.evict_idle(max_idle)
+        if evicted:
+            logger.info(f"{evicted} sessões inativas removidas do cache")
+        return evicted
+
+    def session_stats(self) -> Dict[str, Any]:
+        return self.sessions.stats()
+
     async def cleanup_old_memories(self, days: int = 30) -> None:
-        """Remove memórias antigas"""
+        """Remove mensagens antigas"""
         try:
             time_limit = datetime.utcnow() - timedelta(days=days)
-            
-            supabase.table(self.table_name)\
-                .delete()\
-                .lt("last_update", time_limit.isoformat())\
-                .execute()
-            
+
+            await execute_query(
+                supabase.table(self.table_name)
+                .delete()
+                .lt("created_at", time_limit.isoformat())
+            )
+
             logger.info(f"Limpeza de memórias antigas concluída (mais de {days} dias)")
-        
+
         except Exception as e:
             logger.error(f"Erro ao limpar memórias antigas: {str(e)}")
 
 # Instância global do gerenciador de conversas
-conversation_manager = ConversationManager()
\ No newline at end of file
+conversation_manager = ConversationManager()
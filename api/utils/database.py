@@ -2,6 +2,7 @@ from supabase import create_client, Client
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from loguru import logger
+from .executor import execute_query
 import os
 import json
 
@@ -19,10 +20,10 @@ class SupabaseManager:
         """Executa uma query no Supabase"""
         try:
             # Como o Supabase não tem execute direto, vamos usar o rpc
-            result = self.supabase.rpc(
+            result = await execute_query(self.supabase.rpc(
                 "exec_sql", 
                 {"sql": query, "params": json.dumps(params) if params else "{}"}
-            ).execute()
+            ))
             return result.data
         except Exception as e:
             logger.error(f"Erro ao executar query: {str(e)}")
@@ -48,12 +49,11 @@ class SupabaseManager:
     async def get_from_cache(self, prompt: str) -> Optional[Dict[str, Any]]:
         """Busca do cache"""
         try:
-            result = self.supabase.table("response_cache").select("*") \
-                .eq("prompt", prompt) \
-                .gt("expires_at", datetime.utcnow().isoformat()) \
-                .order("created_at", desc=True) \
-                .limit(1) \
-                .execute()
+            result = await execute_query(self.supabase.table("response_cache").select("*")
+                .eq("prompt", prompt)
+                .gt("expires_at", datetime.utcnow().isoformat())
+                .order("created_at", desc=True)
+                .limit(1))
 
             if result.data:
                 return result.data[0]["response"]
@@ -92,9 +92,8 @@ class SupabaseManager:
             }
 
             # Usa upsert para atualizar se já existe
-            result = self.supabase.table("response_cache") \
-                .upsert(data, on_conflict="prompt") \
-                .execute()
+            result = await execute_query(self.supabase.table("response_cache")
+                .upsert(data, on_conflict="prompt"))
                 
             logger.info("Cache atualizado com sucesso")
             return result
@@ -106,7 +105,8 @@ class SupabaseManager:
         self,
         sender: str,
         prompt: Optional[str] = None,
-        response: Optional[Dict[str, Any]] = None
+        response: Optional[Dict[str, Any]] = None,
+        payload: Optional[Dict[str, Any]] = None
     ) -> str:
         """
         Adiciona mensagem à fila de processamento
@@ -114,6 +114,7 @@ class SupabaseManager:
             sender: ID do remetente
             prompt: Texto do prompt (opcional)
             response: Resposta do modelo (opcional)
+            payload: Dados do job a processar (opcional)
         Returns:
             ID da mensagem na fila
         """
@@ -124,6 +125,8 @@ class SupabaseManager:
                 message_queue["prompt"] = prompt
             if response:
                 message_queue["response"] = response
+            if payload:
+                message_queue["payload"] = payload
 
             data = {
                 "sender": sender,
@@ -136,7 +139,7 @@ class SupabaseManager:
                 data["processed_at"] = datetime.utcnow().isoformat()
             
             # Usa o formato correto do Supabase
-            result = self.supabase.table("message_queue").insert(data).execute()
+            result = await execute_query(self.supabase.table("message_queue").insert(data))
             msg_id = result.data[0]["id"]
             logger.info(f"Mensagem {msg_id} adicionada à fila para {sender}")
             return msg_id
@@ -148,12 +151,11 @@ class SupabaseManager:
     async def get_pending_messages(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Retorna mensagens pendentes ordenadas por data de criação"""
         try:
-            result = self.supabase.table("message_queue") \
-                .select("id, sender, message_queue, status, created_at") \
-                .eq("status", "pending") \
-                .order("created_at", desc=False) \
-                .limit(limit) \
-                .execute()
+            result = await execute_query(self.supabase.table("message_queue")
+                .select("id, sender, message_queue, status, created_at")
+                .eq("status", "pending")
+                .order("created_at", desc=False)
+                .limit(limit))
 
             if result.data:
                 logger.info(f"📥 Retornando {len(result.data)} mensagens pendentes")
@@ -187,10 +189,9 @@ class SupabaseManager:
             if metadata:
                 data["message_queue"] = metadata
             
-            self.supabase.table("message_queue") \
-                .update(data) \
-                .eq("id", msg_id) \
-                .execute()
+            await execute_query(self.supabase.table("message_queue")
+                .update(data)
+                .eq("id", msg_id))
                 
             logger.info(f"Status da mensagem {msg_id} atualizado para {status}")
 
@@ -240,9 +241,8 @@ class SupabaseManager:
                 data["metadata"] = metadata
             
             # Salva no Supabase
-            result = self.supabase.table("conversation_context") \
-                .upsert(data, on_conflict="sender") \
-                .execute()
+            result = await execute_query(self.supabase.table("conversation_context")
+                .upsert(data, on_conflict="sender"))
                 
             logger.info(f"Contexto atualizado para {sender} com {len(messages)} mensagens")
             return result.data[0] if result.data else None
@@ -260,12 +260,11 @@ class SupabaseManager:
             Lista de mensagens do contexto
         """
         try:
-            result = self.supabase.table("conversation_context") \
-                .select("messages") \
-                .eq("sender", sender) \
-                .gt("expires_at", datetime.utcnow().isoformat()) \
-                .single() \
-                .execute()
+            result = await execute_query(self.supabase.table("conversation_context")
+                .select("messages")
+                .eq("sender", sender)
+                .gt("expires_at", datetime.utcnow().isoformat())
+                .single())
             
             if result.data:
                 messages = result.data.get("messages", [])
@@ -325,11 +324,10 @@ class SupabaseManager:
             ]
 
             # Busca contexto existente
-            response = (
+            response = await execute_query(
                 self.supabase.table("conversation_context")
                 .select("messages")
                 .eq("sender", sender)
-                .execute()
             )
 
             messages = []
@@ -349,14 +347,14 @@ class SupabaseManager:
             # Atualiza ou insere contexto
             expires_at = datetime.utcnow() + timedelta(hours=ttl_hours)
             
-            self.supabase.table("conversation_context").upsert(
+            await execute_query(self.supabase.table("conversation_context").upsert(
                 {
                     "sender": sender,
                     "messages": json.dumps(messages),
                     "last_interaction": datetime.utcnow().isoformat(),
                     "expires_at": expires_at.isoformat(),
                 }
-            ).execute()
+            ))
 
             logger.info(f"Contexto atualizado para {sender}")
 
@@ -370,9 +368,9 @@ class SupabaseManager:
                 raise ValueError("Sender é obrigatório")
 
             # Usa índice idx_context_sender
-            self.supabase.table("conversation_context").update(
+            await execute_query(self.supabase.table("conversation_context").update(
                 {"messages": [], "last_interaction": datetime.utcnow().isoformat()}
-            ).eq("sender", sender).execute()
+            ).eq("sender", sender))
 
             logger.info(f"Contexto limpo para {sender}")
 
@@ -385,14 +383,14 @@ class SupabaseManager:
             now = datetime.utcnow().isoformat()
 
             # Limpa cache expirado
-            self.supabase.table("response_cache").delete().lte(
+            await execute_query(self.supabase.table("response_cache").delete().lte(
                 "expires_at", now
-            ).execute()
+            ))
 
             # Limpa contextos expirados
-            self.supabase.table("conversation_context").delete().lte(
+            await execute_query(self.supabase.table("conversation_context").delete().lte(
                 "expires_at", now
-            ).execute()
+            ))
 
             logger.info("Limpeza de dados expirados concluída")
 
@@ -415,10 +413,9 @@ class SupabaseManager:
 
     async def _get_cache_stats(self) -> Dict[str, int]:
         """Estatísticas do cache"""
-        response = (
+        response = await execute_query(
             self.supabase.table("response_cache")
             .select("count(*)", "sum(usage_count)")
-            .execute()
         )
         return {
             "total_entries": response.count,
@@ -428,10 +425,9 @@ class SupabaseManager:
     async def _get_queue_stats(self) -> Dict[str, int]:
         """Estatísticas da fila"""
         try:
-            result = self.supabase.table("message_queue") \
-                .select("status, count(*)") \
-                .group("status") \
-                .execute()
+            result = await execute_query(self.supabase.table("message_queue")
+                .select("status, count(*)")
+                .group("status"))
                 
             stats = {}
             for row in result.data:
@@ -445,10 +441,9 @@ class SupabaseManager:
 
     async def _get_context_stats(self) -> Dict[str, int]:
         """Estatísticas dos contextos"""
-        response = (
+        response = await execute_query(
             self.supabase.table("conversation_context")
             .select("count(*)", "count(distinct sender)")
-            .execute()
         )
         return {
             "total_contexts": response.count,
@@ -487,7 +482,7 @@ class SupabaseManager:
             }
 
             # Usa o formato correto do Supabase
-            result = self.supabase.table("llm_router").insert(data).execute()
+            result = await execute_query(self.supabase.table("llm_router").insert(data))
             logger.info(f"Dados salvos na tabela llm_router para request_id: {request_id}")
             return result
 
@@ -498,10 +493,9 @@ class SupabaseManager:
     async def clear_expired_contexts(self):
         """Remove contextos expirados"""
         try:
-            result = self.supabase.table("conversation_context") \
-                .delete() \
-                .lt("expires_at", datetime.utcnow().isoformat()) \
-                .execute()
+            result = await execute_query(self.supabase.table("conversation_context")
+                .delete()
+                .lt("expires_at", datetime.utcnow().isoformat()))
                 
             if result.data:
                 logger.info(f"Removidos {len(result.data)} contextos expirados")
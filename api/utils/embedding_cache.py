@@ -0,0 +1,121 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import numpy as np
+from loguru import logger
+from .supabase import supabase
+from .executor import execute_query
+from .side_effects import side_effects
+from .config import EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PERSISTENT
+
+# Hashes por consulta .in_() (mantém a URL do PostgREST curta)
+PERSISTENT_LOOKUP_BATCH = 100
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings endereçado pelo conteúdo (hash de modelo e texto).
+
+    Dois níveis: um LRU em memória com os vetores em float32 e a tabela
+    embedding_cache no Supabase, compartilhada entre instâncias e reinícios.
+    A tabela só é usada quando o chamador pede (indexação de documentos):
+    consultas avulsas ficam só na memória, sem ida ao banco e sem crescer a
+    tabela. Vetores encontrados só na tabela sobem para a memória; vetores
+    novos são gravados na tabela em background.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        persistent: bool = EMBEDDING_CACHE_PERSISTENT,
+        table_name: str = "embedding_cache"
+    ):
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.table_name = table_name
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: Any) -> None:
+        self._memory[key] = np.asarray(vector, dtype=np.float32)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _fetch_persistent(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        for start in range(0, len(keys), PERSISTENT_LOOKUP_BATCH):
+            result = await execute_query(
+                supabase.table(self.table_name)
+                .select("content_hash,embedding")
+                .in_("content_hash", keys[start:start + PERSISTENT_LOOKUP_BATCH])
+            )
+            for row in result.data or []:
+                found[row["content_hash"]] = row["embedding"]
+        return found
+
+    async def get_many(self, keys: List[str], persistent: bool = False) -> Dict[str, List[float]]:
+        """Retorna os vetores encontrados (memória e, se persistent, tabela), indexados pela chave"""
+        found: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(keys):
+            vector = self._memory.get(key)
+            if vector is None:
+                missing.append(key)
+            else:
+                self._memory.move_to_end(key)
+                found[key] = vector.tolist()
+        self.memory_hits += len(found)
+
+        if missing and persistent and self.persistent:
+            try:
+                stored = await self._fetch_persistent(missing)
+            except Exception as e:
+                logger.error(f"Erro ao consultar cache persistente de embeddings: {str(e)}")
+                stored = {}
+            for key, vector in stored.items():
+                self._remember(key, vector)
+                found[key] = vector
+            self.persistent_hits += len(stored)
+            missing = [key for key in missing if key not in stored]
+
+        self.misses += len(missing)
+        return found
+
+    async def _persist(self, rows: List[Dict[str, Any]]) -> None:
+        await execute_query(supabase.table(self.table_name).upsert(rows))
+
+    def put_many(self, vectors: Dict[str, List[float]], model: str, persistent: bool = False) -> None:
+        """Guarda os vetores na memória e, se persistent, agenda a gravação na tabela"""
+        for key, vector in vectors.items():
+            self._remember(key, vector)
+        if persistent and self.persistent and vectors:
+            created_at = datetime.utcnow().isoformat()
+            rows = [
+                {"content_hash": key, "model": model, "embedding": vector, "created_at": created_at}
+                for key, vector in vectors.items()
+            ]
+            side_effects.fire_and_forget("embedding_cache", self._persist(rows))
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.persistent_hits
+        total = hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "persistent": self.persistent,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0
+        }
+
+
+embedding_cache = EmbeddingCache()
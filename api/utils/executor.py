@@ -0,0 +1,160 @@
+from typing import Dict, Any, Callable, Optional, TypeVar, Iterable, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import time
+from loguru import logger
+from .config import EXECUTOR_POOLS, LOOP_LAG_INTERVAL
+
+T = TypeVar("T")
+
+
+class BlockingExecutor:
+    """
+    Executa chamadas síncronas (SDKs, Supabase) em pools de threads dedicados.
+
+    Cada pool tem um semáforo com o mesmo tamanho, então o excesso de chamadas
+    espera no event loop em vez de acumular na fila interna do executor.
+    """
+
+    def __init__(self, pools: Dict[str, int] = EXECUTOR_POOLS):
+        self._sizes = dict(pools)
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._active: Dict[str, int] = {name: 0 for name in pools}
+
+    def _get_pool(self, name: str):
+        if name not in self._sizes:
+            name = "default"
+        executor = self._executors.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=self._sizes[name],
+                thread_name_prefix=f"blocking-{name}"
+            )
+            self._executors[name] = executor
+            self._semaphores[name] = asyncio.Semaphore(self._sizes[name])
+        return name, executor, self._semaphores[name]
+
+    async def run(self, func: Callable[..., T], *args: Any, pool: str = "default", **kwargs: Any) -> T:
+        """Executa func(*args, **kwargs) no pool indicado sem bloquear o event loop"""
+        name, executor, semaphore = self._get_pool(pool)
+        async with semaphore:
+            self._active[name] += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+            finally:
+                self._active[name] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {"max_workers": size, "active": self._active.get(name, 0)}
+            for name, size in self._sizes.items()
+        }
+
+    def shutdown(self) -> None:
+        """Encerra os pools de threads"""
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+        self._executors.clear()
+        self._semaphores.clear()
+
+
+class LoopLagMonitor:
+    """Mede o atraso do event loop: quanto um sleep curto demora além do esperado"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            # Média móvel exponencial para suavizar picos isolados
+            self.avg_lag = lag if not self.samples else 0.9 * self.avg_lag + 0.1 * lag
+            self.samples += 1
+            if lag > 0.5:
+                logger.warning(f"Event loop bloqueado por {lag * 1000:.0f}ms")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task = self._task
+        self._task = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "avg_lag_ms": round(self.avg_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "samples": self.samples
+        }
+
+
+# Instâncias globais
+blocking_executor = BlockingExecutor()
+loop_lag_monitor = LoopLagMonitor()
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, pool: str = "default", **kwargs: Any) -> T:
+    """Atalho para executar uma chamada síncrona no executor global"""
+    return await blocking_executor.run(func, *args, pool=pool, **kwargs)
+
+
+async def iterate_in_thread(factory: Callable[[], Iterable[T]], pool: str = "llm") -> AsyncIterator[T]:
+    """
+    Consome um iterador bloqueante (ex.: streaming de SDK síncrono) em uma thread
+    do pool, entregando os itens ao event loop conforme chegam.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    cancelled = False
+
+    def produce() -> None:
+        try:
+            for item in factory():
+                if cancelled:
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+            return
+        loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    producer = asyncio.ensure_future(blocking_executor.run(produce, pool=pool))
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        # Sinaliza à thread que pare de consumir o iterador
+        cancelled = True
+        if producer.done() and not producer.cancelled():
+            producer.exception()
+
+
+async def execute_query(query: Any) -> Any:
+    """Executa uma query do Supabase (query.execute()) no pool de banco de dados"""
+    return await blocking_executor.run(query.execute, pool="db")
@@ -0,0 +1,73 @@
+from typing import Dict, Any, Optional
+import httpx
+from loguru import logger
+from .config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY
+
+# HTTP/2 depende do pacote opcional "h2"
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Configuração de cada upstream: um pool de conexões por host
+UPSTREAMS: Dict[str, Dict[str, Any]] = {
+    "openai": {"timeout": 60.0, "http2": True},
+    "anthropic": {"timeout": 60.0, "http2": True},
+    "megaapi": {"timeout": 30.0, "http2": False},
+    "make": {"timeout": 30.0, "http2": False},
+    "default": {"timeout": 30.0, "http2": False},
+}
+
+
+class HTTPClientRegistry:
+    """Registro de clientes httpx compartilhados pela aplicação, com keep-alive"""
+
+    def __init__(self, upstreams: Dict[str, Dict[str, Any]] = UPSTREAMS):
+        self._upstreams = upstreams
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self, name: str) -> httpx.AsyncClient:
+        config = self._upstreams.get(name, self._upstreams["default"])
+        limits = httpx.Limits(
+            max_connections=config.get("max_connections", HTTP_MAX_CONNECTIONS),
+            max_keepalive_connections=config.get("max_keepalive", HTTP_MAX_KEEPALIVE),
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+        return httpx.AsyncClient(
+            timeout=config.get("timeout", 30.0),
+            limits=limits,
+            http2=config.get("http2", False) and HTTP2_AVAILABLE
+        )
+
+    def get(self, name: str = "default") -> httpx.AsyncClient:
+        """Retorna o cliente do upstream, criando-o se ainda não existir"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create_client(name)
+            self._clients[name] = client
+        return client
+
+    async def startup(self) -> None:
+        """Cria os clientes de todos os upstreams configurados"""
+        for name in self._upstreams:
+            self.get(name)
+        logger.info(
+            f"Clientes HTTP inicializados: {', '.join(self._clients)} "
+            f"(HTTP/2 {'disponível' if HTTP2_AVAILABLE else 'indisponível'})"
+        )
+
+    async def aclose(self) -> None:
+        """Fecha todos os clientes e suas conexões"""
+        clients = list(self._clients.items())
+        self._clients.clear()
+        for name, client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Erro ao fechar cliente HTTP {name}: {str(e)}")
+        logger.info("Clientes HTTP encerrados")
+
+
+# Instância global do registro de clientes
+http_clients = HTTPClientRegistry()
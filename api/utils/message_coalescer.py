@@ -0,0 +1,119 @@
+from typing import Dict, Any, List, Optional, Callable, Awaitable, TypeVar, Generic
+from collections import OrderedDict
+import asyncio
+import time
+from loguru import logger
+from .config import COALESCE_DEBOUNCE_SECONDS, COALESCE_MAX_WAIT_SECONDS, SEEN_MESSAGE_IDS_MAX
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class SeenMessageIds:
+    """Conjunto limitado dos messageIds já recebidos, para descartar reenvios"""
+
+    def __init__(self, max_size: int = SEEN_MESSAGE_IDS_MAX):
+        self.max_size = max_size
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, message_id: str) -> bool:
+        """Registra o id; retorna False se ele já tinha sido visto"""
+        if message_id in self._ids:
+            self._ids.move_to_end(message_id)
+            self.duplicates += 1
+            return False
+        self._ids[message_id] = None
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+        return True
+
+    def discard(self, message_id: str) -> None:
+        """Esquece o id (ex.: o processamento falhou e o reenvio deve ser aceito)"""
+        self._ids.pop(message_id, None)
+
+
+class _Burst(Generic[T]):
+    def __init__(self, item: T):
+        now = time.monotonic()
+        self.items: List[T] = [item]
+        self.first_arrival = now
+        self.last_arrival = now
+
+
+class SenderCoalescer:
+    """
+    Serializa o processamento por remetente e junta rajadas de mensagens.
+
+    A primeira mensagem de uma rajada espera a janela de debounce (renovada a
+    cada nova mensagem, até max_wait) e processa todas as mensagens acumuladas
+    de uma vez. As demais chamadas só entram na rajada e retornam None. Um
+    remetente nunca tem duas rajadas sendo processadas ao mesmo tempo; o que
+    chega durante o processamento forma a próxima rajada.
+    """
+
+    def __init__(
+        self,
+        debounce: float = COALESCE_DEBOUNCE_SECONDS,
+        max_wait: float = COALESCE_MAX_WAIT_SECONDS
+    ):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._pending: Dict[str, _Burst] = {}
+        # Lock por remetente e quantas rajadas o estão usando
+        self._locks: Dict[str, List[Any]] = {}
+        self.bursts = 0
+        self.merged = 0
+
+    async def submit(
+        self,
+        sender: str,
+        item: T,
+        handler: Callable[[str, List[T]], Awaitable[R]]
+    ) -> Optional[R]:
+        """Entrega o item; retorna o resultado do handler ou None se foi juntado a outra rajada"""
+        burst = self._pending.get(sender)
+        if burst is not None:
+            burst.items.append(item)
+            burst.last_arrival = time.monotonic()
+            self.merged += 1
+            return None
+
+        burst = self._pending[sender] = _Burst(item)
+        entry = self._locks.setdefault(sender, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # Espera a rajada terminar (janela sem mensagens novas ou tempo máximo)
+            while True:
+                deadline = min(burst.last_arrival + self.debounce, burst.first_arrival + self.max_wait)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+
+            async with entry[0]:
+                # A rajada continua aberta enquanto espera a anterior terminar
+                if self._pending.get(sender) is burst:
+                    del self._pending[sender]
+                self.bursts += 1
+                if len(burst.items) > 1:
+                    logger.info(f"{len(burst.items)} mensagens de {sender} processadas juntas")
+                return await handler(sender, burst.items)
+        finally:
+            if self._pending.get(sender) is burst:
+                del self._pending[sender]
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(sender, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "debounce": self.debounce,
+            "max_wait": self.max_wait,
+            "pending_senders": len(self._pending),
+            "bursts": self.bursts,
+            "merged_messages": self.merged
+        }
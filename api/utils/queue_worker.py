@@ -0,0 +1,155 @@
+from typing import Dict, Any, Optional, Callable, Awaitable, Set
+import asyncio
+from loguru import logger
+from .config import QUEUE_MAX_SIZE, QUEUE_WORKERS, QUEUE_POLL_INTERVAL
+
+# Assinatura do processador de jobs: recebe o job ({"id", "sender", "payload"})
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+# Tentativas de marcar como concluído um job já processado
+COMPLETE_ATTEMPTS = 3
+
+
+class PermanentJobError(Exception):
+    """Falha que não adianta tentar de novo: o job vai direto para dead-letter"""
+
+
+class QueueWorkerPool:
+    """
+    Consome uma MessageQueue com concorrência limitada.
+
+    Um laço reserva jobs (só quantos houver vagas livres) e cada job roda em
+    uma task própria, renovando a lease enquanto o handler não termina.
+    enqueue() acorda o laço na hora, então o intervalo de polling só importa
+    para jobs gravados por outros processos ou liberados por backoff.
+    """
+
+    def __init__(
+        self,
+        queue,
+        handler: JobHandler,
+        concurrency: int = QUEUE_WORKERS,
+        poll_interval: float = QUEUE_POLL_INTERVAL,
+        batch_size: int = QUEUE_MAX_SIZE
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop_task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.failed = 0
+
+    async def enqueue(self, sender: str, payload: Dict[str, Any], priority: int = 0) -> str:
+        """Grava o job na fila e acorda o laço de consumo"""
+        job_id = await self.queue.enqueue(sender, payload, priority=priority)
+        self._wakeup.set()
+        return job_id
+
+    async def _keep_lease(self, job: Dict[str, Any]) -> None:
+        """Renova a lease do job a cada terço do prazo enquanto ele roda"""
+        interval = self.queue.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.queue.extend_lease(job):
+                    logger.warning(f"Lease do job {job['id']} perdida; outro worker pode reprocessá-lo")
+                    return
+            except Exception as e:
+                logger.error(f"Erro ao renovar lease do job {job['id']}: {str(e)}")
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        heartbeat = asyncio.create_task(self._keep_lease(job))
+        try:
+            result = await self.handler(job)
+        except Exception as e:
+            heartbeat.cancel()
+            self.failed += 1
+            logger.error(f"Erro ao processar job {job['id']}: {str(e)}")
+            try:
+                await self.queue.fail(job, str(e), retryable=not isinstance(e, PermanentJobError))
+            except Exception as mark_error:
+                logger.error(f"Erro ao marcar job {job['id']} como falho: {str(mark_error)}")
+        else:
+            heartbeat.cancel()
+            self.processed += 1
+            # O handler já entregou as respostas: uma falha aqui não pode virar
+            # retry do job. Tenta de novo algumas vezes antes da lease expirar.
+            for attempt in range(1, COMPLETE_ATTEMPTS + 1):
+                try:
+                    await self.queue.complete(job, result if isinstance(result, dict) else None)
+                    break
+                except Exception as e:
+                    logger.error(f"Erro ao marcar job {job['id']} como concluído (tentativa {attempt}): {str(e)}")
+                    if attempt < COMPLETE_ATTEMPTS:
+                        await asyncio.sleep(attempt)
+        finally:
+            heartbeat.cancel()
+            self._in_flight.discard(job["id"])
+            # Uma vaga foi liberada: o laço pode buscar o próximo job
+            self._wakeup.set()
+
+    async def _poll_once(self) -> bool:
+        """Inicia jobs nas vagas livres; retorna True se a fila pode ter mais jobs"""
+        free = self.concurrency - len(self._in_flight)
+        if free <= 0:
+            return False
+        limit = min(free, self.batch_size)
+        # O claim já marca os jobs como em processamento, de forma atômica
+        jobs = await self.queue.claim(limit)
+        for job in jobs:
+            self._in_flight.add(job["id"])
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(jobs) == limit
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                more = await self._poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao buscar jobs da fila: {str(e)}")
+                more = False
+
+            # Fila possivelmente com mais jobs: busca de novo se ainda houver vaga
+            if more and len(self._in_flight) < self.concurrency:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"Workers da fila iniciados (concorrência {self.concurrency})")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Para de buscar jobs e espera os que estão em andamento"""
+        task = self._loop_task
+        self._loop_task = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._loop_task is not None and not self._loop_task.done(),
+            "concurrency": self.concurrency,
+            "in_flight": len(self._in_flight),
+            "processed": self.processed,
+            "failed": self.failed
+        }
@@ -1,96 +1,277 @@
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Callable
+import asyncio
 import os
-import math
+import random
+import time
+import uuid
 from datetime import datetime
 from openai import OpenAI
 from loguru import logger
-from .supabase import supabase
+from .executor import run_blocking
+from .vector_index import vector_index
+from .embedding_cache import embedding_cache
+from .config import (
+    RAG_EMBEDDING_MODEL, RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP, RAG_EMBED_BATCH_SIZE,
+    RAG_EMBED_BATCH_TOKENS, RAG_EMBED_CONCURRENCY, RAG_EMBED_MAX_ATTEMPTS, RAG_EMBED_RETRY_BACKOFF
+)
+
+# Recebe a contagem parcial da indexação a cada lote concluído
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+_openai_client: Optional[OpenAI] = None
 
 
 def _get_openai_client() -> OpenAI:
-    api_key = os.getenv("GPT_API_KEY") or os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("GPT_API_KEY/OPENAI_API_KEY não configurada para embeddings")
-    return OpenAI(api_key=api_key)
-
-
-def _cosine_similarity(vector_a: List[float], vector_b: List[float]) -> float:
-    if not vector_a or not vector_b:
-        return 0.0
-    if len(vector_a) != len(vector_b):
-        return 0.0
-    dot_product = sum(a * b for a, b in zip(vector_a, vector_b))
-    norm_a = math.sqrt(sum(a * a for a in vector_a))
-    norm_b = math.sqrt(sum(b * b for b in vector_b))
-    if norm_a == 0.0 or norm_b == 0.0:
-        return 0.0
-    return dot_product / (norm_a * norm_b)
-
-
-async def embed_texts(texts: List[str], model: str = "text-embedding-3-small") -> List[List[float]]:
+    global _openai_client
+    if _openai_client is None:
+        api_key = os.getenv("GPT_API_KEY") or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("GPT_API_KEY/OPENAI_API_KEY não configurada para embeddings")
+        _openai_client = OpenAI(api_key=api_key)
+    return _openai_client
+
+
+async def _create_embeddings(texts: List[str], model: str) -> List[List[float]]:
     client = _get_openai_client()
-    response = client.embeddings.create(model=model, input=texts)
+    response = await run_blocking(client.embeddings.create, model=model, input=texts, pool="llm")
     return [item.embedding for item in response.data]
 
 
-async def index_documents(documents: List[Dict[str, Any]], namespace: Optional[str] = None) -> Dict[str, Any]:
-    contents = [doc.get("content", "") for doc in documents]
-    embeddings = await embed_texts(contents)
+async def embed_texts(
+    texts: List[str],
+    model: str = RAG_EMBEDDING_MODEL,
+    counts: Optional[Dict[str, int]] = None,
+    persistent: bool = False
+) -> List[List[float]]:
+    """
+    Embeddings dos textos, consultando antes o cache por hash do conteúdo.
+    Só os textos inéditos (sem repetição) vão para a API. persistent usa
+    também a tabela do cache (documentos indexados; consultas ficam só na
+    memória). Se counts for informado, acumula nele cache_hits e cache_misses.
+    """
+    keys = [embedding_cache.key_for(text, model) for text in texts]
+    vectors = await embedding_cache.get_many(keys, persistent=persistent)
 
-    rows = []
-    for idx, doc in enumerate(documents):
-        row = {
-            "id": doc.get("id"),
-            "content": contents[idx],
-            "metadata": doc.get("metadata", {}),
-            "embedding": embeddings[idx],
-            "namespace": namespace or doc.get("namespace"),
-            "created_at": datetime.utcnow().isoformat()
-        }
-        rows.append(row)
+    pending = {key: text for key, text in zip(keys, texts) if key not in vectors}
+    if pending:
+        created = await _create_embeddings(list(pending.values()), model)
+        fresh = dict(zip(pending.keys(), created))
+        embedding_cache.put_many(fresh, model, persistent=persistent)
+        vectors.update(fresh)
 
-    try:
-        result = supabase.table("rag_documents").upsert(rows).execute()
-        return {"inserted": len(rows), "result": result.data}
-    except Exception as e:
-        logger.error(f"Erro ao indexar documentos no Supabase: {str(e)}")
-        raise
+    if counts is not None:
+        counts["cache_hits"] = counts.get("cache_hits", 0) + len(texts) - len(pending)
+        counts["cache_misses"] = counts.get("cache_misses", 0) + len(pending)
+    return [vectors[key] for key in keys]
+
+
+def _get_encoding():
+    # Import tardio: o tokenizador fica no llm_router, que depende deste pacote
+    from ..llm_router.cost_analyzer import get_encoding
+    return get_encoding()
+
+
+def _encode_batch(texts: List[str]) -> List[List[int]]:
+    from ..llm_router.cost_analyzer import encode_batch
+    return encode_batch(texts)
+
+
+def _trim_utf8(data: bytes) -> str:
+    """
+    Decodifica uma janela de tokens cortada no meio do texto. Um token pode
+    conter só parte de um caractere multibyte (acentos, emoji): os bytes de
+    continuação no início e uma sequência incompleta no fim são descartados
+    em vez de virarem U+FFFD.
+    """
+    start = 0
+    while start < len(data) and data[start] & 0xC0 == 0x80:
+        start += 1
+    end = len(data)
+    for back in range(1, min(4, end - start) + 1):
+        byte = data[end - back]
+        if byte & 0xC0 == 0x80:
+            continue
+        size = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4 if byte & 0xF8 == 0xF0 else 1
+        if size > back:
+            end -= back
+        break
+    return data[start:end].decode("utf-8", errors="replace")
+
+
+def chunk_documents(
+    documents: List[Dict[str, Any]],
+    namespace: Optional[str] = None,
+    max_tokens: int = RAG_CHUNK_TOKENS,
+    overlap: int = RAG_CHUNK_OVERLAP
+) -> List[Dict[str, Any]]:
+    """
+    Divide os documentos em trechos de até max_tokens tokens, com overlap
+    tokens repetidos entre trechos vizinhos. O primeiro trecho mantém o id do
+    documento e os demais recebem o sufixo ":<índice>".
+    """
+    encoding = _get_encoding()
+    contents = [doc.get("content") or "" for doc in documents]
+    encoded = _encode_batch(contents)
+    step = max(max_tokens - overlap, 1)
+    created_at = datetime.utcnow().isoformat()
+
+    chunks = []
+    for doc, content, tokens in zip(documents, contents, encoded):
+        if not tokens:
+            continue
+        if len(tokens) <= max_tokens:
+            windows = [(content, len(tokens))]
+        else:
+            windows = []
+            start = 0
+            while True:
+                window = tokens[start:start + max_tokens]
+                windows.append((_trim_utf8(encoding.decode_bytes(window)), len(window)))
+                if start + max_tokens >= len(tokens):
+                    break
+                start += step
+
+        doc_id = doc.get("id") or str(uuid.uuid4())
+        for index, (text, token_count) in enumerate(windows):
+            metadata = dict(doc.get("metadata") or {})
+            if len(windows) > 1:
+                metadata.update(parent_id=doc_id, chunk_index=index, chunk_count=len(windows))
+            chunks.append({
+                "id": doc_id if index == 0 else f"{doc_id}:{index}",
+                "content": text,
+                "metadata": metadata,
+                "namespace": namespace or doc.get("namespace"),
+                "created_at": created_at,
+                "token_count": token_count
+            })
+    return chunks
 
 
-async def fetch_candidate_documents(limit: int = 200, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+def _parent_id(chunk: Dict[str, Any]) -> str:
+    """Id do documento de origem (trechos de documentos divididos têm parent_id)"""
+    return chunk["metadata"]["parent_id"] if "chunk_count" in chunk["metadata"] else chunk["id"]
+
+
+def _batch_chunks(
+    chunks: List[Dict[str, Any]],
+    max_items: int = RAG_EMBED_BATCH_SIZE,
+    max_tokens: int = RAG_EMBED_BATCH_TOKENS
+) -> List[List[Dict[str, Any]]]:
+    """Agrupa os trechos respeitando o limite de itens e de tokens por chamada"""
+    batches: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    tokens = 0
+    for chunk in chunks:
+        if current and (len(current) >= max_items or tokens + chunk["token_count"] > max_tokens):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(chunk)
+        tokens += chunk["token_count"]
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _embed_with_retry(texts: List[str], counts: Optional[Dict[str, int]] = None) -> List[List[float]]:
+    """embed_texts (com o cache persistente) com novas tentativas e backoff exponencial"""
+    for attempt in range(1, RAG_EMBED_MAX_ATTEMPTS + 1):
+        try:
+            return await embed_texts(texts, counts=counts, persistent=True)
+        except Exception as e:
+            if attempt == RAG_EMBED_MAX_ATTEMPTS:
+                raise
+            delay = RAG_EMBED_RETRY_BACKOFF * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+            logger.warning(f"Erro nos embeddings (tentativa {attempt}), nova tentativa em {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+
+
+async def index_documents(
+    documents: List[Dict[str, Any]],
+    namespace: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None
+) -> Dict[str, Any]:
+    """
+    Indexa os documentos em trechos: tokeniza e divide, gera embeddings em
+    lotes (com concorrência limitada e retries) e grava cada lote assim que
+    ele fica pronto. Um lote com falha não interrompe os demais. No fim,
+    remove os trechos que sobraram de versões maiores dos documentos
+    reindexados (só dos documentos indexados sem falha).
+    """
+    started = time.perf_counter()
+    # Tokenizar e decodificar milhares de documentos é CPU: roda fora do event loop
+    chunks = await run_blocking(chunk_documents, documents, namespace=namespace)
+    batches = _batch_chunks(chunks)
+
+    # Trechos atuais por documento com id informado (só esses podem ter versão anterior)
+    explicit_ids = {doc["id"] for doc in documents if doc.get("id")}
+    chunk_counts: Dict[str, int] = {}
+    for chunk in chunks:
+        parent_id = _parent_id(chunk)
+        if parent_id in explicit_ids:
+            chunk_counts[parent_id] = chunk_counts.get(parent_id, 0) + 1
+    failed_parents = set()
+
+    counts = {
+        "documents": len(documents),
+        "chunks": len(chunks),
+        "tokens": sum(chunk["token_count"] for chunk in chunks),
+        "batches": len(batches),
+        "completed_batches": 0,
+        "indexed": 0,
+        "failed": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "removed_stale": 0
+    }
+    semaphore = asyncio.Semaphore(RAG_EMBED_CONCURRENCY)
+
+    async def run_batch(batch: List[Dict[str, Any]]) -> None:
+        try:
+            async with semaphore:
+                embeddings = await _embed_with_retry([chunk["content"] for chunk in batch], counts)
+                rows = [
+                    {**{k: v for k, v in chunk.items() if k != "token_count"}, "embedding": embedding}
+                    for chunk, embedding in zip(batch, embeddings)
+                ]
+                counts["indexed"] += await vector_index.upsert(rows)
+        except Exception as e:
+            counts["failed"] += len(batch)
+            failed_parents.update(_parent_id(chunk) for chunk in batch)
+            logger.error(f"Erro ao indexar lote de {len(batch)} trechos: {str(e)}")
+        finally:
+            counts["completed_batches"] += 1
+            if progress:
+                progress(dict(counts))
+
+    await asyncio.gather(*(run_batch(batch) for batch in batches))
     try:
-        query = supabase.table("rag_documents").select("id,content,metadata,embedding,namespace,created_at").order("created_at", desc=True).limit(limit)
-        if namespace:
-            query = query.eq("namespace", namespace)
-        result = query.execute()
-        return result.data or []
+        counts["removed_stale"] = await vector_index.delete_stale_chunks(
+            {parent_id: n for parent_id, n in chunk_counts.items() if parent_id not in failed_parents}
+        )
     except Exception as e:
-        logger.error(f"Erro ao buscar documentos candidatos: {str(e)}")
-        return []
+        logger.error(f"Erro ao remover trechos antigos: {str(e)}")
+    counts["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+    logger.info(
+        f"Indexação concluída: {counts['indexed']}/{counts['chunks']} trechos de "
+        f"{counts['documents']} documentos em {counts['elapsed_ms']}ms"
+    )
+    return counts
 
 
 async def search_similar(query: str, top_k: int = 5, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Busca no corpus inteiro pelo índice vetorial configurado (pgvector ou local)"""
     query_embedding = (await embed_texts([query]))[0]
-    candidates = await fetch_candidate_documents(namespace=namespace)
-
-    scored: List[Tuple[float, Dict[str, Any]]] = []
-    for doc in candidates:
-        embedding = doc.get("embedding") or []
-        score = _cosine_similarity(query_embedding, embedding)
-        scored.append((score, doc))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    top = scored[: max(0, top_k)]
-    return [
-        {
-            "id": doc.get("id"),
-            "content": doc.get("content", ""),
-            "metadata": doc.get("metadata", {}),
-            "score": float(score),
-            "namespace": doc.get("namespace")
-        }
-        for score, doc in top
-    ]
+    return await vector_index.search(query_embedding, top_k=top_k, namespace=namespace)
+
+
+async def search_similar_batch(
+    queries: List[str], top_k: int = 5, namespace: Optional[str] = None
+) -> List[List[Dict[str, Any]]]:
+    """Várias consultas com uma chamada de embeddings e uma pontuação em lote"""
+    if not queries:
+        return []
+    query_embeddings = await embed_texts(queries)
+    return await vector_index.search_many(query_embeddings, top_k=top_k, namespace=namespace)
 
 
 def format_chunks_as_context(chunks: List[Dict[str, Any]], max_chars: int = 2000) -> str:
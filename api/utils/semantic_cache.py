@@ -0,0 +1,282 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable, Set
+from collections import OrderedDict
+from datetime import datetime, timezone
+import asyncio
+import numpy as np
+from loguru import logger
+from .supabase import supabase
+from .executor import execute_query
+from .config import (
+    CACHE_MAX_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_LOOKUP_TIMEOUT, SEMANTIC_CACHE_SYNC_INTERVAL
+)
+
+# Assinatura de um embedder: recebe textos e devolve um vetor por texto
+Embedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+# Linhas por página ao carregar os embeddings gravados no response_cache
+SYNC_PAGE_SIZE = 200
+
+
+def _normalize(vector: Any) -> Optional[np.ndarray]:
+    """Normaliza o vetor para norma 1 (cosseno vira produto escalar)"""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    if norm == 0.0:
+        return None
+    return array / norm
+
+
+class SemanticIndex:
+    """
+    Índice vetorial aproximado usando LSH com hiperplanos aleatórios.
+
+    Cada tabela agrupa os vetores pelo lado dos hiperplanos em que caem, então
+    a busca só compara o cosseno exato com os vetores dos mesmos buckets em vez
+    de percorrer o cache inteiro. As projeções de todas as tabelas saem de um
+    único produto matriz-vetor.
+    """
+
+    def __init__(
+        self,
+        num_tables: int = 6,
+        num_bits: int = 10,
+        max_size: int = CACHE_MAX_SIZE,
+        seed: int = 42
+    ):
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.max_size = max_size
+        self._rng = np.random.default_rng(seed)
+        self._dimensions: Optional[int] = None
+        self._planes = np.zeros((0, 0), dtype=np.float32)
+        # Peso de cada bit na assinatura (o primeiro hiperplano é o bit mais alto)
+        self._bit_weights = 1 << np.arange(num_bits - 1, -1, -1, dtype=np.int64)
+        self._tables: List[Dict[int, Set[str]]] = [{} for _ in range(num_tables)]
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, List[int]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _ensure_planes(self, dimensions: int) -> bool:
+        """Cria os hiperplanos na primeira inserção; rejeita dimensões diferentes"""
+        if self._dimensions is None:
+            self._dimensions = dimensions
+            self._planes = self._rng.standard_normal(
+                (self.num_tables * self.num_bits, dimensions)
+            ).astype(np.float32)
+        return self._dimensions == dimensions
+
+    def _signatures(self, vector: np.ndarray) -> List[int]:
+        bits = (self._planes @ vector >= 0.0).reshape(self.num_tables, self.num_bits)
+        return (bits @ self._bit_weights).tolist()
+
+    def add(self, key: str, vector: Any) -> None:
+        """Adiciona (ou substitui) um vetor no índice"""
+        normalized = _normalize(vector)
+        if normalized is None or not self._ensure_planes(normalized.shape[0]):
+            return
+
+        self.remove(key)
+        signatures = self._signatures(normalized)
+        for table, signature in zip(self._tables, signatures):
+            table.setdefault(signature, set()).add(key)
+        self._entries[key] = (normalized, signatures)
+
+        # Remove os vetores menos usados recentemente
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self.remove(oldest)
+
+    def remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table, signature in zip(self._tables, entry[1]):
+            bucket = table.get(signature)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[signature]
+
+    def search(self, vector: Any) -> Optional[Tuple[str, float]]:
+        """Retorna a chave mais similar entre os candidatos e o seu cosseno"""
+        normalized = _normalize(vector)
+        if normalized is None or self._dimensions != normalized.shape[0]:
+            return None
+
+        candidates: Set[str] = set()
+        for table, signature in zip(self._tables, self._signatures(normalized)):
+            candidates.update(table.get(signature, ()))
+        if not candidates:
+            return None
+
+        keys = list(candidates)
+        scores = np.stack([self._entries[key][0] for key in keys]) @ normalized
+        best = int(np.argmax(scores))
+        self._entries.move_to_end(keys[best])
+        return keys[best], float(scores[best])
+
+
+class SemanticCache:
+    """
+    Cache semântico: encontra prompts já respondidos por similaridade de embeddings.
+
+    O embedding de cada prompt cacheado é gravado na coluna prompt_embedding
+    do response_cache (ver migrations/response_cache_semantic.sql). O índice é
+    recarregado de lá ao iniciar e sincronizado periodicamente, então enxerga
+    também o que outros processos cachearam. Na busca, o embedding do prompt
+    tem um prazo curto: se demorar, conta como miss e termina em background
+    (fica pronto para a gravação da resposta).
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_size: int = CACHE_MAX_SIZE,
+        lookup_timeout: float = SEMANTIC_CACHE_LOOKUP_TIMEOUT
+    ):
+        self._embedder = embedder
+        self.threshold = threshold
+        self.lookup_timeout = lookup_timeout
+        self.index = SemanticIndex(max_size=max_size)
+        # Embeddings recentes para não recalcular na gravação após um miss
+        self._recent: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._recent_max = 256
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._synced_at: Optional[str] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self.lookup_timeouts = 0
+
+    def set_embedder(self, embedder: Embedder) -> None:
+        """Troca o embedder (por exemplo, por um modelo local)"""
+        self._embedder = embedder
+        self.index = SemanticIndex(max_size=self.index.max_size)
+        self._recent.clear()
+
+    async def _compute(self, prompt_hash: str, prompt: str) -> List[float]:
+        embedder = self._embedder
+        if embedder is None:
+            # Usa o mesmo caminho de embeddings do RAG por padrão
+            from .rag import embed_texts
+            embedder = embed_texts
+
+        vector = list((await embedder([prompt]))[0])
+        self._recent[prompt_hash] = vector
+        while len(self._recent) > self._recent_max:
+            self._recent.popitem(last=False)
+        return vector
+
+    async def embed(self, prompt_hash: str, prompt: str) -> List[float]:
+        """Embedding do prompt; chamadas simultâneas do mesmo prompt compartilham o cálculo"""
+        vector = self._recent.get(prompt_hash)
+        if vector is not None:
+            return vector
+        task = self._pending.get(prompt_hash)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(prompt_hash, prompt))
+            self._pending[prompt_hash] = task
+
+            def finish(done: asyncio.Task) -> None:
+                self._pending.pop(prompt_hash, None)
+                if not done.cancelled():
+                    done.exception()
+
+            task.add_done_callback(finish)
+        # shield: um timeout de quem espera não interrompe o cálculo
+        return await asyncio.shield(task)
+
+    async def lookup(self, prompt_hash: str, prompt: str) -> Optional[Tuple[str, float]]:
+        """Retorna (prompt_hash, score) do prompt cacheado mais similar acima do threshold"""
+        if not len(self.index):
+            return None
+        try:
+            vector = await asyncio.wait_for(self.embed(prompt_hash, prompt), timeout=self.lookup_timeout)
+            match = self.index.search(vector)
+            if match and match[1] >= self.threshold:
+                logger.info(f"Cache semântico hit: {match[0]} (similaridade {match[1]:.3f})")
+                return match
+            return None
+        except asyncio.TimeoutError:
+            self.lookup_timeouts += 1
+            return None
+        except Exception as e:
+            logger.error(f"Erro na busca do cache semântico: {str(e)}")
+            return None
+
+    def add(self, prompt_hash: str, vector: List[float]) -> None:
+        """Indexa o embedding de um prompt cacheado"""
+        self.index.add(prompt_hash, vector)
+
+    def remove(self, prompt_hash: str) -> None:
+        self.index.remove(prompt_hash)
+
+    async def load_from_supabase(self) -> int:
+        """
+        Indexa os embeddings de prompts ainda válidos gravados no response_cache.
+        Na primeira chamada carrega os mais recentes; nas seguintes, só os
+        criados desde a última sincronização.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        rows: List[Dict[str, Any]] = []
+        while len(rows) < self.index.max_size:
+            query = (
+                supabase.table('response_cache')
+                .select('prompt_hash,prompt_embedding,created_at')
+                .filter('prompt_embedding', 'not.is', 'null')
+                .gt('expires_at', now)
+            )
+            if self._synced_at:
+                query = query.gt('created_at', self._synced_at)
+            result = await execute_query(
+                query.order('created_at', desc=True).range(len(rows), len(rows) + SYNC_PAGE_SIZE - 1)
+            )
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < SYNC_PAGE_SIZE:
+                break
+
+        # Do mais antigo para o mais novo: os recentes ficam no fim do LRU
+        for row in reversed(rows[:self.index.max_size]):
+            if row['prompt_hash'] not in self.index:
+                self.index.add(row['prompt_hash'], row['prompt_embedding'])
+        if rows:
+            self._synced_at = max(row['created_at'] for row in rows)
+        return len(rows)
+
+    async def _run_sync(self, interval: float) -> None:
+        while True:
+            try:
+                loaded = await self.load_from_supabase()
+                if loaded:
+                    logger.info(f"Cache semântico sincronizado: {loaded} prompts")
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar cache semântico: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def start_sync(self, interval: float = SEMANTIC_CACHE_SYNC_INTERVAL) -> None:
+        """Carrega o índice e o mantém sincronizado com o response_cache"""
+        if self._sync_task and not self._sync_task.done():
+            return
+        self._sync_task = asyncio.create_task(self._run_sync(interval))
+
+    async def stop_sync(self) -> None:
+        task = self._sync_task
+        self._sync_task = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self.index),
+            "threshold": self.threshold,
+            "lookup_timeouts": self.lookup_timeouts,
+            "synced_at": self._synced_at
+        }
@@ -0,0 +1,155 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict, deque
+import time
+from .config import SESSION_CACHE_MAX_SESSIONS, SESSION_CACHE_MAX_BYTES, SESSION_CACHE_IDLE_TIMEOUT
+
+# Custo fixo estimado de cada mensagem em memória, além do texto
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    return len(message.get("content") or "") + MESSAGE_OVERHEAD_BYTES
+
+
+class Session:
+    """Janela com as mensagens mais recentes de uma conversa"""
+
+    def __init__(self, messages: List[Dict[str, Any]], complete: bool, window: int):
+        self.messages: deque = deque(maxlen=window)
+        self.size = 0
+        # complete indica que a janela contém todo o histórico existente no banco
+        self.complete = complete
+        self.last_access = time.monotonic()
+        # Resumo das mensagens antigas ({"summary", "summarized_seq", "token_count"})
+        self.summary: Optional[Dict[str, Any]] = None
+        for message in messages:
+            self.append(message)
+
+    @property
+    def last_seq(self) -> int:
+        return self.messages[-1]["seq"] if self.messages else 0
+
+    def append(self, message: Dict[str, Any]) -> None:
+        if len(self.messages) == self.messages.maxlen:
+            # A mensagem mais antiga sai da janela
+            self.size -= _message_size(self.messages[0])
+            self.complete = False
+        self.messages.append(message)
+        self.size += _message_size(message)
+
+    def tail(self, limit: int) -> List[Dict[str, Any]]:
+        if limit >= len(self.messages):
+            return list(self.messages)
+        return list(self.messages)[-limit:]
+
+
+class SessionCache:
+    """
+    Cache por processo das conversas ativas, indexado por sender_phone.
+
+    Sessões sem acesso há mais de idle_timeout segundos são removidas, assim
+    como as menos usadas quando o número de sessões ou a memória estimada
+    passam dos limites.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_CACHE_MAX_SESSIONS,
+        max_bytes: int = SESSION_CACHE_MAX_BYTES,
+        idle_timeout: float = SESSION_CACHE_IDLE_TIMEOUT,
+        window: int = 100
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.window = window
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def peek(self, sender_phone: str) -> Optional[Session]:
+        """Retorna a sessão sem renovar o acesso nem contar nas estatísticas"""
+        return self._sessions.get(sender_phone)
+
+    def get(self, sender_phone: str) -> Optional[Session]:
+        """Retorna a sessão ativa do número, renovando o último acesso"""
+        self.evict_idle()
+        session = self._sessions.get(sender_phone)
+        if session is None:
+            self.misses += 1
+            return None
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(sender_phone)
+        self.hits += 1
+        return session
+
+    def load(self, sender_phone: str, messages: List[Dict[str, Any]], complete: bool) -> Session:
+        """Cria a sessão a partir das mensagens lidas do banco"""
+        self.discard(sender_phone)
+        session = Session(messages, complete, self.window)
+        self._sessions[sender_phone] = session
+        self._bytes += session.size
+        self._enforce_limits()
+        return session
+
+    def append(self, sender_phone: str, message: Dict[str, Any]) -> None:
+        """Acrescenta uma mensagem já gravada no banco à sessão, se ela estiver em cache"""
+        session = self._sessions.get(sender_phone)
+        if session is None:
+            return
+        self._bytes -= session.size
+        session.append(message)
+        self._bytes += session.size
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(sender_phone)
+        self._enforce_limits()
+
+    def discard(self, sender_phone: str) -> None:
+        session = self._sessions.pop(sender_phone, None)
+        if session is not None:
+            self._bytes -= session.size
+
+    def evict_idle(self, max_idle: Optional[float] = None) -> int:
+        """Remove as sessões ociosas; a ordem LRU deixa as mais antigas no início"""
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        deadline = time.monotonic() - max_idle
+        evicted = 0
+        while self._sessions:
+            sender_phone, session = next(iter(self._sessions.items()))
+            if session.last_access > deadline:
+                break
+            self.discard(sender_phone)
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def _enforce_limits(self) -> None:
+        # Sempre mantém ao menos a sessão mais recente
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            self.discard(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._sessions.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "idle_timeout": self.idle_timeout,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
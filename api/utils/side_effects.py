@@ -0,0 +1,90 @@
+from typing import Dict, Any, Awaitable, Optional, Set
+import asyncio
+import time
+from loguru import logger
+from .config import SIDE_EFFECT_TIMEOUTS
+
+
+class SideEffects:
+    """
+    Executa os efeitos colaterais de uma resposta já gerada.
+
+    Cada destino (envio, TTS, cache, analytics) roda com o próprio timeout e
+    sua falha fica isolada: é registrada e contada, mas não interrompe os
+    demais nem a resposta. run() espera um grupo de destinos em paralelo;
+    fire_and_forget() dispara um destino sem esperar, mantendo a referência
+    da task até ela terminar.
+    """
+
+    def __init__(self, timeouts: Dict[str, float] = SIDE_EFFECT_TIMEOUTS):
+        self.timeouts = dict(timeouts)
+        self._background: Set[asyncio.Task] = set()
+        self.succeeded: Dict[str, int] = {}
+        self.failed: Dict[str, int] = {}
+        self.timed_out: Dict[str, int] = {}
+
+    def timeout_for(self, name: str) -> float:
+        return self.timeouts.get(name, self.timeouts.get("default", 10.0))
+
+    @staticmethod
+    def _count(counter: Dict[str, int], name: str) -> None:
+        counter[name] = counter.get(name, 0) + 1
+
+    async def _guarded(self, name: str, awaitable: Awaitable[Any], timeout: Optional[float]) -> Any:
+        """Executa um destino; retorna o resultado ou None em caso de erro/timeout"""
+        timeout = self.timeout_for(name) if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(awaitable, timeout=timeout)
+            self._count(self.succeeded, name)
+            return result
+        except asyncio.TimeoutError:
+            self._count(self.timed_out, name)
+            logger.error(f"Efeito '{name}' excedeu o timeout de {timeout:.1f}s")
+        except Exception as e:
+            self._count(self.failed, name)
+            elapsed = time.perf_counter() - start
+            logger.error(f"Erro no efeito '{name}' após {elapsed:.2f}s: {str(e)}")
+        return None
+
+    async def run(
+        self,
+        sinks: Dict[str, Awaitable[Any]],
+        timeouts: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Any]:
+        """Executa os destinos em paralelo; o valor de cada um é None se ele falhou"""
+        timeouts = timeouts or {}
+        names = list(sinks)
+        results = await asyncio.gather(
+            *(self._guarded(name, sinks[name], timeouts.get(name)) for name in names)
+        )
+        return dict(zip(names, results))
+
+    async def call(self, name: str, awaitable: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Executa um único destino com timeout e falha isolada"""
+        return await self._guarded(name, awaitable, timeout)
+
+    def fire_and_forget(
+        self, name: str, awaitable: Awaitable[Any], timeout: Optional[float] = None
+    ) -> asyncio.Task:
+        """Dispara o destino em background; o resultado é descartado"""
+        task = asyncio.create_task(self._guarded(name, awaitable, timeout))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Espera os destinos disparados em background (usado no shutdown)"""
+        if self._background:
+            await asyncio.wait(set(self._background), timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_background": len(self._background),
+            "succeeded": dict(self.succeeded),
+            "failed": dict(self.failed),
+            "timed_out": dict(self.timed_out)
+        }
+
+
+side_effects = SideEffects()
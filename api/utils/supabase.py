@@ -5,6 +5,7 @@ import json
 from datetime import datetime
 from dotenv import load_dotenv
 from loguru import logger
+from .executor import execute_query
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -78,7 +79,7 @@ async def save_llm_data(
             "tokens_total": int(tokens.get("total", 0))
         }
         
-        result = supabase.table("llm_router").insert(data).execute()
+        result = await execute_query(supabase.table("llm_router").insert(data))
         return result
         
     except Exception as e:
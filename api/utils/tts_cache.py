@@ -0,0 +1,86 @@
+from typing import Dict, Any, Optional, Callable, Awaitable
+from collections import OrderedDict
+import asyncio
+import hashlib
+from .config import TTS_MODEL, TTS_VOICE, TTS_CACHE_MAX_ENTRIES
+
+
+class TTSCache:
+    """
+    Índice local dos áudios de TTS já gravados no Storage.
+
+    O áudio é endereçado pelo conteúdo: a chave é o hash de modelo, voz e
+    texto, e o objeto fica em tts/<chave>.mp3. O índice guarda só caminho e
+    URL pública (LRU limitado); os bytes ficam no bucket. Pedidos simultâneos
+    da mesma chave compartilham uma única geração.
+    """
+
+    def __init__(self, max_entries: int = TTS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @staticmethod
+    def key_for(text: str, voice: str = TTS_VOICE, model: str = TTS_MODEL) -> str:
+        return hashlib.sha256(f"{model}\0{voice}\0{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def storage_path(key: str) -> str:
+        return f"tts/{key}.mp3"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._index.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._index.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self._index[key] = entry
+        self._index.move_to_end(key)
+        while len(self._index) > self.max_entries:
+            self._index.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._index.pop(key, None)
+
+    async def single_flight(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executa factory uma vez por chave; chamadas concorrentes esperam o mesmo
+        resultado. A geração roda numa task do cache: cancelar quem esperava
+        não cancela a geração nem os outros que aguardam a mesma chave.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marca a exceção como lida caso ninguém mais esteja esperando
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_generations": self.shared,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+tts_cache = TTSCache()
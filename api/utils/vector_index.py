@@ -0,0 +1,258 @@
+from typing import List, Dict, Any, Optional, Sequence
+import asyncio
+import json
+import numpy as np
+from loguru import logger
+from .supabase import supabase
+from .executor import execute_query
+from .config import RAG_INDEX_BACKEND, RAG_EMBEDDING_DIM
+
+RAG_TABLE = "rag_documents"
+
+
+def _parse_embedding(value: Any) -> List[float]:
+    """O pgvector devolve o vetor como texto '[0.1,0.2,...]'; colunas JSON vêm como lista"""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value or []
+
+
+def normalize_rows(vectors: Any) -> np.ndarray:
+    """Matriz float32 contígua com cada linha de norma 1 (linhas nulas ficam zeradas)"""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Índices dos top_k maiores scores, em ordem decrescente, sem ordenar o vetor todo"""
+    if top_k >= scores.shape[0]:
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def _result(doc: Dict[str, Any], score: float) -> Dict[str, Any]:
+    return {
+        "id": doc.get("id"),
+        "content": doc.get("content", ""),
+        "metadata": doc.get("metadata") or {},
+        "score": float(score),
+        "namespace": doc.get("namespace")
+    }
+
+
+def _is_stale_chunk(doc: Dict[str, Any], chunk_counts: Dict[str, int]) -> bool:
+    """Trecho de um documento reindexado com índice além da nova contagem de trechos"""
+    metadata = doc.get("metadata") or {}
+    parent_id = metadata.get("parent_id")
+    return parent_id in chunk_counts and int(metadata.get("chunk_index", 0)) >= chunk_counts[parent_id]
+
+
+async def _delete_stale_chunks_sql(chunk_counts: Dict[str, int]) -> int:
+    """Chama delete_stale_chunks (ver migrations/rag_documents.sql); retorna as linhas removidas"""
+    result = await execute_query(
+        supabase.rpc("delete_stale_chunks", {
+            "p_parent_ids": list(chunk_counts),
+            "p_chunk_counts": list(chunk_counts.values())
+        })
+    )
+    return int(result.data or 0)
+
+
+class LocalVectorIndex:
+    """
+    Índice vetorial em memória, para testes e instalações pequenas.
+
+    Os embeddings ficam numa matriz float32 já normalizada (capacidade dobra
+    conforme cresce), então a similaridade de cosseno de todo o corpus é um
+    único produto matriz-vetor e o top-k sai de um argpartition. Com
+    persist=True os documentos também são gravados na tabela rag_documents,
+    de onde o índice é recarregado ao iniciar.
+    """
+
+    def __init__(self, dim: int = RAG_EMBEDDING_DIM, persist: bool = False):
+        self.dim = dim
+        self.persist = persist
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        self._docs: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        self._namespaces = np.zeros(0, dtype=object)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._size + extra
+        if needed <= self._matrix.shape[0]:
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0], 64)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        namespaces = np.empty(capacity, dtype=object)
+        namespaces[:self._size] = self._namespaces[:self._size]
+        self._matrix, self._namespaces = matrix, namespaces
+
+    async def upsert(self, rows: Sequence[Dict[str, Any]]) -> int:
+        """Adiciona ou substitui (pelo id) documentos com embedding"""
+        if not rows:
+            return 0
+        vectors = normalize_rows([_parse_embedding(row["embedding"]) for row in rows])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding com dimensão {vectors.shape[1]}, índice espera {self.dim}")
+        if self.persist:
+            await execute_query(supabase.table(RAG_TABLE).upsert(list(rows)))
+        self._reserve(len(rows))
+        for row, vector in zip(rows, vectors):
+            doc = {key: value for key, value in row.items() if key != "embedding"}
+            position = self._positions.get(doc.get("id")) if doc.get("id") is not None else None
+            if position is None:
+                position = self._size
+                self._size += 1
+                self._docs.append(doc)
+                if doc.get("id") is not None:
+                    self._positions[doc["id"]] = position
+            else:
+                self._docs[position] = doc
+            self._matrix[position] = vector
+            self._namespaces[position] = doc.get("namespace")
+        return len(rows)
+
+    def _remove(self, position: int) -> None:
+        """Remove a linha movendo a última para o seu lugar"""
+        removed = self._docs[position]
+        last = self._size - 1
+        if position != last:
+            moved = self._docs[last]
+            self._matrix[position] = self._matrix[last]
+            self._namespaces[position] = self._namespaces[last]
+            self._docs[position] = moved
+            if moved.get("id") is not None:
+                self._positions[moved["id"]] = position
+        self._docs.pop()
+        self._matrix[last] = 0.0
+        self._namespaces[last] = None
+        self._size -= 1
+        if removed.get("id") is not None:
+            self._positions.pop(removed["id"], None)
+
+    async def delete_stale_chunks(self, chunk_counts: Dict[str, int]) -> int:
+        """Remove trechos que sobraram de versões maiores dos documentos (parent_id -> trechos atuais)"""
+        if not chunk_counts:
+            return 0
+        if self.persist:
+            await _delete_stale_chunks_sql(chunk_counts)
+        stale = [position for position, doc in enumerate(self._docs) if _is_stale_chunk(doc, chunk_counts)]
+        # Do fim para o começo: a linha movida para cada posição já foi verificada
+        for position in reversed(stale):
+            self._remove(position)
+        return len(stale)
+
+    def score(self, query_embeddings: Any) -> np.ndarray:
+        """Similaridade de cosseno (consultas x documentos) com um único produto de matrizes"""
+        queries = normalize_rows(query_embeddings)
+        return queries @ self._matrix[:self._size].T
+
+    async def search(
+        self, query_embedding: Sequence[float], top_k: int = 5, namespace: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        return (await self.search_many([query_embedding], top_k=top_k, namespace=namespace))[0]
+
+    async def search_many(
+        self, query_embeddings: Sequence[Sequence[float]], top_k: int = 5, namespace: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Top-k de cada consulta; todas são pontuadas juntas"""
+        if self._size == 0 or top_k <= 0 or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
+        scores = self.score(query_embeddings)
+        if namespace is not None:
+            mask = self._namespaces[:self._size] == namespace
+            scores = np.where(mask[np.newaxis, :], scores, -np.inf)
+        results = []
+        for row in scores:
+            indices = _top_k(row, top_k)
+            results.append([
+                _result(self._docs[i], row[i])
+                for i in indices
+                if np.isfinite(row[i])
+            ])
+        return results
+
+    async def load_from_supabase(self, page_size: int = 1000) -> int:
+        """Carrega toda a tabela rag_documents no índice (warm start)"""
+        loaded = 0
+        while True:
+            result = await execute_query(
+                supabase.table(RAG_TABLE)
+                .select("id,content,metadata,embedding,namespace,created_at")
+                .order("id")
+                .range(loaded, loaded + page_size - 1)
+            )
+            rows = result.data or []
+            await self.upsert(rows)
+            loaded += len(rows)
+            if len(rows) < page_size:
+                break
+        logger.info(f"Índice vetorial local carregado com {loaded} documentos")
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "local",
+            "documents": self._size,
+            "capacity": self._matrix.shape[0],
+            "dim": self.dim,
+            "bytes": int(self._matrix.nbytes)
+        }
+
+
+class SupabaseVectorIndex:
+    """
+    Busca no pgvector pela função match_documents (ver migrations/rag_documents.sql).
+
+    O ranking roda no banco sobre o índice HNSW, então cobre o corpus inteiro
+    e só os top_k documentos trafegam, sem os embeddings.
+    """
+
+    async def upsert(self, rows: Sequence[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        await execute_query(supabase.table(RAG_TABLE).upsert(list(rows)))
+        return len(rows)
+
+    async def delete_stale_chunks(self, chunk_counts: Dict[str, int]) -> int:
+        if not chunk_counts:
+            return 0
+        return await _delete_stale_chunks_sql(chunk_counts)
+
+    async def search(
+        self, query_embedding: Sequence[float], top_k: int = 5, namespace: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        if top_k <= 0:
+            return []
+        result = await execute_query(
+            supabase.rpc("match_documents", {
+                "query_embedding": list(query_embedding),
+                "match_count": top_k,
+                "filter_namespace": namespace
+            })
+        )
+        return [_result(row, row.get("similarity", 0.0)) for row in result.data or []]
+
+    async def search_many(
+        self, query_embeddings: Sequence[Sequence[float]], top_k: int = 5, namespace: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Uma chamada de match_documents por consulta, em paralelo"""
+        return list(await asyncio.gather(
+            *(self.search(embedding, top_k=top_k, namespace=namespace) for embedding in query_embeddings)
+        ))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "supabase"}
+
+
+vector_index = LocalVectorIndex(persist=True) if RAG_INDEX_BACKEND == "local" else SupabaseVectorIndex()